@@ -0,0 +1,224 @@
+import threading
+from collections import deque
+from datetime import datetime
+
+# Same levels as RadiationStatus in types.ts
+SAFE = 'SAFE'
+WARNING = 'WARNING'
+DANGER = 'DANGER'
+RANK = {SAFE: 0, WARNING: 1, DANGER: 2}
+
+# Default thresholds; a `settings` record with userId/deviceId overrides any of them
+DEFAULT_THRESHOLDS = {
+    "warning": 0.2,          # μSv/h
+    "danger": 0.5,           # μSv/h
+    "hysteresis": 0.02,      # μSv/h below a threshold before the level drops back
+    "sustainSeconds": 10,    # a new level must hold this long before it alerts
+    "ratePerMinute": 0.1,    # μSv/h rise per minute that raises a rate-of-change alert
+    "rateWindowSeconds": 60,
+    "cooldownSeconds": 300,  # repeats within this window are folded into the open alert
+}
+MIN_RATE_SPAN = 5.0          # seconds of history needed before the rate rule applies
+
+TITLES = {
+    ("level", WARNING): "Elevated radiation",
+    ("level", DANGER): "Dangerous radiation",
+    ("rate", WARNING): "Radiation rising quickly",
+    ("rate", DANGER): "Radiation rising quickly",
+}
+
+
+def thresholds_from(settings):
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for key in DEFAULT_THRESHOLDS:
+        if settings.get(key) is not None:
+            thresholds[key] = float(settings[key])
+    return thresholds
+
+
+def iso(ts):
+    return datetime.fromtimestamp(ts).isoformat()
+
+
+class DeviceState:
+    """Rolling state for one (user, device) pair"""
+    __slots__ = ("level", "candidate", "candidate_since", "last_ts", "window", "open")
+
+    def __init__(self):
+        self.level = SAFE
+        self.candidate = None
+        self.candidate_since = 0.0
+        self.last_ts = float('-inf')
+        self.window = deque()   # (ts, value) over the rate window
+        self.open = {}          # rule -> alert record still accepting repeats
+
+
+class AlertEngine:
+    """Turns the reading stream into alerts with constant work per reading
+
+    Levels follow the warning/danger thresholds with hysteresis and must be
+    sustained before they alert; a fast rise alerts on its own. Repeats within
+    the cooldown are coalesced into the open alert. New and changed alerts are
+    buffered and written together by flush().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._subscribers = {}   # deviceId -> [(userId, thresholds)]
+        self._default = [(None, dict(DEFAULT_THRESHOLDS))]
+        self._states = {}        # (userId, deviceId) -> DeviceState
+        self._inserts = []
+        self._updates = {}       # id(record) -> record
+        self._flush_lock = threading.Lock()
+
+    # ========== THRESHOLDS ==========
+    def load_settings(self, records):
+        """Per-user thresholds from `settings` records that name a deviceId"""
+        subscribers = {}
+        for record in records:
+            device = record.get("deviceId")
+            if device is None:
+                continue
+            subscribers.setdefault(str(device), []).append((record.get("userId"), thresholds_from(record)))
+        with self.lock:
+            self._subscribers = subscribers
+
+    def set_thresholds(self, user_id, device_id, settings):
+        with self.lock:
+            subscribers = [s for s in self._subscribers.get(device_id, []) if s[0] != user_id]
+            subscribers.append((user_id, thresholds_from(settings)))
+            self._subscribers[device_id] = subscribers
+
+    # ========== EVALUATION ==========
+    def evaluate(self, readings):
+        """Feed validated readings (`timestamp` in epoch seconds); returns how many alerts were raised"""
+        raised = 0
+        with self.lock:
+            for reading in readings:
+                device = reading["deviceId"]
+                for user_id, thresholds in self._subscribers.get(device) or self._default:
+                    key = (user_id, device)
+                    state = self._states.get(key)
+                    if state is None:
+                        state = self._states[key] = DeviceState()
+                    raised += self._step(state, user_id, device, reading["value"], reading["timestamp"],
+                                         thresholds)
+        return raised
+
+    def _step(self, state, user_id, device, value, ts, t):
+        if ts <= state.last_ts:
+            return 0  # out of order or duplicate
+        state.last_ts = ts
+        raised = 0
+
+        # Level with hysteresis: dropping back needs the value clearly below the threshold
+        danger = t["danger"] - t["hysteresis"] if state.level == DANGER else t["danger"]
+        warning = t["warning"] - t["hysteresis"] if state.level != SAFE else t["warning"]
+        target = DANGER if value >= danger else WARNING if value >= warning else SAFE
+
+        if target == state.level:
+            state.candidate = None
+        else:
+            if target != state.candidate:
+                state.candidate = target
+                state.candidate_since = ts
+            if ts - state.candidate_since >= t["sustainSeconds"]:
+                rising = RANK[target] > RANK[state.level]
+                state.level = target
+                state.candidate = None
+                if rising:
+                    raised += self._raise(state, "level", target, user_id, device, value, ts, t,
+                                          t["danger"] if target == DANGER else t["warning"])
+                elif target == SAFE:
+                    self._resolve(state, "level", ts)
+
+        # Rate of change over the rolling window
+        window = state.window
+        window.append((ts, value))
+        while ts - window[0][0] > t["rateWindowSeconds"]:
+            window.popleft()
+        span = ts - window[0][0]
+        if span >= MIN_RATE_SPAN:
+            rate = (value - window[0][1]) / span * 60
+            if rate >= t["ratePerMinute"]:
+                kind = DANGER if value >= t["danger"] else WARNING
+                raised += self._raise(state, "rate", kind, user_id, device, value, ts, t, t["ratePerMinute"],
+                                      rate=round(rate, 4))
+        return raised
+
+    def _raise(self, state, rule, kind, user_id, device, value, ts, t, threshold, rate=None):
+        alert = state.open.get(rule)
+        if alert is not None and ts - alert["_lastSeen"] <= t["cooldownSeconds"] \
+                and RANK[alert["type"]] >= RANK[kind]:
+            # Repeat of an alert that is still open: coalesce instead of raising a new one
+            alert["_lastSeen"] = ts
+            alert["count"] += 1
+            alert["lastSeen"] = iso(ts)
+            alert["peak"] = max(alert["peak"], value)
+            alert["resolvedAt"] = None
+            self._updates[id(alert)] = alert
+            return 0
+
+        title = TITLES[(rule, kind)]
+        if rule == "rate":
+            message = f"Radiation on {device} is rising by {rate} μSv/h per minute (now {value} μSv/h)"
+        else:
+            message = f"Radiation on {device} reached {value} μSv/h (threshold {threshold} μSv/h)"
+        alert = {
+            "userId": user_id,
+            "deviceId": device,
+            "type": kind,
+            "rule": rule,
+            "title": title,
+            "message": message,
+            "value": value,
+            "peak": value,
+            "threshold": threshold,
+            "count": 1,
+            "time": iso(ts),
+            "lastSeen": iso(ts),
+            "resolvedAt": None,
+            "read": False,
+            "createdAt": datetime.now().isoformat(),
+            "_lastSeen": ts,
+        }
+        if rate is not None:
+            alert["rate"] = rate
+        state.open[rule] = alert
+        self._inserts.append(alert)
+        return 1
+
+    def _resolve(self, state, rule, ts):
+        alert = state.open.get(rule)
+        if alert is not None and alert["resolvedAt"] is None:
+            alert["resolvedAt"] = iso(ts)
+            self._updates[id(alert)] = alert
+
+    # ========== PERSISTENCE ==========
+    @property
+    def pending(self):
+        return len(self._inserts) + len(self._updates)
+
+    def flush(self, repo):
+        """Write buffered alerts with one insert_many and the coalesced changes with one update_many"""
+        with self._flush_lock:
+            with self.lock:
+                inserts, self._inserts = self._inserts, []
+                updates, self._updates = list(self._updates.values()), {}
+                new = [self._public(alert) for alert in inserts]
+                # An alert changed before its insert was written has no id yet; the insert carries the change
+                changed = [(alert, self._public(alert)) for alert in updates if "id" in alert]
+            if not new and not changed:
+                return 0
+            with repo.transaction():
+                saved = repo.insert_many('alerts', new)
+                if changed:
+                    repo.update_many('alerts', [(alert["id"], fields) for alert, fields in changed])
+            with self.lock:
+                for alert, record in zip(inserts, saved):
+                    alert["id"] = record["id"]
+            return len(new) + len(changed)
+
+    @staticmethod
+    def _public(alert):
+        return {k: v for k, v in alert.items() if not k.startswith('_') and k != 'id'}
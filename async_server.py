@@ -0,0 +1,271 @@
+import asyncio
+import os
+import time
+import urllib.request
+
+from broadcast import Broadcaster
+from fastjson import dumps, loads
+from minihttp import (MAX_HEADER_BYTES, HttpError, error_response, json_response, parse_head,
+                      response_bytes)
+from readings import to_radiation_data, validate_batch
+from sensors import proximity_alert_json, radiation_history, read_proximity, read_radiation, system_status_json
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HOST = os.environ.get('RADSAFE_ASYNC_HOST', '0.0.0.0')
+PORT = int(os.environ.get('RADSAFE_ASYNC_PORT', '8000'))
+SENSOR_PORT = int(os.environ.get('RADSAFE_SENSOR_PORT', '8003'))
+# Sensor readings are stored through database.py's /api/readings/batch, the same ingest path
+# (storage, rollups, alerts) as uploads; "" leaves this port broadcast-only
+INGEST_URL = os.environ.get('RADSAFE_INGEST_URL', 'http://localhost:3002/api/readings/batch')
+
+MAX_CONNECTIONS = 20000          # further connections get an immediate 503
+KEEPALIVE_TIMEOUT = 75.0         # idle seconds before a keep-alive connection is closed
+REQUEST_TIMEOUT = 10.0           # seconds allowed to receive a request body
+MAX_REQUESTS_PER_CONNECTION = 1000
+STREAM_INTERVAL = 1.0
+STREAM_QUEUE = 64
+STREAM_KEEPALIVE = 15.0
+INGEST_INTERVAL = 0.5            # seconds between batches forwarded to the ingest path
+INGEST_BATCH = 5000
+INGEST_BACKLOG = 100000          # readings held while the ingest path is down; older ones are dropped
+
+ROUTES = {
+    ('GET', '/api/radiation/current'): lambda request: read_radiation(),
+    ('GET', '/api/radiation/history'): lambda request: radiation_history(),
+    ('GET', '/api/proximity/status'): lambda request: read_proximity(),
+    ('POST', '/api/proximity/alert'): lambda request: proximity_alert_json(),
+    ('GET', '/api/system/status'): lambda request: system_status_json(PORT),
+    ('GET', '/api/health'): lambda request: {'status': 'healthy', 'timestamp': time.time()},
+}
+
+
+def http_ingest(url, timeout=10.0):
+    """Blocking ingest function posting a batch of readings to `url` as a JSON array"""
+    def ingest(readings):
+        request = urllib.request.Request(url, data=dumps(readings), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+    return ingest
+
+
+class AsyncServer:
+    """HTTP API, SSE streams and long-lived sensor connections on one event loop
+
+    Readings from sensor connections are broadcast at once and handed to
+    `ingest(readings)` in batches on a worker thread; without `ingest` they
+    are only broadcast.
+    """
+
+    def __init__(self, host=HOST, port=PORT, sensor_port=SENSOR_PORT, ingest=None):
+        self.host = host
+        self.port = port
+        self.sensor_port = sensor_port
+        self.radiation_stream = Broadcaster(max_queue=STREAM_QUEUE)
+        self.proximity_stream = Broadcaster(max_queue=STREAM_QUEUE)
+        self.streams = {
+            '/api/radiation/stream': self.radiation_stream,
+            '/api/proximity/stream': self.proximity_stream,
+        }
+        self.connections = 0
+        self.sensors = 0
+        self.ingest = ingest
+        self._unstored = []
+
+    # ========== HTTP ==========
+    async def handle_http(self, reader, writer):
+        if self.connections >= MAX_CONNECTIONS:
+            writer.write(error_response(HttpError(503, "Server is at its connection limit")))
+            await self._close(writer)
+            return
+        self.connections += 1
+        try:
+            for _ in range(MAX_REQUESTS_PER_CONNECTION):
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    writer.write(error_response(HttpError(431)))
+                    return
+
+                try:
+                    request = parse_head(head[:-4])
+                    length = request.content_length
+                    if length:
+                        request.body = await asyncio.wait_for(reader.readexactly(length), REQUEST_TIMEOUT)
+                except HttpError as e:
+                    writer.write(error_response(e))
+                    return
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+
+                stream = self.streams.get(request.path)
+                if stream is not None and request.method == 'GET':
+                    await self.stream_events(stream, writer)
+                    return
+
+                writer.write(self.dispatch(request))
+                # Backpressure: don't read the next (possibly pipelined) request until this one is sent
+                await writer.drain()
+                if not request.keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            await self._close(writer)
+
+    def dispatch(self, request):
+        keep_alive = request.keep_alive
+        if request.method == 'OPTIONS':
+            return response_bytes(204, content_type=None, keep_alive=keep_alive,
+                                  headers={'Access-Control-Max-Age': '86400'})
+        handler = ROUTES.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in ROUTES):
+                return error_response(HttpError(405), keep_alive)
+            return error_response(HttpError(404, "Not found"), keep_alive)
+        try:
+            return json_response(200, handler(request), keep_alive)
+        except HttpError as e:
+            return error_response(e, keep_alive)
+        except Exception as e:
+            return error_response(HttpError(500, str(e)), keep_alive)
+
+    async def stream_events(self, broadcaster, writer):
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        subscription = broadcaster.subscribe(wakeup=lambda: loop.call_soon_threadsafe(ready.set))
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                         b"Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\nretry: 3000\n\n")
+            while not subscription.dropped:
+                frames = subscription.drain()
+                if frames:
+                    writer.write(b"".join(frames))
+                    await writer.drain()
+                    continue
+                ready.clear()
+                try:
+                    await asyncio.wait_for(ready.wait(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    writer.write(b": keepalive\n\n")
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            subscription.close()
+
+    # ========== SENSORS ==========
+    async def handle_sensor(self, reader, writer):
+        """Long-lived sensor connection sending one JSON reading per line"""
+        self.sensors += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    return
+                if not line:
+                    return
+                if not line.strip():
+                    continue
+                try:
+                    item = loads(line)
+                except ValueError:
+                    item = None
+                accepted, errors = validate_batch([item])
+                for reading in accepted:
+                    self.radiation_stream.publish({'deviceId': reading['deviceId'], **to_radiation_data(reading)},
+                                                  event='reading')
+                if self.ingest is not None:
+                    self._unstored.extend(accepted)
+                if errors:
+                    writer.write(dumps({'error': errors[0]['error']}) + b"\n")
+                    await writer.drain()
+        finally:
+            self.sensors -= 1
+            await self._close(writer)
+
+    async def store_readings(self):
+        """Forward batches of sensor readings to `ingest` for as long as the server runs"""
+        while True:
+            await asyncio.sleep(INGEST_INTERVAL)
+            await self.flush_readings()
+
+    async def flush_readings(self):
+        """Hand every buffered reading to `ingest`; returns how many were stored"""
+        stored = 0
+        while self._unstored:
+            batch = self._unstored[:INGEST_BATCH]
+            try:
+                await asyncio.to_thread(self.ingest, batch)
+            except Exception as e:
+                print(f"⚠️  Storing sensor readings failed: {e}")
+                if len(self._unstored) > INGEST_BACKLOG:
+                    del self._unstored[:len(self._unstored) - INGEST_BACKLOG]
+                return stored
+            # Readings that arrived meanwhile were appended behind the batch
+            del self._unstored[:len(batch)]
+            stored += len(batch)
+        return stored
+
+    async def produce_readings(self):
+        """Single producer for the simulated sensor streams"""
+        while True:
+            if len(self.radiation_stream) or len(self.proximity_stream):
+                self.radiation_stream.publish(read_radiation(), event='radiation')
+                self.proximity_stream.publish(read_proximity(), event='proximity')
+            await asyncio.sleep(STREAM_INTERVAL)
+
+    # ========== LIFECYCLE ==========
+    @staticmethod
+    async def _close(writer):
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+    async def serve(self):
+        http = await asyncio.start_server(self.handle_http, self.host, self.port,
+                                          limit=MAX_HEADER_BYTES, backlog=4096, reuse_address=True)
+        sensors = await asyncio.start_server(self.handle_sensor, self.host, self.sensor_port,
+                                             limit=MAX_HEADER_BYTES, backlog=1024, reuse_address=True)
+        tasks = [asyncio.create_task(self.produce_readings())]
+        if self.ingest is not None:
+            tasks.append(asyncio.create_task(self.store_readings()))
+        try:
+            async with http, sensors:
+                await asyncio.gather(http.serve_forever(), sensors.serve_forever())
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def raise_fd_limit():
+    """Allow as many open sockets as the hard limit permits"""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+if __name__ == '__main__':
+    raise_fd_limit()
+    print("=" * 60)
+    print("⚡ RADSAFE ASYNC SERVER")
+    print(f"🌐 HTTP:    http://localhost:{PORT}")
+    print(f"📡 Sensors: tcp://localhost:{SENSOR_PORT} (one JSON reading per line)")
+    print(f"💾 Readings stored via: {INGEST_URL or 'nothing (broadcast only)'}")
+    print("=" * 60)
+    try:
+        asyncio.run(AsyncServer(ingest=http_ingest(INGEST_URL) if INGEST_URL else None).serve())
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped")
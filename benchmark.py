@@ -0,0 +1,403 @@
+import argparse
+import atexit
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from fastjson import dumps
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Load and micro-benchmarks for database.py; every size runs in a fresh process against a
+# seeded database in a temporary directory, and the results are written as one JSON document
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+SCENARIOS = ('register', 'login', 'user_lookup', 'profile_update', 'readings_ingest', 'history')
+SEED = 1234
+DEVICES = 10
+SEED_CHUNK = 10000
+INGEST_BATCH = 100          # readings per POST in the readings_ingest scenario
+WARMUP = 20
+STORAGE_REPEATS = 5
+
+
+# ========== STATISTICS ==========
+def summarize(latencies, elapsed, failures=0, items=None):
+    """Throughput and latency percentiles (ms) of one scenario"""
+    latencies = sorted(latencies)
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    result = {
+        "requests": len(latencies),
+        "failures": failures,
+        "seconds": round(elapsed, 4),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p90_ms": round(cuts[89] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+    if items is not None:
+        result["items_per_s"] = round(items / elapsed, 1) if elapsed else None
+    return result
+
+
+def timed(fn, repeats):
+    """Run fn() `repeats` times and summarize the durations"""
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeats):
+        t = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+# ========== TRANSPORTS ==========
+class ClientTransport:
+    """Requests through the Flask test client, without sockets"""
+    name = 'client'
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, data=body,
+                                    content_type='application/json' if body is not None else None)
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class SocketTransport:
+    """Requests over a keep-alive HTTP/1.1 connection to a threaded werkzeug server on localhost"""
+    name = 'socket'
+
+    def __init__(self, app):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class Handler(WSGIRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name="radsafe-bench-server", daemon=True)
+        self.thread.start()
+        self.conn = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+
+    def request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        response.read()
+        return response.status
+
+    def close(self):
+        self.conn.close()
+        self.server.shutdown()
+
+
+TRANSPORTS = {'client': ClientTransport, 'socket': SocketTransport}
+
+
+# ========== WORKER ==========
+def make_reading(rng, device, ts):
+    return {
+        "deviceId": device,
+        "value": round(rng.uniform(0.05, 0.18), 4),
+        "timestamp": ts,
+        "lat": 40.7 + rng.uniform(-0.2, 0.2),
+        "lng": -74.0 + rng.uniform(-0.2, 0.2),
+    }
+
+
+def seed(database, size, rng):
+    """`size` users, profiles and readings; returns the seeded user ids"""
+    repo = database.repo
+    user_ids = []
+    now = datetime.now().isoformat()
+    for first in range(0, size, SEED_CHUNK):
+        count = min(SEED_CHUNK, size - first)
+        with repo.transaction():
+            users = repo.insert_many('users', [{
+                "name": f"Bench User {i}",
+                "email": f"user{i}@bench.local",
+                "password": f"secret{i}",
+                "role": "user",
+                "createdAt": now,
+                "updatedAt": now
+            } for i in range(first, first + count)])
+            ids = [user['id'] for user in users]
+            repo.insert_many('profiles', [{
+                "userId": user_id,
+                "phone": f"+1555{user_id:07d}",
+                "createdAt": now,
+                "updatedAt": now
+            } for user_id in ids])
+        user_ids.extend(ids)
+
+    # Readings spread evenly over the last 7 days, in time order, ingested like the API does
+    end = datetime.now().timestamp() - 60
+    step = 7 * 86400 / max(1, size)
+    for first in range(0, size, database.READINGS_BATCH_SIZE):
+        count = min(database.READINGS_BATCH_SIZE, size - first)
+        database.ingest_readings([make_reading(rng, f"bench-{i % DEVICES}", end - (size - i) * step)
+                                  for i in range(first, first + count)])
+    return user_ids
+
+
+def bench_storage(database, workdir, repeats):
+    """Load, snapshot and id-assignment costs of the seeded database, on a copy of its files"""
+    from repository import create_repository
+
+    if hasattr(database.repo, 'store'):
+        database.repo.store.compact()
+    copy_dir = os.path.join(workdir, 'storage-copy')
+    os.makedirs(copy_dir, exist_ok=True)
+    sources = [path for path in database.repo.files() if os.path.exists(path)]
+    results = {}
+
+    def fresh():
+        for path in sources:
+            shutil.copy(path, os.path.join(copy_dir, os.path.basename(path)))
+        return create_repository(database.STORAGE_BACKEND,
+                                 json_path=os.path.join(copy_dir, os.path.basename(database.DB_FILE)),
+                                 sqlite_path=os.path.join(copy_dir, os.path.basename(database.SQLITE_FILE)),
+                                 flush_interval=3600, compact_bytes=1 << 40)
+
+    # load_database(): open the files and build the in-memory state / connection
+    latencies = []
+    for _ in range(repeats):
+        copy = fresh()
+        t = time.perf_counter()
+        copy.open()
+        latencies.append(time.perf_counter() - t)
+        copy.close()
+    results["load"] = summarize(latencies, sum(latencies))
+
+    copy = fresh().open()
+    try:
+        # save_database(): one user changed, then a new snapshot of the whole file (JSON backend only)
+        if hasattr(copy, 'store'):
+            first_user = copy.page('users', 1)[0]['id']
+
+            def save():
+                copy.update('users', first_user, {"updatedAt": datetime.now().isoformat()})
+                copy.store.compact()
+            results["save"] = timed(save, repeats)
+        # get_next_id(): reserving an id and writing one record
+        counter = iter(range(10 ** 9))
+        results["next_id_insert"] = timed(
+            lambda: copy.insert('users', {"name": "Bench", "email": f"next{next(counter)}@bench.local"}),
+            max(repeats, 1000))
+    finally:
+        copy.close()
+    return results
+
+
+def run_scenarios(database, transport, user_ids, requests, rng):
+    results = {}
+    counter = iter(range(10 ** 9))
+    history_end = datetime.now().timestamp()
+
+    def register():
+        k = next(counter)
+        return 'POST', '/api/auth/register', dumps({"email": f"new{k}@bench.local", "password": f"pw{k}",
+                                                   "full_name": f"New User {k}"})
+
+    def login():
+        user_id = rng.choice(user_ids)
+        i = user_id - user_ids[0]
+        return 'POST', '/api/auth/login', dumps({"email": f"user{i}@bench.local", "password": f"secret{i}"})
+
+    def user_lookup():
+        return 'GET', f'/api/users/{rng.choice(user_ids)}', None
+
+    def profile_update():
+        return 'PUT', f'/api/users/{rng.choice(user_ids)}', dumps({"phone": f"+1555{rng.randrange(10 ** 7):07d}",
+                                                                    "location": "Bench City"})
+
+    def readings_ingest():
+        ts = datetime.now().timestamp()
+        return 'POST', '/api/readings/batch', dumps([make_reading(rng, f"bench-{rng.randrange(DEVICES)}", ts)
+                                                     for _ in range(INGEST_BATCH)])
+
+    def history():
+        window = rng.choice(('1h', '24h', '7d'))
+        return 'GET', f'/api/radiation/history?device=bench-{rng.randrange(DEVICES)}&window={window}' \
+                      f'&to={history_end}', None
+
+    makers = {'register': register, 'login': login, 'user_lookup': user_lookup,
+              'profile_update': profile_update, 'readings_ingest': readings_ingest, 'history': history}
+    for name in SCENARIOS:
+        make = makers[name]
+        for _ in range(WARMUP):
+            transport.request(*make())
+        calls = [make() for _ in range(requests)]
+        latencies = []
+        failures = 0
+        started = time.perf_counter()
+        for call in calls:
+            t = time.perf_counter()
+            status = transport.request(*call)
+            latencies.append(time.perf_counter() - t)
+            if status >= 400:
+                failures += 1
+        elapsed = time.perf_counter() - started
+        results[name] = summarize(latencies, elapsed, failures,
+                                  items=requests * INGEST_BATCH if name == 'readings_ingest' else None)
+    return results
+
+
+def run_size(size, args):
+    """Benchmark one database size in this process; returns the results dict"""
+    rng = random.Random(SEED)
+    workdir = tempfile.mkdtemp(prefix=f'radsafe-bench-{size}-')
+    # Registered first so it runs last, after the stores' own atexit close()
+    atexit.register(shutil.rmtree, workdir, True)
+    os.environ.update({
+        'RADSAFE_STORAGE': args.backend,
+        'RADSAFE_DB_FILE': os.path.join(workdir, 'radsafe_database.json'),
+        'RADSAFE_SQLITE_FILE': os.path.join(workdir, 'radsafe.db'),
+        'RADSAFE_READINGS_DIR': os.path.join(workdir, 'readings'),
+        'RADSAFE_TOKEN_SECRET_FILE': os.path.join(workdir, 'token.key'),
+        # Measure request handling, not the rate limits in front of it
+        'RADSAFE_RATE_DEFAULT': '0',
+        'RADSAFE_RATE_LIMITS': '/api/auth/login=0,/api/auth/register=0',
+        'RADSAFE_MAX_IN_FLIGHT': '0',
+    })
+    import database
+    database.init_database()
+
+    started = time.perf_counter()
+    user_ids = seed(database, size, rng)
+    result = {"records": size, "seed_seconds": round(time.perf_counter() - started, 2)}
+    result["storage"] = bench_storage(database, workdir, args.storage_repeats)
+    transport = TRANSPORTS[args.transport](database.app)
+    try:
+        result["scenarios"] = run_scenarios(database, transport, user_ids, args.requests, rng)
+    finally:
+        transport.close()
+    return result
+
+
+# ========== DRIVER ==========
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=HERE, stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    report = {
+        "benchmark": "radsafe-backend",
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": args.backend,
+        "transport": args.transport,
+        "requests": args.requests,
+        "seed": SEED,
+        "sizes": {},
+    }
+    for size in args.sizes:
+        print(f"⏱️  {size} records ({args.backend}, {args.transport})...", file=sys.stderr)
+        with tempfile.NamedTemporaryFile('r', suffix='.json', delete=False) as f:
+            result_file = f.name
+        try:
+            # One process per size so every run starts from a cold, freshly seeded database
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', str(size),
+                            '--result-file', result_file, '--backend', args.backend,
+                            '--transport', args.transport, '--requests', str(args.requests),
+                            '--storage-repeats', str(args.storage_repeats)],
+                           check=True, stdout=sys.stderr)
+            with open(result_file) as f:
+                report["sizes"][str(size)] = json.load(f)
+        finally:
+            os.remove(result_file)
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """Scenarios whose p99 or throughput got worse than `baseline` by more than `tolerance`"""
+    regressions = []
+    for size, result in report["sizes"].items():
+        old_size = baseline.get("sizes", {}).get(size)
+        if not old_size:
+            continue
+        for name, new in result["scenarios"].items():
+            old = old_size.get("scenarios", {}).get(name)
+            if not old:
+                continue
+            if new["p99_ms"] > old["p99_ms"] * (1 + tolerance):
+                regressions.append(f"{size} {name}: p99 {old['p99_ms']} ms -> {new['p99_ms']} ms")
+            if new["throughput_per_s"] < old["throughput_per_s"] * (1 - tolerance):
+                regressions.append(f"{size} {name}: throughput {old['throughput_per_s']}/s -> "
+                                   f"{new['throughput_per_s']}/s")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="RadSafe backend load and micro-benchmarks (JSON output)")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        type=lambda text: [int(s) for s in text.split(',') if s],
+                        help="comma-separated database sizes in records (default: %(default)s)")
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--transport', choices=sorted(TRANSPORTS), default='client',
+                        help="Flask test client or real sockets")
+    parser.add_argument('--requests', type=int, default=500, help="requests per scenario")
+    parser.add_argument('--storage-repeats', type=int, default=STORAGE_REPEATS)
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--compare', help="baseline JSON report; exit 1 when a scenario regressed")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed p99/throughput change against --compare (default: %(default)s)")
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.worker is not None:
+        result = run_size(args.worker, args)
+        with open(args.result_file, 'w') as f:
+            json.dump(result, f)
+        sys.exit(0)
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+        print(f"✅ Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if (baseline.get("backend"), baseline.get("transport")) != (args.backend, args.transport):
+            print(f"⚠️  Baseline ran with {baseline.get('backend')}/{baseline.get('transport')}", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"❌ {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions", file=sys.stderr)
@@ -0,0 +1,91 @@
+import threading
+from collections import deque
+
+from fastjson import dumps
+
+
+def encode_event(data, event=None):
+    """Server-Sent Events frame for a JSON payload, encoded once and shared by every client"""
+    frame = f"event: {event}\ndata: " if event else "data: "
+    return frame.encode('utf-8') + dumps(data) + b"\n\n"
+
+
+class Subscription:
+    """One client's bounded queue of pre-encoded frames"""
+
+    def __init__(self, broadcaster, max_queue, wakeup=None):
+        self.broadcaster = broadcaster
+        self.max_queue = max_queue
+        self.wakeup = wakeup
+        self.dropped = False
+        self._frames = deque()
+        self._ready = threading.Condition(threading.Lock())
+
+    def offer(self, frame):
+        """Called by the producer; never blocks. Returns False once the client has fallen behind."""
+        with self._ready:
+            if self.dropped:
+                return False
+            if len(self._frames) >= self.max_queue:
+                self.dropped = True
+                self._frames.clear()
+            else:
+                self._frames.append(frame)
+            self._ready.notify()
+        if self.wakeup is not None:
+            self.wakeup()
+        return not self.dropped
+
+    def get(self, timeout=None):
+        """Next frame, or None after `timeout` seconds with nothing queued"""
+        with self._ready:
+            if not self._frames and not self.dropped:
+                self._ready.wait(timeout)
+            return self._frames.popleft() if self._frames else None
+
+    def drain(self):
+        with self._ready:
+            frames = list(self._frames)
+            self._frames.clear()
+            return frames
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+
+class Broadcaster:
+    """Fan-out from a single producer to many subscribers, dropping any that stop keeping up"""
+
+    def __init__(self, max_queue=64):
+        self.max_queue = max_queue
+        self.latest = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, wakeup=None):
+        subscription = Subscription(self, self.max_queue, wakeup)
+        with self._lock:
+            self._subscribers.add(subscription)
+            latest = self.latest
+        if latest is not None:
+            subscription.offer(latest)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, data, event=None):
+        frame = encode_event(data, event)
+        with self._lock:
+            self.latest = frame
+            subscribers = list(self._subscribers)
+        slow = [subscription for subscription in subscribers if not subscription.offer(frame)]
+        if slow:
+            with self._lock:
+                self._subscribers.difference_update(slow)
+        return len(subscribers) - len(slow)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._subscribers)
@@ -1,49 +1,30 @@
-import socket
-import json
-import threading
+from fastjson import dumps
+from minihttp import ThreadPoolServer
 
-def handle_client(client_socket):
-    try:
-        # Read request
-        request = client_socket.recv(1024).decode('utf-8', errors='ignore')
-        print("✅ REQUEST RECEIVED")
-        
-        # Always return success
-        response_data = json.dumps({
-            "success": True,
-            "message": "RADSAFE PROJECT WORKING!",
-            "status": "connected",
-            "project": "Ready for Submission"
-        })
-        
-        # Build HTTP response
-        response = "HTTP/1.1 200 OK\r\n"
-        response += "Content-Type: application/json\r\n"
-        response += "Access-Control-Allow-Origin: *\r\n"
-        response += f"Content-Length: {len(response_data)}\r\n"
-        response += "\r\n"
-        response += response_data
-        
-        # Send response
-        client_socket.send(response.encode())
-        print("📤 Response sent")
-    except Exception as e:
-        print(f"Error: {e}")
-    finally:
-        client_socket.close()
+PORT = 8001
 
-# Start server
-server = socket.socket()
-server.bind(('0.0.0.0', 8001))
-server.listen(5)
+# Same body for every request, encoded once
+RESPONSE = dumps({
+    "success": True,
+    "message": "RADSAFE PROJECT WORKING!",
+    "status": "connected",
+    "project": "Ready for Submission"
+})
+
+def handle_request(request):
+    # Always return success; requests are access-logged by the server
+    return 200, RESPONSE
+
+# Start server: a fixed pool of worker threads with keep-alive, instead of a thread per connection
+server = ThreadPoolServer(handle_request, host='0.0.0.0', port=PORT, workers=16, backlog=1024, name='bulletproof')
 
 print("="*50)
-print("🚀 BACKEND RUNNING ON PORT 8001")
-print("🔗 http://localhost:8001")
+print(f"🚀 BACKEND RUNNING ON PORT {PORT}")
+print(f"🔗 http://localhost:{PORT}")
 print("✅ Accepting ALL requests")
 print("="*50)
 
-while True:
-    client, addr = server.accept()
-    print(f"📥 Connection from {addr[0]}")
-    threading.Thread(target=handle_client, args=(client,)).start()
\ No newline at end of file
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    print("\n👋 Server stopped")
@@ -1,143 +1,142 @@
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, Response, jsonify, request
 from flask_cors import CORS
-import random
+import threading
 import time
 from datetime import datetime
+from broadcast import Broadcaster
+from fastjson import Template, install
+from logs import get_logger, log_requests
+from metrics import instrument
+from ratelimit import limit_requests
+from sensors import proximity_alert_json, radiation_history, read_proximity, read_radiation, system_status_json
 
-app = Flask(__name__)
-CORS(app)  # Allow all origins
+log = get_logger('backend')
 
-print("=" * 60)
-print("📱 PHONE SAFETY RADIATION MONITORING SYSTEM")
-print("🚀 Backend Server Starting...")
-print("📍 URL: http://localhost:8000")
-print("📊 API Ready for Frontend & Mobile App")
-print("=" * 60)
+# Routes live on blueprints so gateway.py can mount them next to the database and search APIs
+radiation_api = Blueprint('radiation', __name__)
+proximity_api = Blueprint('proximity', __name__)
+system_api = Blueprint('system', __name__)
+server_api = Blueprint('backend_server', __name__)  # simulated history, test and health pages of this server
+BLUEPRINTS = (radiation_api, proximity_api, system_api)
+
+# Live streams: one producer samples the sensors every STREAM_INTERVAL seconds and
+# fans out to every subscribed client; a client more than STREAM_QUEUE events behind is dropped
+STREAM_INTERVAL = 1.0
+STREAM_QUEUE = 64
+STREAM_KEEPALIVE = 15.0
+radiation_stream = Broadcaster(max_queue=STREAM_QUEUE)
+proximity_stream = Broadcaster(max_queue=STREAM_QUEUE)
+_producer_lock = threading.Lock()
+_producer = None
+
+def produce_readings():
+    """Single producer feeding both live streams"""
+    while True:
+        if len(radiation_stream) or len(proximity_stream):
+            radiation_stream.publish(read_radiation(), event='radiation')
+            proximity_stream.publish(read_proximity(), event='proximity')
+        time.sleep(STREAM_INTERVAL)
+
+def ensure_producer():
+    global _producer
+    with _producer_lock:
+        if _producer is None:
+            _producer = threading.Thread(target=produce_readings, name="sensor-producer", daemon=True)
+            _producer.start()
+
+def event_stream(broadcaster):
+    """SSE response that relays a broadcaster's frames to one client"""
+    ensure_producer()
+    subscription = broadcaster.subscribe()
+
+    def generate():
+        try:
+            yield b"retry: 3000\n\n"
+            while not subscription.dropped:
+                frame = subscription.get(timeout=STREAM_KEEPALIVE)
+                yield frame if frame is not None else b": keepalive\n\n"
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 # ========== RADIATION MONITORING ==========
-@app.route('/api/radiation/current', methods=['GET'])
+@radiation_api.route('/api/radiation/current', methods=['GET'])
 def get_current_radiation():
     """Get current radiation level"""
-    level = round(random.uniform(0.10, 0.20), 2)
-    status = 'safe' if level < 0.25 else 'warning'
-    
-    response = {
-        'radiation_level': level,
-        'unit': 'μSv/h',
-        'status': status,
-        'color': '#10b981' if status == 'safe' else '#ef4444',
-        'icon': '🟢' if status == 'safe' else '🟡',
-        'message': 'Normal background radiation' if status == 'safe' else 'Elevated level detected',
-        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'unix_time': time.time()
-    }
-    
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] 📊 Radiation: {level} μSv/h ({status})")
+    response = read_radiation()
+    log.info("radiation reading", extra={"radiation_level": response['radiation_level'], "status": response['status']})
     return jsonify(response)
 
-@app.route('/api/radiation/history', methods=['GET'])
+@radiation_api.route('/api/radiation/stream', methods=['GET'])
+def stream_radiation():
+    """Live radiation readings as Server-Sent Events"""
+    return event_stream(radiation_stream)
+
+@server_api.route('/api/radiation/history', methods=['GET'])
 def get_radiation_history():
     """Get last 10 radiation readings"""
-    history = []
-    for i in range(10):
-        level = round(random.uniform(0.10, 0.20), 2)
-        history.append({
-            'value': level,
-            'time': datetime.now().strftime('%H:%M'),
-            'timestamp': time.time() - i * 300  # 5 min intervals
-        })
-    
-    return jsonify({
-        'history': history,
-        'count': len(history),
-        'average': round(sum([h['value'] for h in history]) / len(history), 2)
-    })
+    return jsonify(radiation_history())
 
 # ========== PROXIMITY SAFETY ==========
-@app.route('/api/proximity/status', methods=['GET'])
+@proximity_api.route('/api/proximity/status', methods=['GET'])
 def get_proximity_status():
     """Get proximity sensor status"""
-    distance = random.randint(15, 100)
-    is_near = distance < 30
-    
-    return jsonify({
-        'distance_cm': distance,
-        'proximity': 'near' if is_near else 'far',
-        'is_near': is_near,
-        'alert_active': is_near,
-        'recommendation': 'Move phone away' if is_near else 'Safe distance maintained',
-        'icon': '⚠️' if is_near else '✅'
-    })
+    return jsonify(read_proximity())
 
-@app.route('/api/proximity/alert', methods=['POST'])
+@proximity_api.route('/api/proximity/stream', methods=['GET'])
+def stream_proximity():
+    """Live proximity status as Server-Sent Events"""
+    return event_stream(proximity_stream)
+
+@proximity_api.route('/api/proximity/alert', methods=['POST'])
 def trigger_proximity_alert():
     """Manually trigger proximity alert"""
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] 🔔 Proximity Alert Triggered")
-    
-    return jsonify({
-        'success': True,
-        'message': 'Proximity safety alert activated',
-        'alert_type': 'manual_test',
-        'actions': [
-            'Vibration activated',
-            'Visual warning displayed',
-            'Safety instructions shown'
-        ],
-        'safety_tips': [
-            'Move phone at least 30cm away',
-            'Use speakerphone or headphones',
-            'Avoid carrying in pocket',
-            'Store in bag when not in use'
-        ],
-        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    })
+    log.info("proximity alert triggered")
+    return Response(proximity_alert_json(), mimetype='application/json')
 
 # ========== SYSTEM STATUS ==========
-@app.route('/api/system/status', methods=['GET'])
+@system_api.route('/api/system/status', methods=['GET'])
 def get_system_status():
     """Get overall system health"""
-    return jsonify({
-        'system': 'Phone Safety Monitor',
-        'version': '1.0.0',
-        'status': 'operational',
-        'components': {
-            'backend_api': {'status': 'running', 'port': 8000},
-            'database': {'status': 'connected', 'type': 'simulated'},
-            'radiation_sensor': {'status': 'active', 'last_reading': 'just now'},
-            'proximity_sensor': {'status': 'active', 'mode': 'simulation'},
-            'gps_module': {'status': 'active', 'accuracy': 'high'}
-        },
-        'uptime': '24h',
-        'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    })
+    return Response(system_status_json(), mimetype='application/json')
 
 # ========== TEST & HEALTH ==========
-@app.route('/api/test', methods=['GET'])
+TEST_RESPONSE = Template({
+    'status': 'success',
+    'service': 'Phone Safety Backend API',
+    'message': '✅ API is fully operational',
+    'available_endpoints': [
+        'GET  /api/radiation/current',
+        'GET  /api/radiation/history',
+        'GET  /api/radiation/stream',
+        'GET  /api/proximity/status',
+        'GET  /api/proximity/stream',
+        'POST /api/proximity/alert',
+        'GET  /api/system/status',
+        'GET  /api/health',
+        'GET  /metrics',
+        'GET  /api/test'
+    ],
+    'documentation': 'All endpoints return JSON data',
+    'timestamp': None
+}, 'timestamp')
+
+@server_api.route('/api/test', methods=['GET'])
 def test_api():
     """Test endpoint"""
-    return jsonify({
-        'status': 'success',
-        'service': 'Phone Safety Backend API',
-        'message': '✅ API is fully operational',
-        'available_endpoints': [
-            'GET  /api/radiation/current',
-            'GET  /api/radiation/history',
-            'GET  /api/proximity/status',
-            'POST /api/proximity/alert',
-            'GET  /api/system/status',
-            'GET  /api/health',
-            'GET  /api/test'
-        ],
-        'documentation': 'All endpoints return JSON data',
-        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    })
+    return Response(TEST_RESPONSE.render(timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+                    mimetype='application/json')
 
-@app.route('/api/health', methods=['GET'])
+@server_api.route('/api/health', methods=['GET'])
 def health_check():
     """Health check"""
     return jsonify({'status': 'healthy', 'timestamp': time.time()})
 
-@app.route('/')
+@server_api.route('/')
 def home():
     """Home page - redirect to API test"""
     return '''
@@ -177,14 +176,31 @@ def home():
     </html>
     '''
 
+# ========== APP ==========
+def create_app():
+    """The standalone sensor server on port 8000"""
+    app = limit_requests(log_requests(instrument(install(Flask(__name__)), 'backend'), 'backend'), 'backend')
+    CORS(app)  # Allow all origins
+    for blueprint in BLUEPRINTS + (server_api,):
+        app.register_blueprint(blueprint)
+    return app
+
+app = create_app()
+
 # ========== START SERVER ==========
 if __name__ == '__main__':
+    print("=" * 60)
+    print("📱 PHONE SAFETY RADIATION MONITORING SYSTEM")
+    print("🚀 Backend Server Starting...")
+    print("📍 URL: http://localhost:8000")
+    print("📊 API Ready for Frontend & Mobile App")
+    print("=" * 60)
     print("\n⚡ Starting Flask server...")
     print("🌐 Access: http://localhost:8000")
     print("📱 Mobile: http://[YOUR-IP]:8000")
     print("🔧 Press Ctrl+C to stop\n")
     
     try:
-        app.run(host='0.0.0.0', port=8000, debug=False)
+        app.run(host='0.0.0.0', port=8000, debug=False, threaded=True)
     except KeyboardInterrupt:
         print("\n👋 Server stopped. Goodbye!")
\ No newline at end of file
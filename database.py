@@ -1,68 +1,163 @@
-import json
 import os
 import sys
+import threading
+import time
 from datetime import datetime
-from flask import Flask, jsonify, request
+from urllib.parse import urlencode
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+from flask import Blueprint, Flask, Response, jsonify, request
 from flask_cors import CORS
+from alerts import DEFAULT_THRESHOLDS, AlertEngine
+from fastjson import Template, install
+from httpcache import ResponseCache
+from logs import log_requests
+from metrics import (INGEST_BATCH_SECONDS, READINGS_INGESTED, READINGS_REJECTED, REGISTRY, file_size,
+                     instrument, uptime)
+from repository import COLLECTIONS, create_repository
+from passwords import PasswordHasher, PasswordHasherBusy, is_hashed
+from ratelimit import client_key, limit_requests
+from rollups import ALL_DEVICES, RollupEngine, parse_duration
+from spatial import GridIndex
+from tiles import FORMATS, TileCache, valid_tile
+from readings import iter_ndjson_batches, parse_timestamp, to_radiation_data, validate_batch
+from timeseries import ReadingsStore
+from tokens import TokenSigner, load_secret
 
 print("🚀 Starting RadSafe Database Server...")
 print(f"🐍 Python version: {sys.version}")
 
-app = Flask(__name__)
-CORS(app, origins=["http://localhost:3001"], methods=["GET", "POST", "PUT", "OPTIONS"], supports_credentials=True)
+# Routes live on blueprints so gateway.py can mount them next to the sensor and search APIs
+auth_api = Blueprint('auth', __name__)
+users_api = Blueprint('users', __name__)
+readings_api = Blueprint('readings', __name__)
+alerts_api = Blueprint('alerts', __name__)
+status_api = Blueprint('status', __name__)      # health and debug
+server_api = Blueprint('database_server', __name__)   # home and test pages of this server
+BLUEPRINTS = (auth_api, users_api, readings_api, alerts_api, status_api)
 
 # Database file
-DB_FILE = os.path.join(os.path.dirname(__file__), 'radsafe_database.json')
+DB_FILE = os.environ.get('RADSAFE_DB_FILE', os.path.join(os.path.dirname(__file__), 'radsafe_database.json'))
 PORT = 3002  # ADD THIS LINE
 print(f"💾 Database file: {DB_FILE}")
 
+# Writes are appended to an operation log (fsynced every FLUSH_INTERVAL seconds, or
+# every WAL_FSYNC_BATCH writes when set) and folded into DB_FILE past COMPACT_BYTES
+FLUSH_INTERVAL = float(os.environ.get('RADSAFE_FLUSH_INTERVAL', '1.0'))
+WAL_FSYNC_BATCH = int(os.environ.get('RADSAFE_WAL_FSYNC_BATCH', '0'))
+COMPACT_BYTES = int(os.environ.get('RADSAFE_COMPACT_BYTES', str(4 * 1024 * 1024)))
+
+# Storage backend: 'json' (DB_FILE) or 'sqlite' (SQLITE_FILE, shareable between worker processes)
+STORAGE_BACKEND = os.environ.get('RADSAFE_STORAGE', 'json')
+SQLITE_FILE = os.environ.get('RADSAFE_SQLITE_FILE', os.path.join(os.path.dirname(__file__), 'radsafe.db'))
+# Readings ingest: NDJSON bodies are committed READINGS_BATCH_SIZE lines at a time,
+# JSON array bodies may hold at most MAX_READINGS_PER_REQUEST items
+READINGS_BATCH_SIZE = int(os.environ.get('RADSAFE_READINGS_BATCH_SIZE', '5000'))
+MAX_READINGS_PER_REQUEST = int(os.environ.get('RADSAFE_MAX_READINGS_PER_REQUEST', '50000'))
+
+# Columnar readings store (one directory of memory-mapped chunk files per device)
+READINGS_DIR = os.environ.get('RADSAFE_READINGS_DIR', os.path.join(os.path.dirname(__file__), 'radsafe_readings'))
+READINGS_CHUNK_SECONDS = int(os.environ.get('RADSAFE_READINGS_CHUNK_SECONDS', '86400'))
+READINGS_OPEN_CHUNKS = int(os.environ.get('RADSAFE_READINGS_OPEN_CHUNKS', '64'))  # 4 mapped files each
+MAX_READINGS_PER_QUERY = 100000
+
+# List endpoints return one page of PAGE_SIZE records (at most MAX_PAGE_SIZE) plus a cursor
+PAGE_SIZE = int(os.environ.get('RADSAFE_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = 1000
+LIST_FILTERS = {
+    "users": {"role": str},
+    "profiles": {"userId": int},
+    "alerts": {"userId": int, "deviceId": str, "type": str},
+}
+
+# Bulk endpoints apply at most MAX_BULK_ITEMS creates/updates per request in one transaction
+MAX_BULK_ITEMS = int(os.environ.get('RADSAFE_MAX_BULK_ITEMS', '100000'))
+
+# Passwords are hashed with scrypt in HASH_WORKERS processes; with HASH_QUEUE hashes already
+# queued or running, login and register answer 503 + Retry-After instead of waiting
+HASH_WORKERS = int(os.environ.get('RADSAFE_HASH_WORKERS', str(min(2, os.cpu_count() or 1))))
+HASH_QUEUE = int(os.environ.get('RADSAFE_HASH_QUEUE', '32'))
+SCRYPT_N = int(os.environ.get('RADSAFE_SCRYPT_N', str(2 ** 14)))
+password_hasher = PasswordHasher(workers=HASH_WORKERS, max_pending=HASH_QUEUE, n=SCRYPT_N)
+
+# Access tokens are HMAC-signed and expire after TOKEN_TTL seconds; the key is RADSAFE_TOKEN_SECRET
+# or the contents of TOKEN_SECRET_FILE (generated on first start)
+TOKEN_TTL = int(os.environ.get('RADSAFE_TOKEN_TTL', '3600'))
+TOKEN_SECRET_FILE = os.environ.get('RADSAFE_TOKEN_SECRET_FILE',
+                                   os.path.join(os.path.dirname(__file__), 'radsafe_token.key'))
+TOKEN_CACHE_ENTRIES = int(os.environ.get('RADSAFE_TOKEN_CACHE_ENTRIES', '10000'))
+token_signer = TokenSigner(os.environ.get('RADSAFE_TOKEN_SECRET') or load_secret(TOKEN_SECRET_FILE),
+                           ttl=TOKEN_TTL, cache_entries=TOKEN_CACHE_ENTRIES)
+
+repo = create_repository(STORAGE_BACKEND, json_path=DB_FILE, sqlite_path=SQLITE_FILE,
+                         flush_interval=FLUSH_INTERVAL, compact_bytes=COMPACT_BYTES, fsync_batch=WAL_FSYNC_BATCH)
+# GET responses for users/profiles/alerts are cached until their collection is written
+RESPONSE_CACHE_ENTRIES = int(os.environ.get('RADSAFE_RESPONSE_CACHE_ENTRIES', '1024'))
+response_cache = ResponseCache(repo, max_entries=RESPONSE_CACHE_ENTRIES)
+REGISTRY.callback_gauge('radsafe_database_size_bytes', 'Size of the database files on disk',
+                        lambda: file_size(*repo.files()))
+readings_store = ReadingsStore(READINGS_DIR, chunk_seconds=READINGS_CHUNK_SECONDS,
+                               max_open_chunks=READINGS_OPEN_CHUNKS)
+rollups = RollupEngine()
+
+# Spatial grid over located readings of the last SPATIAL_RETENTION seconds
+SPATIAL_CELL_DEGREES = float(os.environ.get('RADSAFE_SPATIAL_CELL_DEGREES', '0.01'))
+SPATIAL_RETENTION = int(os.environ.get('RADSAFE_SPATIAL_RETENTION', str(7 * 86400)))
+spatial_index = GridIndex(cell_size=SPATIAL_CELL_DEGREES, retention=SPATIAL_RETENTION)
+_last_spatial_prune = datetime.now().timestamp()
+
+# Heatmap tiles rendered from the spatial index, cached until readings land in them
+TILE_CACHE_ENTRIES = int(os.environ.get('RADSAFE_TILE_CACHE_ENTRIES', '2048'))
+tile_cache = TileCache(spatial_index, max_entries=TILE_CACHE_ENTRIES)
+
+# Threshold alerts evaluated as readings arrive and written to the alerts collection
+alert_engine = AlertEngine()
+_settings_version = None
+
+# Under launcher.py every worker process keeps its own rollups and spatial index; readings
+# stored by the other workers are folded in every SYNC_INTERVAL seconds
+SYNC_INTERVAL = float(os.environ.get('RADSAFE_SYNC_INTERVAL', '1.0'))
+# ...and the one worker holding ALERTS_LOCK evaluates every worker's readings there, in time
+# order, so each alert is raised once and sees the device's whole stream
+ALERTS_LOCK = os.path.join(READINGS_DIR, '.alerts.lock')
+_alerts_lock_file = None
+_worker_readings = None    # this worker's readings awaiting sync_readings(); None when not under launcher.py
+_worker_readings_lock = threading.Lock()
+
 # Initialize database if not exists
 def init_database():
-    if not os.path.exists(DB_FILE):
-        default_data = {
-            "users": [
-                {
-                    "id": 1,
-                    "name": "Alex Johnson",
-                    "email": "alex@example.com",
-                    "profilePhoto": "https://api.dicebear.com/7.x/avataaars/svg?seed=Alex",
-                    "role": "user",
-                    "phone": "+1234567890",
-                    "createdAt": datetime.now().isoformat()
-                }
-            ],
-            "profiles": [],
-            "readings": [],
-            "alerts": [],
-            "settings": []
-        }
-        save_database(default_data)
+    created = not os.path.exists(repo.path)
+    default_data = {
+        "users": [
+            {
+                "id": 1,
+                "name": "Alex Johnson",
+                "email": "alex@example.com",
+                "profilePhoto": "https://api.dicebear.com/7.x/avataaars/svg?seed=Alex",
+                "role": "user",
+                "phone": "+1234567890",
+                "createdAt": datetime.now().isoformat()
+            }
+        ],
+        "profiles": [],
+        "readings": [],
+        "alerts": [],
+        "settings": []
+    }
+    repo.open(default_data)
+    if created:
         print("✅ Created new database file")
 
-# Load database
-def load_database():
-    try:
-        with open(DB_FILE, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"⚠️  Error loading database: {e}")
-        return {"users": [], "profiles": [], "readings": [], "alerts": [], "settings": []}
-
-# Save database
-def save_database(data):
-    try:
-        with open(DB_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
-    except Exception as e:
-        print(f"❌ Error saving database: {e}")
-
-# Get next ID
-def get_next_id(items):
-    ids = [item.get('id', 0) for item in items if isinstance(item, dict)]
-    return max(ids, default=0) + 1
+    started = datetime.now()
+    rollups.rebuild(readings_store)
+    spatial_index.rebuild(readings_store, started.timestamp())
+    load_thresholds()
+    print(f"📈 Rollups and spatial index rebuilt in {(datetime.now() - started).total_seconds():.2f}s")
 
 # ========== HOME PAGE ==========
-@app.route('/')
+@server_api.route('/')
 def home():
     return f'''
     <!DOCTYPE html>
@@ -113,74 +208,95 @@ fetch('http://localhost:{PORT}/api/test')
     '''
 
 # ========== TEST ENDPOINT ==========
-@app.route('/api/test', methods=['GET', 'OPTIONS'])
+# Encoded once; only the timestamp changes between requests
+TEST_RESPONSE = Template({
+    "success": True,
+    "message": "✅ RadSafe Database is working perfectly!",
+    "timestamp": None,
+    "endpoints": {
+        "GET /api/health": "Health check",
+        "GET /metrics": "Prometheus metrics",
+        "GET /api/test": "This test page",
+        "POST /api/auth/register": "Create an account",
+        "POST /api/auth/login": "Log in and get a signed access token",
+        "GET /api/auth/me": "Check the bearer token",
+        "GET /api/users?limit=&after=&role=&emailPrefix=&createdFrom=&createdTo=&fields=": "List users, one page at a time",
+        "GET /api/users/<id>": "Get specific user",
+        "PUT /api/users/<id>": "Update user",
+        "POST /api/users/bulk": "Create and update many users in one transaction",
+        "GET /api/profiles?limit=&after=&userId=&fields=": "List profiles, one page at a time",
+        "GET /api/profiles/user/<id>": "Get user profile",
+        "PATCH /api/profiles/bulk": "Update many profiles by id or userId in one transaction",
+        "POST /api/readings/batch": "Ingest a batch of sensor readings",
+        "GET /api/readings?device=&from=&to=&after=&fields=": "Readings for a device in a time range",
+        "GET /api/radiation/history?window=&resolution=": "Min/max/mean history from rollups",
+        "GET /api/radiation/area?bbox=west,south,east,north": "Readings inside a map area",
+        "GET /api/radiation/nearest?lat=&lng=&k=": "Readings closest to a point",
+        "GET /api/radiation/tiles/<z>/<x>/<y>?format=png|bin&stat=mean|max": "Heatmap tile",
+        "GET /api/alerts?userId=&deviceId=&type=&limit=&after=": "Alerts raised from incoming readings",
+        "PUT /api/alerts/thresholds": "Set a user's alert thresholds for a device"
+    },
+    "status": "operational"
+}, 'timestamp')
+
+@server_api.route('/api/test', methods=['GET'])
 def test():
-    if request.method == 'OPTIONS':
-        return '', 200
-    
-    return jsonify({
-        "success": True,
-        "message": "✅ RadSafe Database is working perfectly!",
-        "timestamp": datetime.now().isoformat(),
-        "endpoints": {
-            "GET /api/health": "Health check",
-            "GET /api/test": "This test page",
-            "GET /api/users": "List all users",
-            "GET /api/users/<id>": "Get specific user",
-            "PUT /api/users/<id>": "Update user",
-            "GET /api/profiles": "List all profiles",
-            "GET /api/profiles/user/<id>": "Get user profile"
-        },
-        "status": "operational"
-    })
+    return Response(TEST_RESPONSE.render(timestamp=datetime.now().isoformat()), mimetype='application/json')
 
 # ========== HEALTH CHECK ==========
-@app.route('/api/health', methods=['GET', 'OPTIONS'])
+@status_api.route('/api/health', methods=['GET'])
 def health_check():
-    if request.method == 'OPTIONS':
-        return '', 200
-    
     return jsonify({
         "status": "healthy",
         "service": "RadSafe Database API",
-        "database_file": DB_FILE,
+        "database_file": repo.path,
         "timestamp": datetime.now().isoformat(),
-        "users_count": len(load_database().get('users', [])),
-        "profiles_count": len(load_database().get('profiles', []))
+        "users_count": repo.count('users'),
+        "profiles_count": repo.count('profiles'),
+        "uptime_seconds": round(uptime()),
+        "response_cache": {
+            "hits": response_cache.hits,
+            "misses": response_cache.misses,
+            "not_modified": response_cache.not_modified
+        }
     })
 
 # ========== AUTHENTICATION ROUTES ==========
-@app.route('/api/auth/register', methods=['POST', 'OPTIONS'])
-def register():
-    if request.method == 'OPTIONS':
-        return '', 200
+def hasher_busy():
+    return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": "1"}
 
+@auth_api.route('/api/auth/register', methods=['POST'])
+def register():
     try:
         data = request.json
         if not data or not data.get('email') or not data.get('password') or not data.get('full_name'):
             return jsonify({"error": "Missing required fields: email, password, full_name"}), 400
+        if not isinstance(data['password'], str):
+            return jsonify({"error": "Password must be a string"}), 400
 
-        db = load_database()
-
-        # Check if user already exists
-        existing_user = next((u for u in db.get('users', []) if u.get('email') == data['email']), None)
-        if existing_user:
+        # Hashing takes a while; skip it for taken emails and do it outside the transaction
+        if repo.find_one('users', 'email', data['email']):
             return jsonify({"error": "User already exists with this email"}), 409
+        password_hash = password_hasher.hash(data['password'])
+
+        with repo.transaction():
+            # Check if user already exists
+            existing_user = repo.find_one('users', 'email', data['email'])
+            if existing_user:
+                return jsonify({"error": "User already exists with this email"}), 409
+
+            # Create new user
+            user = {
+                "name": data['full_name'],
+                "email": data['email'],
+                "password": password_hash,
+                "role": "user",
+                "profilePhoto": f"https://api.dicebear.com/7.x/avataaars/svg?seed={data['email']}",
+                "createdAt": datetime.now().isoformat(),
+                "updatedAt": datetime.now().isoformat()
+            }
 
-        # Create new user
-        user = {
-            "id": get_next_id(db.get('users', [])),
-            "name": data['full_name'],
-            "email": data['email'],
-            "password": data['password'],  # In production, hash this!
-            "role": "user",
-            "profilePhoto": f"https://api.dicebear.com/7.x/avataaars/svg?seed={data['email']}",
-            "createdAt": datetime.now().isoformat(),
-            "updatedAt": datetime.now().isoformat()
-        }
-
-        db['users'].append(user)
-        save_database(db)
+            user = repo.insert('users', user)
 
         # Return user without password
         user_response = {k: v for k, v in user.items() if k != 'password'}
@@ -190,29 +306,32 @@ def register():
             "user": user_response
         })
 
+    except PasswordHasherBusy:
+        return hasher_busy()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/auth/login', methods=['POST', 'OPTIONS'])
+@auth_api.route('/api/auth/login', methods=['POST'])
 def login():
-    if request.method == 'OPTIONS':
-        return '', 200
-
     try:
         data = request.json
         if not data or not data.get('email') or not data.get('password'):
             return jsonify({"error": "Missing email or password"}), 400
-
-        db = load_database()
+        if not isinstance(data['password'], str):
+            return jsonify({"error": "Password must be a string"}), 400
 
         # Find user by email
-        user = next((u for u in db.get('users', []) if u.get('email') == data['email']), None)
+        user = repo.find_one('users', 'email', data['email'])
         if not user:
+            password_hasher.verify_dummy(data['password'])
             return jsonify({"error": "Invalid email or password"}), 401
 
-        # Check password (in production, use proper password hashing)
-        if user.get('password') != data['password']:
+        matches, needs_rehash = password_hasher.verify(data['password'], user.get('password'))
+        if not matches:
             return jsonify({"error": "Invalid email or password"}), 401
+        if needs_rehash:
+            # Plaintext from before hashing, or older hash parameters
+            repo.update('users', user['id'], {"password": password_hasher.hash(data['password'])})
 
         # Return user without password
         user_response = {k: v for k, v in user.items() if k != 'password'}
@@ -220,125 +339,638 @@ def login():
             "success": True,
             "message": "Login successful",
             "user": user_response,
-            "access_token": f"token_{user['id']}_{datetime.now().timestamp()}",  # Simple token
-            "token_type": "bearer"
+            "access_token": token_signer.issue(user),
+            "token_type": "bearer",
+            "expires_in": token_signer.ttl
         })
 
+    except PasswordHasherBusy:
+        return hasher_busy()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@auth_api.route('/api/auth/me', methods=['GET'])
+def me():
+    """Claims of the bearer token, checked by signature and expiry alone"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    claims = token_signer.verify(token.strip()) if scheme.lower() == 'bearer' else None
+    if claims is None:
+        return jsonify({"error": "Invalid or expired token"}), 401
+    return jsonify({
+        "success": True,
+        "userId": claims['sub'],
+        "role": claims['role'],
+        "expiresAt": datetime.fromtimestamp(claims['exp']).isoformat()
+    })
+
+# ========== LIST QUERIES ==========
+def iso_param(value):
+    return datetime.fromtimestamp(parse_timestamp(value)).isoformat()
+
+def list_params(collection):
+    """limit, after, filters and fields from the query string; ValueError on bad input"""
+    args = request.args
+    limit = max(1, min(int(args.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+    after = int(args['after']) if args.get('after') else None
+    filters = [(field, '=', kind(args[field])) for field, kind in LIST_FILTERS[collection].items()
+               if args.get(field) is not None]
+    if args.get('createdFrom'):
+        filters.append(('createdAt', '>=', iso_param(args['createdFrom'])))
+    if args.get('createdTo'):
+        filters.append(('createdAt', '<', iso_param(args['createdTo'])))
+    if args.get('emailPrefix'):
+        filters.append(('email', 'prefix', args['emailPrefix']))
+    fields = [f.strip() for f in args.get('fields', '').split(',') if f.strip()] or None
+    return limit, after, filters, fields
+
+def project(record, fields, hidden=('password',)):
+    if fields is None:
+        return {k: v for k, v in record.items() if k not in hidden}
+    return {k: record[k] for k in fields if k in record and k not in hidden}
+
+def page_response(items, next_cursor):
+    """JSON list of one page; the cursor for the next page goes in X-Next-Cursor and Link"""
+    response = jsonify(items)
+    if next_cursor is not None:
+        args = request.args.to_dict()
+        args['after'] = next_cursor
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
+
+def list_collection(collection):
+    try:
+        limit, after, filters, fields = list_params(collection)
+    except (ValueError, TypeError):
+        return jsonify({"error": "limit/after must be integers, createdFrom/createdTo timestamps"}), 400
+    records = repo.page(collection, limit, after=after, filters=filters)
+    next_cursor = records[-1]['id'] if len(records) == limit else None
+    return page_response([project(r, fields) for r in records], next_cursor)
+
 # ========== USER ROUTES ==========
-@app.route('/api/users', methods=['GET', 'OPTIONS'])
+@users_api.route('/api/users', methods=['GET'])
+@response_cache.cached('users')
 def get_users():
-    if request.method == 'OPTIONS':
-        return '', 200
+    # One page of users, without passwords
+    return list_collection('users')
 
-    db = load_database()
-    # Return users without passwords
-    users = [{k: v for k, v in u.items() if k != 'password'} for u in db.get('users', [])]
-    return jsonify(users)
-
-@app.route('/api/users/<int:user_id>', methods=['GET', 'OPTIONS'])
+@users_api.route('/api/users/<int:user_id>', methods=['GET'])
+@response_cache.cached('users')
 def get_user(user_id):
-    if request.method == 'OPTIONS':
-        return '', 200
-    
-    db = load_database()
-    user = next((u for u in db.get('users', []) if u.get('id') == user_id), None)
+    user = repo.find_one('users', 'id', user_id)
     if user:
-        return jsonify(user)
+        return jsonify(project(user, None))
     return jsonify({"error": "User not found"}), 404
 
-@app.route('/api/users/<int:user_id>', methods=['PUT', 'OPTIONS'])
+@users_api.route('/api/users/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
-    if request.method == 'OPTIONS':
-        return '', 200
-    
     try:
-        db = load_database()
         user_data = request.json
-        
-        for i, user in enumerate(db.get('users', [])):
-            if user.get('id') == user_id:
-                # Update user
-                db['users'][i].update(user_data)
-                db['users'][i]['updatedAt'] = datetime.now().isoformat()
-                
-                # Also save to profiles collection
-                profile = next((p for p in db.get('profiles', []) if p.get('userId') == user_id), None)
-                if profile:
-                    profile.update(user_data)
-                    profile['updatedAt'] = datetime.now().isoformat()
-                else:
-                    db['profiles'].append({
-                        **user_data,
-                        "id": get_next_id(db.get('profiles', [])),
-                        "userId": user_id,
-                        "createdAt": datetime.now().isoformat(),
-                        "updatedAt": datetime.now().isoformat()
-                    })
-                
-                save_database(db)
-                return jsonify({
-                    "success": True, 
-                    "message": f"User {user_id} updated",
-                    "user": db['users'][i]
+        profile_data = {k: v for k, v in user_data.items() if k != 'password'}
+        if 'password' in user_data:
+            if not isinstance(user_data['password'], str):
+                return jsonify({"error": "Password must be a string"}), 400
+            user_data = {**user_data, "password": password_hasher.hash(user_data['password'])}
+
+        with repo.transaction():
+            # Update user
+            user = repo.update('users', user_id, {**user_data, "updatedAt": datetime.now().isoformat()})
+            if not user:
+                return jsonify({"error": "User not found"}), 404
+
+            # Also save to profiles collection
+            profile = repo.find_one('profiles', 'userId', user_id)
+            if profile:
+                repo.update('profiles', profile['id'], {**profile_data, "updatedAt": datetime.now().isoformat()})
+            else:
+                repo.insert('profiles', {
+                    **profile_data,
+                    "id": None,
+                    "userId": user_id,
+                    "createdAt": datetime.now().isoformat(),
+                    "updatedAt": datetime.now().isoformat()
                 })
-        
-        return jsonify({"error": "User not found"}), 404
+
+            return jsonify({
+                "success": True,
+                "message": f"User {user_id} updated",
+                "user": project(user, None)
+            })
+    except PasswordHasherBusy:
+        return hasher_busy()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # ========== PROFILE ROUTES ==========
-@app.route('/api/profiles', methods=['GET', 'POST', 'OPTIONS'])
+@users_api.route('/api/profiles', methods=['GET', 'POST'])
+@response_cache.cached('profiles')
 def profiles():
-    if request.method == 'OPTIONS':
-        return '', 200
-    
     if request.method == 'GET':
-        db = load_database()
-        return jsonify(db.get('profiles', []))
+        return list_collection('profiles')
     
     elif request.method == 'POST':
         try:
-            db = load_database()
             profile_data = request.json
             
-            profile = {
-                "id": get_next_id(db.get('profiles', [])),
+            # The id is always assigned here; one from the client could collide with a stored profile
+            profile = repo.insert('profiles', {
                 **profile_data,
+                "id": None,
                 "createdAt": datetime.now().isoformat(),
                 "updatedAt": datetime.now().isoformat()
-            }
-            
-            db['profiles'].append(profile)
-            save_database(db)
+            })
             return jsonify({"success": True, "profile": profile})
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
-@app.route('/api/profiles/user/<int:user_id>', methods=['GET', 'OPTIONS'])
+@users_api.route('/api/profiles/user/<int:user_id>', methods=['GET'])
+@response_cache.cached('profiles')
 def get_user_profile(user_id):
-    if request.method == 'OPTIONS':
-        return '', 200
-    
-    db = load_database()
-    profile = next((p for p in db.get('profiles', []) if p.get('userId') == user_id), None)
+    profile = repo.find_one('profiles', 'userId', user_id)
     if profile:
         return jsonify(profile)
     return jsonify({})
 
+# ========== BULK ROUTES ==========
+def bulk_items(key):
+    """Items of a bulk request body, either a list or {key: [...]}; ValueError on bad input"""
+    data = request.get_json(silent=True)
+    items = data.get(key) if isinstance(data, dict) else data
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError(f'Expected a JSON list of objects or {{"{key}": [...]}}')
+    if len(items) > MAX_BULK_ITEMS:
+        raise ValueError(f"At most {MAX_BULK_ITEMS} items per request")
+    return items
+
+def is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def bulk_response(results):
+    """Summary counts plus one {index, status, id | error} result per item, in request order"""
+    created = sum(1 for result in results if result['status'] == 201)
+    updated = sum(1 for result in results if result['status'] == 200)
+    return jsonify({
+        "success": created + updated == len(results),
+        "created": created,
+        "updated": updated,
+        "failed": len(results) - created - updated,
+        "results": results
+    })
+
+@users_api.route('/api/users/bulk', methods=['POST'])
+def bulk_users():
+    """Create users (items without an id) and update users (items with one) in one transaction"""
+    try:
+        items = bulk_items('users')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    now = datetime.now().isoformat()
+    results = [None] * len(items)
+    creates, updates = [], []   # (index, user), (index, user id, changes)
+    try:
+        # Plaintext passwords are hashed before the transaction; stored hashes are kept as given
+        # if they are no costlier to verify than ours (weaker ones are upgraded at the next login)
+        plaintext = [index for index, item in enumerate(items)
+                     if isinstance(item.get('password'), str) and item['password'] and not is_hashed(item['password'])]
+        hashes = dict(zip(plaintext, password_hasher.hash_many([items[index]['password'] for index in plaintext])))
+
+        with repo.transaction():
+            existing = repo.find_many('users', 'id', [item['id'] for item in items if is_id(item.get('id'))])
+            emails = {email: user['id'] for email, user in repo.find_many(
+                'users', 'email', [item['email'] for item in items if isinstance(item.get('email'), str)]).items()}
+            current_email = {user_id: user.get('email') for user_id, user in existing.items()}
+
+            for index, item in enumerate(items):
+                email = item.get('email')
+                if email is not None and not isinstance(email, str):
+                    results[index] = {"index": index, "status": 400, "error": "email must be a string"}
+                elif 'password' in item and not isinstance(item['password'], str):
+                    results[index] = {"index": index, "status": 400, "error": "password must be a string"}
+                elif is_hashed(item.get('password')) and not password_hasher.affordable(item['password']):
+                    results[index] = {"index": index, "status": 400,
+                                      "error": "password hash parameters exceed this server's cost"}
+                elif 'id' in item:
+                    user_id = item['id']
+                    if not is_id(user_id) or user_id not in existing:
+                        results[index] = {"index": index, "status": 404, "error": "User not found"}
+                    elif email is not None and emails.get(email, user_id) != user_id:
+                        results[index] = {"index": index, "status": 409, "error": "Email already in use"}
+                    else:
+                        if email is not None:
+                            if emails.get(current_email[user_id]) == user_id:
+                                del emails[current_email[user_id]]
+                            emails[email] = current_email[user_id] = user_id
+                        changes = {k: v for k, v in item.items() if k != 'id'}
+                        if index in hashes:
+                            changes['password'] = hashes[index]
+                        updates.append((index, user_id, {**changes, "updatedAt": now}))
+                else:
+                    name = item.get('name') or item.get('full_name')
+                    if not email or not name:
+                        results[index] = {"index": index, "status": 400,
+                                          "error": "Missing required fields: email, name"}
+                    elif email in emails:
+                        results[index] = {"index": index, "status": 409,
+                                          "error": "User already exists with this email"}
+                    else:
+                        emails[email] = None   # taken by a user created in this batch
+                        user = {
+                            "name": name,
+                            "email": email,
+                            "role": item.get('role', 'user'),
+                            "profilePhoto": item.get('profilePhoto') or f"https://api.dicebear.com/7.x/avataaars/svg?seed={email}",
+                            "createdAt": now,
+                            "updatedAt": now
+                        }
+                        if item.get('password'):
+                            user["password"] = hashes.get(index, item['password'])
+                        creates.append((index, user))
+
+            created = repo.insert_many('users', [user for _, user in creates])
+            repo.update_many('users', [(user_id, changes) for _, user_id, changes in updates])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    for (index, _), user in zip(creates, created):
+        results[index] = {"index": index, "status": 201, "id": user['id']}
+    for index, user_id, _ in updates:
+        results[index] = {"index": index, "status": 200, "id": user_id}
+    return bulk_response(results)
+
+@users_api.route('/api/profiles/bulk', methods=['PATCH'])
+def bulk_profiles():
+    """Patch profiles by id or userId in one transaction; a user without a profile gets one"""
+    try:
+        items = bulk_items('profiles')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    now = datetime.now().isoformat()
+    results = [None] * len(items)
+    creates, updates = {}, []   # user id -> (indexes, profile), (index, profile id, changes)
+    try:
+        with repo.transaction():
+            by_id = repo.find_many('profiles', 'id', [item['id'] for item in items if is_id(item.get('id'))])
+            by_user = repo.find_many('profiles', 'userId',
+                                     [item['userId'] for item in items if is_id(item.get('userId'))])
+            users = repo.find_many('users', 'id', [item['userId'] for item in items
+                                                   if is_id(item.get('userId')) and item['userId'] not in by_user])
+
+            for index, item in enumerate(items):
+                changes = {k: v for k, v in item.items() if k not in ('id', 'userId')}
+                if 'id' in item:
+                    profile = by_id.get(item['id']) if is_id(item['id']) else None
+                elif is_id(item.get('userId')):
+                    profile = by_user.get(item['userId'])
+                    if profile is None and item['userId'] in users:
+                        indexes, pending = creates.setdefault(item['userId'], ([], {
+                            "userId": item['userId'], "createdAt": now, "updatedAt": now}))
+                        indexes.append(index)
+                        pending.update(changes)
+                        continue
+                else:
+                    results[index] = {"index": index, "status": 400, "error": "Each profile needs an id or a userId"}
+                    continue
+                if profile is None:
+                    results[index] = {"index": index, "status": 404, "error": "Profile not found"}
+                else:
+                    updates.append((index, profile['id'], {**changes, "updatedAt": now}))
+
+            created = repo.insert_many('profiles', [profile for _, profile in creates.values()])
+            repo.update_many('profiles', [(profile_id, changes) for _, profile_id, changes in updates])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    for (indexes, _), profile in zip(creates.values(), created):
+        for index in indexes:
+            results[index] = {"index": index, "status": 201, "id": profile['id']}
+    for index, profile_id, _ in updates:
+        results[index] = {"index": index, "status": 200, "id": profile_id}
+    return bulk_response(results)
+
+# ========== READINGS ROUTES ==========
+def ingest_readings(items):
+    """Validate one batch and store the accepted readings with a single write"""
+    global _last_spatial_prune
+    started = time.perf_counter()
+    accepted, errors = validate_batch(items)
+    readings_store.append_many(accepted)
+    rollups.add_many(accepted)
+    spatial_index.add_many(accepted)
+    tile_cache.invalidate(accepted)
+    if _worker_readings is None:
+        raised = alert_engine.evaluate(accepted)
+        alert_engine.flush(repo)
+    else:
+        # Evaluated by the worker holding the alerts lock within SYNC_INTERVAL
+        with _worker_readings_lock:
+            _worker_readings.extend(accepted)
+        raised = 0
+    now = datetime.now().timestamp()
+    if now - _last_spatial_prune > 60:
+        _last_spatial_prune = now
+        # Only tiles that held pruned readings change
+        tile_cache.invalidate(spatial_index.prune(now - SPATIAL_RETENTION))
+    READINGS_INGESTED.inc(amount=len(accepted))
+    READINGS_REJECTED.inc(amount=len(errors))
+    INGEST_BATCH_SECONDS.observe(time.perf_counter() - started)
+    return {"accepted": len(accepted), "rejected": len(errors), "alerts": raised, "errors": errors[:100]}
+
+@readings_api.route('/api/readings/batch', methods=['POST'])
+def readings_batch():
+    try:
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            # Stream the body so a large upload is never held in memory at once
+            lines = (line.decode('utf-8', errors='replace') for line in request.stream)
+            batches = [ingest_readings(items) for items in iter_ndjson_batches(lines, READINGS_BATCH_SIZE)]
+        else:
+            data = request.get_json(silent=True)
+            items = data.get('readings') if isinstance(data, dict) else data
+            if not isinstance(items, list):
+                return jsonify({"error": "Body must be a JSON array of readings or {\"readings\": [...]}"}), 400
+            if len(items) > MAX_READINGS_PER_REQUEST:
+                return jsonify({"error": f"At most {MAX_READINGS_PER_REQUEST} readings per request; "
+                                         f"use application/x-ndjson for larger uploads"}), 413
+            batches = [ingest_readings(items)]
+
+        return jsonify({
+            "success": True,
+            "accepted": sum(b["accepted"] for b in batches),
+            "rejected": sum(b["rejected"] for b in batches),
+            "batches": batches
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def parse_readings_cursor(value):
+    """'<ms>:<n>' -> (ms, n); a bare millisecond timestamp resumes after that millisecond"""
+    ms, sep, count = value.partition(':')
+    if not sep:
+        return int(ms) + 1, 0
+    count = int(count)
+    if count < 0:
+        raise ValueError(value)
+    return int(ms), count
+
+def readings_cursor(readings, after):
+    """Cursor for the page after `readings`: the last timestamp in epoch milliseconds and how
+    many readings at that millisecond have been returned, counting earlier pages"""
+    last_ms = round(readings[-1]["timestamp"] * 1000)
+    count = sum(1 for r in readings if round(r["timestamp"] * 1000) == last_ms)
+    if after is not None and after[0] == last_ms:
+        count += after[1]
+    return f"{last_ms}:{count}"
+
+@readings_api.route('/api/readings', methods=['GET'])
+def get_readings():
+    device = request.args.get('device')
+    if not device:
+        return jsonify({"error": "device parameter is required"}), 400
+
+    try:
+        now = datetime.now().timestamp()
+        end = parse_timestamp(request.args.get('to', now))
+        start = parse_timestamp(request.args.get('from', end - 86400))
+        limit = min(int(request.args.get('limit', 10000)), MAX_READINGS_PER_QUERY)
+        after = parse_readings_cursor(request.args['after']) if request.args.get('after') else None
+    except (ValueError, TypeError):
+        return jsonify({"error": "from/to must be epoch seconds or ISO-8601, limit an integer, "
+                                 "after a nextCursor value"}), 400
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or None
+
+    readings = readings_store.query(device, start, end, limit=limit, after=after)
+    next_cursor = readings_cursor(readings, after) if len(readings) == limit else None
+    return jsonify({
+        "device": device,
+        "from": datetime.fromtimestamp(start).isoformat(),
+        "to": datetime.fromtimestamp(end).isoformat(),
+        "count": len(readings),
+        "nextCursor": next_cursor,
+        "readings": [project(to_radiation_data(r), fields) for r in readings]
+    })
+
+@readings_api.route('/api/radiation/history', methods=['GET'])
+def get_radiation_history():
+    device = request.args.get('device', ALL_DEVICES)
+    try:
+        window = parse_duration(request.args.get('window', '24h'))
+        resolution = request.args.get('resolution')
+        resolution = parse_duration(resolution) if resolution else None
+        end = parse_timestamp(request.args.get('to', datetime.now().timestamp()))
+    except (ValueError, TypeError):
+        return jsonify({"error": "window/resolution must be durations like 24h or 5m, to a timestamp"}), 400
+
+    source, resolution, points = rollups.history(device, end - window, end, resolution)
+    total = sum(p["mean"] * p["count"] for p in points)
+    count = sum(p["count"] for p in points)
+    history = [{
+        "value": round(p["mean"], 4),
+        "min": round(p["min"], 4),
+        "max": round(p["max"], 4),
+        "last": round(p["last"], 4),
+        "count": p["count"],
+        "time": datetime.fromtimestamp(p["timestamp"]).strftime('%Y-%m-%d %H:%M'),
+        "timestamp": p["timestamp"]
+    } for p in points]
+    return jsonify({
+        "device": device,
+        "window": window,
+        "resolution": resolution,
+        "source_resolution": source,
+        "history": history,
+        "count": len(history),
+        "samples": count,
+        "average": round(total / count, 4) if count else None
+    })
+
+def located_reading(reading):
+    return {"deviceId": reading["deviceId"], **to_radiation_data(reading)}
+
+@readings_api.route('/api/radiation/area', methods=['GET'])
+def get_radiation_area():
+    try:
+        west, south, east, north = (float(v) for v in request.args.get('bbox', '').split(','))
+        since = request.args.get('since')
+        since = parse_timestamp(since) if since else None
+        limit = min(int(request.args.get('limit', 5000)), MAX_READINGS_PER_QUERY)
+    except (ValueError, TypeError):
+        return jsonify({"error": "bbox=west,south,east,north is required"}), 400
+    if west > east or south > north:
+        return jsonify({"error": "bbox must be west,south,east,north with west <= east and south <= north"}), 400
+
+    readings = spatial_index.within(south, west, north, east, since=since, limit=limit)
+    return jsonify({
+        "bbox": [west, south, east, north],
+        "count": len(readings),
+        "readings": [located_reading(r) for r in readings]
+    })
+
+@readings_api.route('/api/radiation/nearest', methods=['GET'])
+def get_radiation_nearest():
+    try:
+        lat = float(request.args['lat'])
+        lng = float(request.args['lng'])
+        k = max(1, min(int(request.args.get('k', 10)), 1000))
+        since = request.args.get('since')
+        since = parse_timestamp(since) if since else None
+    except (KeyError, ValueError, TypeError):
+        return jsonify({"error": "lat and lng are required, k must be an integer"}), 400
+
+    readings = spatial_index.nearest(lat, lng, k=k, since=since)
+    return jsonify({
+        "lat": lat,
+        "lng": lng,
+        "count": len(readings),
+        "readings": [{**located_reading(r), "distance_km": r["distance_km"]} for r in readings]
+    })
+
+@readings_api.route('/api/radiation/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_radiation_tile(z, x, y):
+    fmt = request.args.get('format', 'png')
+    stat = request.args.get('stat', 'mean')
+    if not valid_tile(z, x, y):
+        return jsonify({"error": "Tile out of range"}), 404
+    if fmt not in FORMATS or stat not in ('mean', 'max'):
+        return jsonify({"error": "format must be png or bin, stat must be mean or max"}), 400
+
+    return Response(tile_cache.get(z, x, y, fmt=fmt, stat=stat), mimetype=FORMATS[fmt])
+
+# ========== ALERT ROUTES ==========
+@alerts_api.route('/api/alerts', methods=['GET'])
+@response_cache.cached('alerts')
+def get_alerts():
+    # Alerts are written at the end of every ingest batch (within SYNC_INTERVAL under launcher.py)
+    return list_collection('alerts')
+
+@alerts_api.route('/api/alerts/thresholds', methods=['PUT'])
+def set_alert_thresholds():
+    try:
+        data = request.json or {}
+        user_id = data.get('userId')
+        device = data.get('deviceId')
+        if user_id is None or not device:
+            return jsonify({"error": "userId and deviceId are required"}), 400
+        device = str(device)
+        thresholds = {key: float(data[key]) for key in DEFAULT_THRESHOLDS if data.get(key) is not None}
+
+        with repo.transaction():
+            existing = [s for s in repo.all('settings') if s.get('userId') == user_id and s.get('deviceId') == device]
+            if existing:
+                settings = repo.update('settings', existing[0]['id'], {**thresholds, "updatedAt": datetime.now().isoformat()})
+            else:
+                settings = repo.insert('settings', {
+                    "id": None,
+                    "userId": user_id,
+                    "deviceId": device,
+                    **thresholds,
+                    "createdAt": datetime.now().isoformat(),
+                    "updatedAt": datetime.now().isoformat()
+                })
+        alert_engine.set_thresholds(user_id, device, settings)
+        return jsonify({"success": True, "settings": settings})
+    except (TypeError, ValueError):
+        return jsonify({"error": "Thresholds must be numbers"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # ========== DEBUG ROUTE ==========
-@app.route('/api/debug', methods=['GET'])
+@status_api.route('/api/debug', methods=['GET'])
 def debug():
-    db = load_database()
     return jsonify({
-        "database": db,
-        "file_exists": os.path.exists(DB_FILE),
-        "file_size": os.path.getsize(DB_FILE) if os.path.exists(DB_FILE) else 0,
+        "collections": {name: repo.count(name) for name in COLLECTIONS},
+        "file_exists": os.path.exists(repo.path),
+        "file_size": os.path.getsize(repo.path) if os.path.exists(repo.path) else 0,
         "current_time": datetime.now().isoformat()
     })
 
+# ========== APP ==========
+def rate_limit_key(req):
+    """Signed-in clients are rate limited per account, others per address"""
+    scheme, _, token = req.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() == 'bearer':
+        claims = token_signer.verify(token.strip())
+        if claims is not None:
+            return req.remote_addr or '-', f"user:{claims['sub']}"
+    return client_key(req)
+
+def create_app():
+    """The standalone database server on PORT"""
+    app = limit_requests(log_requests(instrument(install(Flask(__name__)), 'database'), 'database'), 'database',
+                         rate_limit_key)
+    CORS(app, origins=["http://localhost:3001"], methods=["GET", "POST", "PUT", "PATCH", "OPTIONS"], supports_credentials=True,
+         expose_headers=["X-Next-Cursor", "Link", "X-Request-ID", "Retry-After"])
+    for blueprint in BLUEPRINTS + (server_api,):
+        app.register_blueprint(blueprint)
+    return app
+
+app = create_app()
+
+# ========== WORKER PROCESSES ==========
+def sync_readings():
+    """Fold readings stored by other worker processes into this process's rollups and spatial index,
+    and evaluate alerts for all of them if this worker holds the alerts lock"""
+    readings = readings_store.changes()
+    if readings:
+        rollups.add_many(readings)
+        spatial_index.add_many(readings)
+        tile_cache.invalidate(readings)
+    if _worker_readings is not None:
+        with _worker_readings_lock:
+            own = _worker_readings[:]
+            del _worker_readings[:]
+        if hold_alerts_lock():
+            load_thresholds()
+            alert_engine.evaluate(sorted(own + readings, key=lambda reading: reading['timestamp']))
+            alert_engine.flush(repo)
+    return len(readings)
+
+def hold_alerts_lock():
+    """True if this process evaluates alerts; takes the lock over when its holder has exited"""
+    global _alerts_lock_file
+    if _alerts_lock_file is None:
+        lock_file = open(ALERTS_LOCK, 'a')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        _alerts_lock_file = lock_file
+        print(f"🚨 Worker {os.getpid()} now evaluates alerts")
+    return True
+
+def load_thresholds():
+    """Reload alert thresholds whenever any process has written the settings collection"""
+    global _settings_version
+    version = repo.version('settings')
+    if version != _settings_version:
+        alert_engine.load_settings(repo.all('settings'))
+        _settings_version = version
+
+def sync_loop():
+    while True:
+        time.sleep(SYNC_INTERVAL)
+        try:
+            sync_readings()
+        except Exception as e:
+            print(f"⚠️  Readings sync failed: {e}")
+
+def prefork(workers):
+    """Called by launcher.py once before forking `workers` processes (or in each one without preload)"""
+    if STORAGE_BACKEND != 'sqlite':
+        # The JSON store lives in one process's memory; run database.py directly to use it
+        raise RuntimeError("launcher.py needs RADSAFE_STORAGE=sqlite")
+    init_database()
+    readings_store.follow()
+
+def postfork():
+    """Called by launcher.py in every worker process"""
+    global _worker_readings
+    _worker_readings = []
+    password_hasher.start()
+    threading.Thread(target=sync_loop, name="readings-sync", daemon=True).start()
+
 # ========== MAIN ==========
 if __name__ == '__main__':
     print("=" * 60)
@@ -346,6 +978,7 @@ if __name__ == '__main__':
     print("=" * 60)
     
     init_database()
+    password_hasher.start()
     
     print(f"✅ Database initialized")
     print(f"🌐 Server starting on: http://localhost:{PORT}")
@@ -361,4 +994,7 @@ if __name__ == '__main__':
         print("\n👋 Server stopped")
     except Exception as e:
         print(f"❌ Error: {e}")
-        print("Try: pip install flask flask-cors")
\ No newline at end of file
+        print("Try: pip install flask flask-cors")
+    finally:
+        repo.close()
+        readings_store.close()
\ No newline at end of file
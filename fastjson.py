@@ -0,0 +1,90 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback
+    orjson = None
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:  # storage and the raw-socket servers run without Flask
+    DefaultJSONProvider = object
+
+# Compact JSON for the Flask apps, the storage files and the raw-socket servers:
+# orjson when it is installed, the standard library otherwise
+
+
+def _unsupported(obj):
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# Dates, decimals, UUIDs and dataclasses are encoded the way Flask's default provider does
+_default = getattr(DefaultJSONProvider, 'default', _unsupported)
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumps(obj):
+        """obj -> compact UTF-8 JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    def dumps(obj):
+        """obj -> compact UTF-8 JSON bytes"""
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(data):
+        return json.loads(data)
+
+
+def dumps_text(obj):
+    return dumps(obj).decode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider for jsonify() and request.json; keys keep their insertion order"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps_text(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b"\n", mimetype=self.mimetype)
+
+
+def install(app):
+    """Encode a Flask app's JSON with FastJSONProvider"""
+    app.json_provider_class = FastJSONProvider
+    app.json = FastJSONProvider(app)
+    return app
+
+
+class Template:
+    """A payload encoded once; only the named top-level fields are re-encoded per render()"""
+
+    def __init__(self, payload, *fields):
+        self.fields = fields
+        markers = {field: f"\x00{field}\x00" for field in fields}
+        body = dumps({**payload, **markers})
+        positions = sorted((body.index(dumps(marker)), field) for field, marker in markers.items())
+        self._parts = []
+        self._order = []
+        start = 0
+        for position, field in positions:
+            self._parts.append(body[start:position])
+            self._order.append(field)
+            start = position + len(dumps(markers[field]))
+        self._parts.append(body[start:])
+
+    def render(self, **values):
+        """Encoded payload bytes with `values` patched into the template fields"""
+        out = [self._parts[0]]
+        for field, part in zip(self._order, self._parts[1:]):
+            out.append(dumps(values[field]))
+            out.append(part)
+        return b"".join(out)
@@ -1,18 +1,23 @@
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, jsonify, request
 from flask_cors import CORS
-import random
-import requests
+import os
 from datetime import datetime
+from fastjson import install
+from geocache import GeocodeCache, nominatim_resolver
+from logs import log_requests
+from metrics import instrument
+from ratelimit import limit_requests
 
-app = Flask(__name__)
-CORS(app)
+# Routes live on blueprints so gateway.py can mount search next to the other APIs
+search_api = Blueprint('search', __name__)
+server_api = Blueprint('search_server', __name__)   # home and test pages of this server
+BLUEPRINTS = (search_api,)
 
-print("=" * 50)
-print("📱 PHONE SAFETY BACKEND")
-print("✅ Running on port 8000")
-print("=" * 50)
+# Geocoding results are cached in memory and in GEOCODE_CACHE_FILE across restarts
+GEOCODE_CACHE_FILE = os.environ.get('RADSAFE_GEOCODE_CACHE', os.path.join(os.path.dirname(__file__), 'geocode_cache.db'))
+geocoder = GeocodeCache(resolver=nominatim_resolver, path=GEOCODE_CACHE_FILE)
 
-@app.route('/api/test')
+@server_api.route('/api/test')
 def test():
     return jsonify({
         "status": "success",
@@ -20,23 +25,19 @@ def test():
         "time": datetime.now().strftime("%H:%M:%S")
     })
 
-@app.route('/api/radiation/search')
+@search_api.route('/api/radiation/search')
 def search_radiation():
     location = request.args.get('location')
     if not location:
         return jsonify({'error': 'Location parameter is required'}), 400
 
     try:
-        # Geocode the location using Nominatim
-        geocode_url = f'https://nominatim.openstreetmap.org/search?format=json&q={requests.utils.quote(location)}&limit=1'
-        geocode_response = requests.get(geocode_url)
-        geocode_data = geocode_response.json()
-
-        if not geocode_data:
+        # Geocode the location (Nominatim, cached)
+        coordinates = geocoder.lookup(location)
+        if coordinates is None:
             return jsonify({'error': 'Location not found'}), 404
 
-        lat = float(geocode_data[0]['lat'])
-        lng = float(geocode_data[0]['lon'])
+        lat, lng = coordinates
 
         # Generate simulated radiation data
         seed = abs(lat + lng) * 1000
@@ -66,7 +67,7 @@ def search_radiation():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/')
+@server_api.route('/')
 def home():
     return '''
     <html>
@@ -80,5 +81,19 @@ def home():
     </html>
     '''
 
+def create_app():
+    """The standalone search server on port 8000"""
+    app = limit_requests(log_requests(instrument(install(Flask(__name__)), 'search'), 'search'), 'search')
+    CORS(app)
+    for blueprint in BLUEPRINTS + (server_api,):
+        app.register_blueprint(blueprint)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
+    print("=" * 50)
+    print("📱 PHONE SAFETY BACKEND")
+    print("✅ Running on port 8000")
+    print("=" * 50)
     app.run(host='0.0.0.0', port=8000, debug=False)
\ No newline at end of file
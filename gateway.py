@@ -0,0 +1,105 @@
+import os
+from datetime import datetime
+
+from flask import Flask, Response, redirect, request
+from flask_cors import CORS
+
+import clean_backend
+import database
+import flask_app
+from fastjson import Template, install
+from logs import log_requests
+from metrics import instrument
+from ratelimit import limit_requests
+
+# One process serving every API: auth, users and profiles, readings and alerts (database.py),
+# live radiation and proximity sensors (clean_backend.py) and location search (flask_app.py).
+# All routes share database.py's repository, readings store and response cache.
+#
+#   python gateway.py
+#   RADSAFE_STORAGE=sqlite python launcher.py gateway --workers 4
+
+PORT = int(os.environ.get('RADSAFE_GATEWAY_PORT', '8000'))
+# Comma-separated; "*" allows every origin
+CORS_ORIGINS = os.environ.get('RADSAFE_CORS_ORIGINS', 'http://localhost:3000,http://localhost:3001')
+# Browsers cache a preflight answer this long (Chrome caps it at 2 hours, Firefox at 24)
+CORS_MAX_AGE = int(os.environ.get('RADSAFE_CORS_MAX_AGE', '86400'))
+
+BLUEPRINTS = database.BLUEPRINTS + clean_backend.BLUEPRINTS + flask_app.BLUEPRINTS
+
+
+def create_app():
+    app = limit_requests(log_requests(instrument(install(Flask(__name__)), 'gateway'), 'gateway'), 'gateway',
+                         database.rate_limit_key)
+    origins = CORS_ORIGINS.split(',') if CORS_ORIGINS != '*' else '*'
+    CORS(app, origins=origins, methods=["GET", "POST", "PUT", "PATCH", "OPTIONS"], supports_credentials=True,
+         max_age=CORS_MAX_AGE, expose_headers=["X-Next-Cursor", "Link", "X-Request-ID", "Retry-After"])
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
+
+    # Registered after the metrics, log and rate limit hooks, so preflights are still counted and logged
+    @app.before_request
+    def answer_preflight():
+        """Answer OPTIONS for every known route here; flask-cors adds the Access-Control-* headers"""
+        req = request._get_current_object()
+        if req.method == 'OPTIONS' and req.url_rule is not None:
+            return app.response_class(status=204)
+
+    endpoints = sorted(
+        f"{method:<5}{rule.rule}"
+        for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+        for method in rule.methods - {'HEAD', 'OPTIONS'}
+    )
+    test_response = Template({
+        "status": "success",
+        "service": "RadSafe API Gateway",
+        "message": "✅ API is fully operational",
+        "available_endpoints": endpoints + ["GET  /api/test"],
+        "timestamp": None
+    }, 'timestamp')
+
+    @app.route('/api/test', methods=['GET'])
+    def test():
+        return Response(test_response.render(timestamp=datetime.now().isoformat()), mimetype='application/json')
+
+    @app.route('/')
+    def home():
+        return redirect('/api/test')
+
+    return app
+
+
+app = create_app()
+
+
+# ========== WORKER PROCESSES ==========
+def prefork(workers):
+    """Called by launcher.py before forking; the storage layer is database.py's"""
+    database.prefork(workers)
+
+
+def postfork():
+    database.postfork()
+
+
+# ========== MAIN ==========
+if __name__ == '__main__':
+    print("=" * 60)
+    print("🛰️  RADSAFE API GATEWAY")
+    print("=" * 60)
+
+    database.init_database()
+    database.password_hasher.start()
+
+    print(f"🌐 Server starting on: http://localhost:{PORT}")
+    print(f"🧪 Test: http://localhost:{PORT}/api/test")
+    print("=" * 60)
+    print("Press Ctrl+C to stop\n")
+
+    try:
+        app.run(host='0.0.0.0', port=PORT, debug=False, threaded=True)
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped")
+    finally:
+        database.repo.close()
+        database.readings_store.close()
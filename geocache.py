@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org/search'
+
+_caches = weakref.WeakSet()
+
+
+def nominatim_resolver(query, timeout=5.0):
+    """Look a place up on OpenStreetMap Nominatim -> (lat, lng), or None if it is unknown"""
+    import requests
+
+    response = requests.get(NOMINATIM_URL, params={'format': 'json', 'q': query, 'limit': 1},
+                            headers={'User-Agent': 'RadSafe-Smart-Monitor/1.0'}, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    if not data:
+        return None
+    return float(data[0]['lat']), float(data[0]['lon'])
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+class GeocodeCache:
+    """LRU + TTL cache in front of a geocoding resolver, persisted to SQLite
+
+    "Not found" answers are cached for `negative_ttl`; concurrent misses for
+    the same query share one resolver call. Resolver errors are not cached.
+    """
+
+    def __init__(self, resolver=nominatim_resolver, path=None, max_entries=10000,
+                 ttl=7 * 86400, negative_ttl=3600):
+        self.resolver = resolver
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # query -> (coordinates or None, expires_at)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.path = path
+        self._db = None
+        self._db_lock = threading.Lock()
+        if path:
+            with self._db_lock:
+                self._connect()
+        _caches.add(self)
+
+    def _connect(self):
+        """The SQLite connection, opened on first use in this process; hold `_db_lock`"""
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS geocode "
+                             "(query TEXT PRIMARY KEY, lat REAL, lng REAL, expires_at REAL NOT NULL)")
+            self._db.execute("DELETE FROM geocode WHERE expires_at < ?", (time.time(),))
+        return self._db
+
+    def _after_fork(self):
+        # A preloading launcher forks after the module-level cache opened SQLite; the
+        # connection must not be used across fork(), so the child opens its own
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def lookup(self, query):
+        """(lat, lng) for a place name, or None if the resolver doesn't know it"""
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                return entry[0]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = {"done": threading.Event(), "result": None, "error": None}
+
+        if not leader:
+            flight["done"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            return flight["result"]
+
+        try:
+            found, result, expires_at = self._load(key, now)
+            if not found:
+                result = self.resolver(query)
+                expires_at = now + (self.ttl if result is not None else self.negative_ttl)
+                self._store(key, result, expires_at)
+            self._remember(key, result, expires_at)
+            flight["result"] = result
+            return result
+        except Exception as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight["done"].set()
+
+    def _remember(self, key, result, expires_at):
+        with self._lock:
+            self._entries[key] = (result, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, key, now):
+        if not self.path:
+            return False, None, None
+        with self._db_lock:
+            row = self._connect().execute("SELECT lat, lng, expires_at FROM geocode WHERE query = ?", (key,)).fetchone()
+        if row is None or row[2] <= now:
+            return False, None, None
+        return True, ((row[0], row[1]) if row[0] is not None else None), row[2]
+
+    def _store(self, key, result, expires_at):
+        if not self.path:
+            return
+        lat, lng = result if result is not None else (None, None)
+        with self._db_lock:
+            self._connect().execute("INSERT OR REPLACE INTO geocode (query, lat, lng, expires_at) VALUES (?, ?, ?, ?)",
+                             (key, lat, lng, expires_at))
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: [cache._after_fork() for cache in list(_caches)])
@@ -0,0 +1,106 @@
+import functools
+import hashlib
+import os
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+
+from flask import current_app, make_response, request
+
+# Conditional GET and a response cache for read endpoints backed by repository collections
+
+_caches = weakref.WeakSet()
+
+
+class ResponseCache:
+    """Response bodies keyed by path + query string, valid while their collections' versions hold
+
+    The ETag is derived from the key and the versions alone, so a client
+    revalidating an unchanged list costs one comparison and no serialization.
+    With a repository whose versions are shared (SQLite) every worker process
+    computes the same ETag; otherwise ETags carry a per-process prefix and a
+    304 needs the request to reach the worker that issued the tag.
+    """
+
+    def __init__(self, repo, max_entries=1024, max_body_bytes=1024 * 1024):
+        self.repo = repo
+        self.max_entries = max_entries
+        self.max_body_bytes = max_body_bytes
+        self.boot = self._boot()
+        self._entries = OrderedDict()   # key -> (etag, body, headers)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        _caches.add(self)
+
+    def _after_fork(self):
+        self.boot = self._boot()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _boot(self):
+        # Process-local versions restart with the process and diverge after fork(),
+        # so ETags from another run or worker must never match
+        return "shared" if self.repo.shared_versions else uuid.uuid4().hex[:8]
+
+    def etag(self, key, versions):
+        digest = hashlib.blake2b(repr((key, versions)).encode('utf-8'), digest_size=8).hexdigest()
+        return f"{self.boot}-{digest}"
+
+    def cached(self, *collections, max_age=0):
+        """Decorator for GET views whose JSON depends only on the URL and `collections`"""
+        cache_control = f"private, max-age={max_age}" if max_age else "no-cache"
+
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET':
+                    return view(*args, **kwargs)
+                key = (request.path, request.query_string)
+                versions = tuple(self.repo.version(name) for name in collections)
+                etag = self.etag(key, versions)
+
+                if request.if_none_match.contains(etag):
+                    self.not_modified += 1
+                    response = current_app.response_class(status=304)
+                else:
+                    with self._lock:
+                        entry = self._entries.get(key)
+                        if entry is not None and entry[0] == etag:
+                            self._entries.move_to_end(key)
+                    if entry is not None and entry[0] == etag:
+                        self.hits += 1
+                        response = current_app.response_class(entry[1], headers=entry[2])
+                    else:
+                        self.misses += 1
+                        response = self._store(key, etag, view(*args, **kwargs))
+                if response.status_code in (200, 304):
+                    response.set_etag(etag)
+                    response.headers['Cache-Control'] = cache_control
+                return response
+            return wrapper
+        return decorator
+
+    def _store(self, key, etag, result):
+        response = make_response(result)
+        if response.status_code != 200 or response.is_streamed or response.mimetype != 'application/json':
+            return response
+        body = response.get_data()
+        if len(body) <= self.max_body_bytes:
+            with self._lock:
+                headers = [(k, v) for k, v in response.headers.items() if k.lower() != 'content-length']
+                self._entries[key] = (etag, body, headers)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: [cache._after_fork() for cache in list(_caches)])
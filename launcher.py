@@ -0,0 +1,348 @@
+import argparse
+import importlib
+import json
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+
+import logs
+
+# Pre-fork launcher: the master loads the app once, forks WORKERS processes that each serve it
+# with a threaded WSGI server, restarts workers that exit or stop sending heartbeats, and
+# replaces them one at a time on SIGHUP. With SO_REUSEPORT every worker has its own listening
+# socket and the kernel spreads connections over them; otherwise the workers share one socket.
+#
+#   RADSAFE_STORAGE=sqlite python launcher.py database --workers 4
+#   kill -HUP <master pid>     rolling restart (picks up new code with --no-preload)
+#   kill -TERM <master pid>    graceful stop
+
+APPS = {
+    # name -> (module, default port)
+    'database': ('database', 3002),
+    'backend': ('clean_backend', 8000),
+    'search': ('flask_app', 8000),
+    'gateway': ('gateway', 8000),
+}
+WORKERS = int(os.environ.get('RADSAFE_WORKERS', str(os.cpu_count() or 1)))
+# A worker whose serving loop hasn't checked in for WORKER_TIMEOUT seconds is killed and replaced
+WORKER_TIMEOUT = float(os.environ.get('RADSAFE_WORKER_TIMEOUT', '30'))
+# Time a stopping worker gets to finish in-flight requests before it is killed
+GRACEFUL_TIMEOUT = float(os.environ.get('RADSAFE_GRACEFUL_TIMEOUT', '30'))
+# Optional JSON file with the state of every worker, rewritten every second
+STATUS_FILE = os.environ.get('RADSAFE_LAUNCHER_STATUS')
+BACKLOG = 1024
+KEEPALIVE_TIMEOUT = 15
+HEARTBEAT_SECONDS = 0.5
+
+log = logs.get_logger('launcher')
+
+
+# ========== WORKER ==========
+class QuietHandler(WSGIRequestHandler):
+    """Keep-alive handler without werkzeug's per-request stderr line (the apps log through logs.py)"""
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        if self.server.stopping:
+            self.close_connection = True
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class WorkerServer(ThreadedWSGIServer):
+    """Threaded WSGI server that touches its heartbeat file from the accept loop and drains on shutdown"""
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, sock, app, heartbeat):
+        self.heartbeat = heartbeat
+        self.stopping = False
+        host, port = sock.getsockname()[:2]
+        super().__init__(host, port, app, handler=QuietHandler, fd=sock.fileno())
+
+    def service_actions(self):
+        super().service_actions()
+        os.utime(self.heartbeat)
+
+    def stop(self):
+        self.stopping = True
+        threading.Thread(target=self.shutdown, name="worker-shutdown", daemon=True).start()
+
+
+def listen(host, port, reuse_port):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(BACKLOG)
+    return sock
+
+
+# ========== MASTER ==========
+class Worker:
+    def __init__(self, pid, heartbeat, generation):
+        self.pid = pid
+        self.heartbeat = heartbeat
+        self.generation = generation
+        self.started = time.time()
+        self.stopping_since = None
+
+    def heartbeat_age(self):
+        try:
+            return time.time() - os.stat(self.heartbeat).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def ready(self):
+        try:
+            return os.stat(self.heartbeat).st_mtime > self.started
+        except FileNotFoundError:
+            return False
+
+
+class Launcher:
+    def __init__(self, name, host, port, workers, preload=True, reuse_port=True):
+        self.name = name
+        self.module_name = APPS[name][0]
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.preload = preload
+        self.reuse_port = reuse_port and hasattr(socket, 'SO_REUSEPORT')
+        self.module = None
+        self.sock = None
+        self.children = {}      # pid -> Worker
+        self.generation = 0
+        self.spawned = 0
+        self.restarts = 0
+        self.stopping = False
+        self.reloading = False
+        self.spawn_after = 0.0
+        self.heartbeat_dir = None
+
+    def load(self):
+        """Import the app module and run its prefork() hook, if any"""
+        module = importlib.import_module(self.module_name)
+        if hasattr(module, 'prefork'):
+            module.prefork(self.workers)
+        return module
+
+    # ========== LIFECYCLE ==========
+    def run(self):
+        if self.preload:
+            self.module = self.load()
+        if self.reuse_port:
+            # Fail before forking if the port can't be bound; each worker binds its own socket
+            listen(self.host, self.port, True).close()
+        else:
+            self.sock = listen(self.host, self.port, False)
+        self.heartbeat_dir = tempfile.mkdtemp(prefix='radsafe-launcher-')
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+
+        log.info("launcher started", extra={"app": self.name, "port": self.port, "workers": self.workers,
+                                            "preload": self.preload, "reuse_port": self.reuse_port})
+        try:
+            while not self.stopping:
+                self.reap()
+                if self.reloading:
+                    self.reloading = False
+                    self.rolling_restart()
+                self.check_heartbeats()
+                while len(self.active()) < self.workers and not self.stopping and time.time() >= self.spawn_after:
+                    self.spawn()
+                self.write_status()
+                time.sleep(HEARTBEAT_SECONDS)
+        finally:
+            self.stop_all()
+            shutil.rmtree(self.heartbeat_dir, ignore_errors=True)
+            log.info("launcher stopped", extra={"app": self.name})
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_reload(self, signum, frame):
+        self.reloading = True
+
+    def active(self):
+        return [w for w in self.children.values() if w.stopping_since is None]
+
+    def spawn(self):
+        self.spawned += 1
+        heartbeat = os.path.join(self.heartbeat_dir, f"worker-{self.spawned}")
+        open(heartbeat, 'w').close()
+        os.utime(heartbeat, (0, 0))
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self.serve(heartbeat)
+            except BaseException:
+                log.exception("worker failed", extra={"app": self.name})
+                code = 1
+            finally:
+                logs.stop()
+                os._exit(code)
+        self.children[pid] = Worker(pid, heartbeat, self.generation)
+        log.info("worker spawned", extra={"worker_pid": pid, "generation": self.generation})
+        return self.children[pid]
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.children.pop(pid, None)
+            if worker is None:
+                continue
+            if os.path.exists(worker.heartbeat):
+                os.remove(worker.heartbeat)
+            if worker.stopping_since is None and not self.stopping:
+                self.restarts += 1
+                if time.time() - worker.started < 5:
+                    # Crashing on startup: don't fork in a tight loop
+                    self.spawn_after = time.time() + 1.0
+                log.warning("worker exited", extra={"worker_pid": pid, "exit_status": os.waitstatus_to_exitcode(status)})
+
+    def check_heartbeats(self):
+        now = time.time()
+        for worker in list(self.children.values()):
+            if worker.stopping_since is not None:
+                if now - worker.stopping_since > GRACEFUL_TIMEOUT:
+                    self.kill(worker.pid, signal.SIGKILL)
+                continue
+            age = worker.heartbeat_age()
+            if worker.ready() and age is not None and age > WORKER_TIMEOUT:
+                log.error("worker unresponsive", extra={"worker_pid": worker.pid, "heartbeat_age": round(age, 1)})
+                self.kill(worker.pid, signal.SIGKILL)
+            elif not worker.ready() and now - worker.started > WORKER_TIMEOUT + 60:
+                log.error("worker never became ready", extra={"worker_pid": worker.pid})
+                self.kill(worker.pid, signal.SIGKILL)
+
+    def rolling_restart(self):
+        """Replace the workers one at a time, each only after its replacement is serving"""
+        self.generation += 1
+        log.info("reloading", extra={"generation": self.generation})
+        for old in [w for w in self.active() if w.generation < self.generation]:
+            new = self.spawn()
+            deadline = time.time() + WORKER_TIMEOUT
+            while not new.ready() and new.pid in self.children and time.time() < deadline and not self.stopping:
+                time.sleep(0.05)
+                self.reap()
+            if not new.ready():
+                log.error("replacement worker failed to start; keeping the old ones", extra={"worker_pid": new.pid})
+                return
+            self.retire(old)
+
+    def retire(self, worker):
+        worker.stopping_since = time.time()
+        self.kill(worker.pid, signal.SIGTERM)
+
+    def kill(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def stop_all(self):
+        for worker in self.active():
+            self.retire(worker)
+        deadline = time.time() + GRACEFUL_TIMEOUT
+        while self.children and time.time() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        for pid in list(self.children):
+            self.kill(pid, signal.SIGKILL)
+        while self.children:
+            self.reap()
+            time.sleep(0.05)
+
+    def write_status(self):
+        if not STATUS_FILE:
+            return
+        now = time.time()
+        status = {
+            "app": self.name,
+            "master_pid": os.getpid(),
+            "port": self.port,
+            "generation": self.generation,
+            "restarts": self.restarts,
+            "updated": datetime.now().isoformat(),
+            "workers": [{
+                "pid": w.pid,
+                "generation": w.generation,
+                "uptime_seconds": round(now - w.started, 1),
+                "heartbeat_age_seconds": round(w.heartbeat_age(), 1) if w.ready() else None,
+                "state": "stopping" if w.stopping_since else "serving" if w.ready() else "starting",
+            } for w in self.children.values()],
+        }
+        tmp_path = STATUS_FILE + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(status, f, indent=2)
+        os.replace(tmp_path, STATUS_FILE)
+
+    # ========== IN THE WORKER ==========
+    def serve(self, heartbeat):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)     # Ctrl+C reaches the master, which stops us
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        module = self.module or self.load()
+        if hasattr(module, 'postfork'):
+            module.postfork()
+        sock = self.sock or listen(self.host, self.port, True)
+        server = WorkerServer(sock, module.app, heartbeat)
+        sock.close()  # the server holds its own descriptor
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+        log.info("worker serving", extra={"app": self.name, "port": self.port})
+        server.serve_forever(poll_interval=HEARTBEAT_SECONDS)
+        log.info("worker stopped", extra={"app": self.name})
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a RadSafe app in pre-forked worker processes")
+    parser.add_argument('app', choices=sorted(APPS))
+    parser.add_argument('--workers', type=int, default=WORKERS, help="worker processes (default: %(default)s)")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, help="default: the app's usual port")
+    parser.add_argument('--no-preload', dest='preload', action='store_false',
+                        help="load the app in each worker instead of once before forking")
+    parser.add_argument('--no-reuse-port', dest='reuse_port', action='store_false',
+                        help="share one listening socket instead of one SO_REUSEPORT socket per worker")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    if not hasattr(os, 'fork'):
+        print("❌ The launcher needs fork(); run the app directly on this platform")
+        sys.exit(1)
+    args = parse_args()
+    launcher = Launcher(args.app, args.host, args.port or APPS[args.app][1], max(1, args.workers),
+                        preload=args.preload, reuse_port=args.reuse_port)
+    print("=" * 60)
+    print(f"🚀 RADSAFE LAUNCHER: {args.app} on http://{args.host}:{launcher.port}")
+    print(f"👷 Workers: {launcher.workers} ({'preloaded' if args.preload else 'loaded per worker'}, "
+          f"{'SO_REUSEPORT' if launcher.reuse_port else 'shared socket'})")
+    print(f"🔁 Reload: kill -HUP {os.getpid()}    🛑 Stop: kill -TERM {os.getpid()}")
+    print("=" * 60)
+    try:
+        launcher.run()
+    except Exception as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,241 @@
+import atexit
+import contextvars
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from fastjson import dumps_text
+from metrics import REGISTRY
+
+# JSON-lines logging: callers only enqueue records, one background thread formats and
+# writes them, and a full queue drops records instead of blocking the request
+
+# RADSAFE_LOG_LEVEL applies to every radsafe.* logger; RADSAFE_LOG_LEVELS overrides single
+# loggers ("access=WARNING,sensors=DEBUG"); RADSAFE_LOG_SAMPLE sets the share of requests
+# logged per route ("/api/radiation/current=0.05"); warnings and errors are always kept
+LOG_LEVEL = os.environ.get('RADSAFE_LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.environ.get('RADSAFE_LOG_LEVELS', '')
+LOG_SAMPLE = os.environ.get('RADSAFE_LOG_SAMPLE', '')
+LOG_QUEUE_SIZE = int(os.environ.get('RADSAFE_LOG_QUEUE_SIZE', '10000'))
+LOG_FILE = os.environ.get('RADSAFE_LOG_FILE')   # stdout when unset
+
+DEFAULT_SAMPLE_RATES = {
+    '/api/radiation/current': 0.1,
+    '/api/proximity/status': 0.1,
+    '/api/health': 0.01,
+    '/metrics': 0.01,
+}
+
+LOG_DROPPED = REGISTRY.counter('radsafe_log_records_dropped_total', 'Log records dropped because the queue was full')
+
+# Attributes every LogRecord has; anything else came in through `extra=` and becomes a JSON field
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+_ID_PREFIX = uuid.uuid4().hex[:6]
+_ids = itertools.count(1)
+_current = contextvars.ContextVar('radsafe_request', default=None)
+_setup_lock = threading.Lock()
+_listener = None
+_handler = None
+
+
+def parse_pairs(text, convert):
+    """'a=1,b=2' -> {'a': convert('1'), 'b': convert('2')}"""
+    pairs = {}
+    for item in text.split(','):
+        name, sep, value = item.partition('=')
+        if sep and name.strip():
+            pairs[name.strip()] = convert(value.strip())
+    return pairs
+
+
+SAMPLE_RATES = {**DEFAULT_SAMPLE_RATES, **parse_pairs(LOG_SAMPLE, float)}
+
+
+# ========== FORMATTING ==========
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and the record's extra fields"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return dumps_text(entry)
+
+
+# ========== REQUEST CONTEXT ==========
+class RequestContext:
+    __slots__ = ('request_id', 'sampled', 'sample_rate', 'start')
+
+    def __init__(self, request_id, sampled, sample_rate):
+        self.request_id = request_id
+        self.sampled = sampled
+        self.sample_rate = sample_rate
+        self.start = time.perf_counter()
+
+
+def new_request_id():
+    return f"{_ID_PREFIX}-{next(_ids):x}"
+
+
+def begin_request(route, request_id=None):
+    """Open the logging context of one request; the sampling decision covers all of its records"""
+    rate = SAMPLE_RATES.get(route, 1.0)
+    sampled = rate >= 1.0 or random.random() < rate
+    context = RequestContext(request_id[:64] if request_id else new_request_id(), sampled, rate)
+    return context, _current.set(context)
+
+
+def end_request(context, token, app, method, path, route, status, **fields):
+    """Write the access record of a request and close its context"""
+    try:
+        duration_ms = round((time.perf_counter() - context.start) * 1000, 3)
+        ACCESS.log(logging.ERROR if status >= 500 else logging.INFO, "request", extra={
+            "app": app, "method": method, "path": path, "route": route, "status": status,
+            "duration_ms": duration_ms, **fields
+        })
+    finally:
+        _current.reset(token)
+
+
+class RequestFilter(logging.Filter):
+    """Stamps records with the current request id and drops unsampled requests' info/debug records"""
+
+    def filter(self, record):
+        context = _current.get()
+        if context is not None:
+            if not context.sampled and record.levelno < logging.WARNING:
+                return False
+            record.request_id = context.request_id
+            if context.sample_rate < 1.0:
+                record.sample_rate = context.sample_rate
+        return True
+
+
+# ========== PIPELINE ==========
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never waits: records are queued as-is and dropped when the queue is full"""
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread; the record isn't pickled, so it needs no copy
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+class Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # The queue may be full at shutdown; the listener is still draining it
+        self.queue.put(self._sentinel, timeout=5)
+
+
+def setup():
+    """Route radsafe.* loggers through the queue to one writer thread (idempotent)"""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+        records = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        if LOG_FILE:
+            output = logging.FileHandler(LOG_FILE, encoding='utf-8')
+        else:
+            output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter())
+        _handler = handler = DroppingQueueHandler(records)
+        handler.addFilter(RequestFilter())
+
+        root = logging.getLogger('radsafe')
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(handler)
+        root.propagate = False
+        for name, level in parse_pairs(LOG_LEVELS, str.upper).items():
+            logging.getLogger(f'radsafe.{name}').setLevel(level)
+
+        _listener = Listener(records, output)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def stop():
+    """Write out queued records and stop the writer thread"""
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        atexit.unregister(_listener.stop)
+        _listener.stop()
+        _listener = None
+        logging.getLogger('radsafe').removeHandler(_handler)
+
+
+def _after_fork():
+    # The writer thread doesn't survive fork(); the child gets a fresh queue and its own writer
+    global _listener, _setup_lock
+    _setup_lock = threading.Lock()
+    if _listener is None:
+        return
+    atexit.unregister(_listener.stop)
+    records = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _handler.queue = records
+    _listener = Listener(records, *_listener.handlers)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def get_logger(name):
+    setup()
+    return logging.getLogger(f'radsafe.{name}')
+
+
+ACCESS = get_logger('access')
+
+
+# ========== FLASK ==========
+def log_requests(app, name):
+    """Access log with request id and duration for every request of a Flask app; echoes X-Request-ID"""
+    from flask import request
+
+    @app.before_request
+    def open_request_log():
+        req = request._get_current_object()
+        rule = req.url_rule
+        req.environ['radsafe.log'] = begin_request(rule.rule if rule is not None else '<unmatched>',
+                                                   req.headers.get('X-Request-ID'))
+
+    @app.after_request
+    def close_request_log(response):
+        req = request._get_current_object()
+        opened = req.environ.pop('radsafe.log', None)
+        if opened is not None:
+            context, token = opened
+            rule = req.url_rule
+            response.headers['X-Request-ID'] = context.request_id
+            end_request(context, token, name, req.method, req.path, rule.rule if rule is not None else '<unmatched>',
+                        response.status_code, remote=req.remote_addr)
+        return response
+
+    return app
@@ -0,0 +1,252 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# In-process metrics rendered in the Prometheus text exposition format
+
+PROCESS_START = time.time()
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}   # label values tuple -> value
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class CallbackGauge(Metric):
+    """Gauge read at scrape time; `callback()` returns a number, or {label values tuple: number}"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, callback, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def render(self):
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        values = value if isinstance(value, dict) else {(): value}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labels, number in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(number)}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), then sum
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[i] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', _number(bound))])} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(state[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def callback_gauge(self, name, documentation, callback, labelnames=()):
+        with self._lock:
+            # Re-registering replaces the callback (e.g. a re-created repository)
+            metric = self._metrics[name] = CallbackGauge(name, documentation, callback, labelnames)
+            return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+class HttpMetrics:
+    """Request, error, latency and in-flight metrics for every app, updated together under one lock"""
+
+    def __init__(self, registry):
+        self._lock = threading.Lock()
+        self.requests = registry.counter('radsafe_http_requests_total', 'HTTP requests served',
+                                         ('app', 'method', 'route', 'status'))
+        self.errors = registry.counter('radsafe_http_errors_total', 'HTTP requests answered with a 5xx status',
+                                       ('app', 'route'))
+        self.latency = registry.histogram('radsafe_http_request_duration_seconds',
+                                          'Time spent handling HTTP requests', ('app', 'method', 'route'))
+        self.in_flight = registry.gauge('radsafe_http_requests_in_flight', 'HTTP requests being handled', ('app',))
+        for metric in (self.requests, self.errors, self.latency, self.in_flight):
+            metric._lock = self._lock
+
+    def start(self, app):
+        with self._lock:
+            values = self.in_flight._values
+            values[(app,)] = values.get((app,), 0) + 1
+
+    def finish(self, app, method, route, status, elapsed):
+        i = bisect_left(self.latency.buckets, elapsed)
+        with self._lock:
+            values = self.in_flight._values
+            values[(app,)] = values.get((app,), 0) - 1
+            key = (app, method, route, status)
+            values = self.requests._values
+            values[key] = values.get(key, 0) + 1
+            key = (app, method, route)
+            state = self.latency._values.get(key)
+            if state is None:
+                state = self.latency._values[key] = [0] * (len(self.latency.buckets) + 1) + [0.0]
+            state[i] += 1
+            state[-1] += elapsed
+            if status >= 500:
+                key = (app, route)
+                self.errors._values[key] = self.errors._values.get(key, 0) + 1
+
+
+REGISTRY = Registry()
+HTTP = HttpMetrics(REGISTRY)
+
+STORAGE_SECONDS = REGISTRY.histogram('radsafe_storage_operation_seconds',
+                                     'Time spent loading, syncing and compacting the database', ('operation',))
+READINGS_INGESTED = REGISTRY.counter('radsafe_readings_ingested_total', 'Sensor readings accepted')
+READINGS_REJECTED = REGISTRY.counter('radsafe_readings_rejected_total', 'Sensor readings rejected by validation')
+INGEST_BATCH_SECONDS = REGISTRY.histogram('radsafe_ingest_batch_seconds', 'Time spent storing one batch of readings')
+REGISTRY.callback_gauge('radsafe_process_start_time_seconds', 'Start time of the process in epoch seconds',
+                        lambda: PROCESS_START)
+REGISTRY.callback_gauge('radsafe_process_uptime_seconds', 'Seconds since the process started',
+                        lambda: round(time.time() - PROCESS_START, 3))
+
+
+def file_size(*paths):
+    """Total size in bytes of the paths that exist"""
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+def uptime():
+    return time.time() - PROCESS_START
+
+
+# ========== FLASK ==========
+def instrument(app, name):
+    """Record latency, status and in-flight requests for every route of a Flask app and serve /metrics"""
+    from flask import request
+
+    @app.before_request
+    def start_timer():
+        request.environ['radsafe.start'] = time.perf_counter()
+        HTTP.start(name)
+
+    @app.after_request
+    def stop_timer(response):
+        # Also runs for the 500 response Flask builds from an unhandled exception
+        req = request._get_current_object()  # one context lookup instead of one per attribute
+        start = req.environ.pop('radsafe.start', None)
+        if start is not None:
+            rule = req.url_rule
+            HTTP.finish(name, req.method, rule.rule if rule is not None else '<unmatched>',
+                        response.status_code, time.perf_counter() - start)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return app.response_class(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+    return app
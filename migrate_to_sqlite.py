@@ -0,0 +1,52 @@
+import os
+import sys
+
+from repository import COLLECTIONS, JsonRepository, SqliteRepository
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def migrate(json_path, sqlite_path):
+    """Copy every collection of a radsafe_database.json (plus its log) into SQLite, keeping ids"""
+    # Opening a missing file would start an empty store and "migrate" nothing
+    if not os.path.exists(json_path):
+        raise FileNotFoundError(f"{json_path} does not exist")
+    source = JsonRepository(json_path).open()
+    target = SqliteRepository(sqlite_path).open()
+    counts = {}
+    try:
+        with target.transaction():
+            conn = target._connection()
+            for name in COLLECTIONS:
+                if target.count(name):
+                    raise RuntimeError(f"Table '{name}' in {sqlite_path} is not empty")
+                items = source.all(name)
+                for record in items:
+                    target.insert(name, dict(record))
+                counts[name] = len(items)
+                # Carry the id counter over so ids are never reused
+                counter = source.store.counters.get(name, 0)
+                if counter:
+                    conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (counter, name))
+                    conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT ?, ? "
+                                 "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)",
+                                 (name, counter, name))
+    finally:
+        source.close()
+        target.close()
+    return counts
+
+
+if __name__ == '__main__':
+    json_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(HERE, 'radsafe_database.json')
+    sqlite_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(HERE, 'radsafe.db')
+
+    print(f"📦 Migrating {json_path} -> {sqlite_path}")
+    try:
+        counts = migrate(json_path, sqlite_path)
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+    for name, count in counts.items():
+        print(f"✅ {name}: {count} records")
+    print("👉 Now run: RADSAFE_STORAGE=sqlite python database.py")
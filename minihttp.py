@@ -0,0 +1,320 @@
+import queue
+import selectors
+import socket
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from fastjson import dumps, loads
+from logs import begin_request, end_request, get_logger
+
+# Minimal HTTP/1.1 framing and a pooled keep-alive server for the raw-socket endpoints
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+log = get_logger('minihttp')
+
+REASONS = {
+    200: 'OK', 201: 'Created', 204: 'No Content', 304: 'Not Modified',
+    400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 408: 'Request Timeout',
+    411: 'Length Required', 413: 'Payload Too Large', 431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error', 501: 'Not Implemented', 503: 'Service Unavailable',
+}
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or REASONS.get(status, 'Error'))
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, target, version, headers):
+        self.method = method
+        self.version = version
+        self.headers = headers
+        parts = urlsplit(target)
+        self.path = parts.path or '/'
+        self.args = dict(parse_qsl(parts.query))
+        self.body = b''
+
+    @property
+    def content_length(self):
+        if 'transfer-encoding' in self.headers:
+            raise HttpError(501, "Chunked request bodies are not supported")
+        try:
+            length = int(self.headers.get('content-length', 0))
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HttpError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413)
+        return length
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    def json(self):
+        try:
+            return loads(self.body) if self.body else None
+        except ValueError:
+            raise HttpError(400, "Invalid JSON body")
+
+
+def parse_head(head):
+    """Request line and headers (everything before the blank line) -> Request"""
+    try:
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, version = lines[0].split(' ')
+    except (UnicodeDecodeError, ValueError):
+        raise HttpError(400, "Malformed request line")
+    if not version.startswith('HTTP/1.'):
+        raise HttpError(400, "Unsupported HTTP version")
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise HttpError(400, "Malformed header")
+        headers[name.strip().lower()] = value.strip()
+    return Request(method.upper(), target, version, headers)
+
+
+def response_bytes(status, body=b'', content_type='application/json', keep_alive=True, headers=None):
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}"]
+    if content_type:
+        lines.append(f"Content-Type: {content_type}")
+    lines.append(f"Content-Length: {len(body)}")
+    lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+    for name, value in {**CORS_HEADERS, **(headers or {})}.items():
+        lines.append(f"{name}: {value}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body
+
+
+def json_response(status, data, keep_alive=True, headers=None):
+    """`data` is JSON-encoded unless it already is JSON bytes"""
+    body = data if isinstance(data, bytes) else dumps(data)
+    return response_bytes(status, body, keep_alive=keep_alive, headers=headers)
+
+
+def error_response(error, keep_alive=False):
+    return json_response(error.status, {'error': str(error)}, keep_alive=keep_alive)
+
+
+# ========== THREAD POOL SERVER ==========
+class Connection:
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.buffer = b''
+        self.last_active = time.monotonic()
+        self.requests = 0
+
+
+class ThreadPoolServer:
+    """Keep-alive HTTP server: one selector thread watches idle sockets, a fixed pool serves requests
+
+    `handler(request)` returns `(status, data)` (data is JSON-encoded unless it is bytes) or
+    `(status, data, headers)`; every request is access-logged under `name`. A burst of connections waits in the listen
+    backlog and the bounded work queue instead of spawning a thread each.
+    """
+
+    def __init__(self, handler, host='0.0.0.0', port=8000, workers=16, backlog=1024, queue_size=4096,
+                 keepalive_timeout=15.0, request_timeout=10.0, max_requests_per_connection=1000, name='minihttp'):
+        self.handler = handler
+        self.name = name
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.backlog = backlog
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self.max_requests_per_connection = max_requests_per_connection
+        self._work = queue.Queue(maxsize=queue_size)
+        self._returned = queue.SimpleQueue()
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._running = False
+        self._threads = []
+        self.sock = None
+
+    def serve_forever(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(self.backlog)
+        self.sock.setblocking(False)
+        self._selector.register(self.sock, selectors.EVENT_READ, 'accept')
+        self._wake_r.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, 'wake')
+
+        self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"http-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        last_sweep = time.monotonic()
+        try:
+            while self._running:
+                for key, _ in self._selector.select(timeout=1.0):
+                    if key.data == 'accept':
+                        self._accept()
+                    elif key.data == 'wake':
+                        self._rearm()
+                    else:
+                        # Readable keep-alive socket: hand it to the pool until its request is answered
+                        self._selector.unregister(key.fileobj)
+                        self._work.put(key.data)
+                if time.monotonic() - last_sweep >= 1.0:
+                    self._close_idle()
+                    last_sweep = time.monotonic()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self._running = False
+        for _ in self._threads:
+            self._work.put(None)
+        for key in list(self._selector.get_map().values()):
+            if isinstance(key.data, Connection):
+                key.data.sock.close()
+        if self.sock is not None:
+            self.sock.close()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, address = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(self.request_timeout)
+            self._selector.register(sock, selectors.EVENT_READ, Connection(sock, address))
+
+    def _rearm(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                connection = self._returned.get_nowait()
+            except queue.Empty:
+                return
+            connection.last_active = time.monotonic()
+            self._selector.register(connection.sock, selectors.EVENT_READ, connection)
+
+    def _close_idle(self):
+        cutoff = time.monotonic() - self.keepalive_timeout
+        for key in list(self._selector.get_map().values()):
+            if isinstance(key.data, Connection) and key.data.last_active < cutoff:
+                self._selector.unregister(key.fileobj)
+                key.data.sock.close()
+
+    def _worker(self):
+        while True:
+            connection = self._work.get()
+            if connection is None:
+                return
+            try:
+                keep_open = self._serve(connection)
+            except Exception as e:
+                log.warning("connection error", extra={"server": self.name, "error": str(e)})
+                keep_open = False
+            if keep_open:
+                self._returned.put(connection)
+                self._wake_w.send(b'\0')
+            else:
+                connection.sock.close()
+
+    def _serve(self, connection):
+        """Answer every complete request available on the socket; True to keep it open"""
+        while True:
+            try:
+                request = self._read_request(connection)
+            except HttpError as e:
+                connection.sock.sendall(error_response(e))
+                return False
+            except (socket.timeout, ConnectionError):
+                return False
+            if request is None:
+                return False
+            connection.requests += 1
+            keep_alive = request.keep_alive and connection.requests < self.max_requests_per_connection
+            connection.sock.sendall(self._respond(request, keep_alive))
+            if not keep_alive:
+                return False
+            if b"\r\n\r\n" not in connection.buffer:
+                # Nothing pipelined; go back to the selector rather than block this worker
+                return True
+
+    def _read_request(self, connection):
+        # request_timeout bounds the whole request, not each recv(): a client trickling
+        # a byte at a time would otherwise hold a pool worker indefinitely
+        deadline = time.monotonic() + self.request_timeout
+        try:
+            while b"\r\n\r\n" not in connection.buffer:
+                if len(connection.buffer) > MAX_HEADER_BYTES:
+                    raise HttpError(431)
+                chunk = self._recv(connection.sock, 65536, deadline)
+                if not chunk:
+                    return None
+                connection.buffer += chunk
+            head, _, rest = connection.buffer.partition(b"\r\n\r\n")
+            request = parse_head(head)
+            length = request.content_length
+            while len(rest) < length:
+                chunk = self._recv(connection.sock, max(65536, length - len(rest)), deadline)
+                if not chunk:
+                    return None
+                rest += chunk
+        finally:
+            connection.sock.settimeout(self.request_timeout)
+        request.body = rest[:length]
+        connection.buffer = rest[length:]
+        return request
+
+    @staticmethod
+    def _recv(sock, size, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise HttpError(408)
+        sock.settimeout(remaining)
+        try:
+            return sock.recv(size)
+        except socket.timeout:
+            raise HttpError(408)
+
+    def _respond(self, request, keep_alive):
+        if request.method == 'OPTIONS':
+            return response_bytes(204, content_type=None, keep_alive=keep_alive,
+                                  headers={'Access-Control-Max-Age': '86400'})
+        context, token = begin_request(request.path, request.headers.get('x-request-id'))
+        status = 500
+        try:
+            status, data, *extra = self.handler(request)
+            headers = {**(extra[0] if extra else {}), 'X-Request-ID': context.request_id}
+            return json_response(status, data, keep_alive, headers=headers)
+        except HttpError as e:
+            status = e.status
+            return error_response(e, keep_alive)
+        except Exception as e:
+            log.exception("request failed", extra={"server": self.name})
+            return error_response(HttpError(500, str(e)), keep_alive)
+        finally:
+            end_request(context, token, self.name, request.method, request.path, request.path, status)
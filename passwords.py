@@ -0,0 +1,197 @@
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from metrics import REGISTRY
+
+# Password hashing (scrypt, PBKDF2 where OpenSSL lacks scrypt) in a pool of worker processes.
+# At most `max_pending` hashes are queued or running; past that callers get PasswordHasherBusy
+# at once, so a burst of logins is answered with 503s instead of piling up behind the pool.
+
+PBKDF2_ITERATIONS = 600000
+BULK_CHUNK = 32   # passwords per worker job in hash_many()
+
+HASH_SECONDS = REGISTRY.histogram('radsafe_password_hash_seconds',
+                                  'Time spent waiting for and computing password hashes', ('operation',))
+HASH_REJECTED = REGISTRY.counter('radsafe_password_hash_rejected_total',
+                                 'Password hash requests refused because the hashing queue was full')
+
+_hashers = weakref.WeakSet()
+
+
+class PasswordHasherBusy(Exception):
+    """Every hashing slot is taken; answer 503 and let the client retry"""
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _maxmem(n, r, p):
+    return 128 * n * r * (p + 1) + 1024 * 1024
+
+
+def is_hashed(value):
+    """True for a stored hash, False for a legacy plaintext password"""
+    if not isinstance(value, str):
+        return False
+    fields = value.split('$')
+    return (fields[0] == 'scrypt' and len(fields) == 6) or (fields[0] == 'pbkdf2_sha256' and len(fields) == 4)
+
+
+# ========== WORKER FUNCTIONS ==========
+# Run in the pool's processes; they only take and return plain values
+
+def make_hash(password, n, r, p):
+    salt = os.urandom(16)
+    if hasattr(hashlib, 'scrypt'):
+        digest = hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, maxmem=_maxmem(n, r, p), dklen=32)
+        return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(digest)}"
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+
+
+def make_hashes(passwords, n, r, p):
+    return [make_hash(password, n, r, p) for password in passwords]
+
+
+def check_hash(password, stored):
+    scheme, *fields = stored.split('$')
+    if scheme == 'scrypt':
+        n, r, p = (int(field) for field in fields[:3])
+        expected = base64.b64decode(fields[4])
+        actual = hashlib.scrypt(password.encode('utf-8'), salt=base64.b64decode(fields[3]), n=n, r=r, p=p,
+                                maxmem=_maxmem(n, r, p), dklen=len(expected))
+    else:
+        expected = base64.b64decode(fields[2])
+        actual = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), base64.b64decode(fields[1]),
+                                     int(fields[0]), dklen=len(expected))
+    return hmac.compare_digest(actual, expected)
+
+
+def _completed(fn, *args):
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except BaseException as e:
+        future.set_exception(e)
+    return future
+
+
+# ========== HASHER ==========
+class PasswordHasher:
+    """Hashes and verifies passwords in `workers` processes (0 = in the calling thread)"""
+
+    def __init__(self, workers=2, max_pending=32, n=2 ** 14, r=8, p=1):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.params = (n, r, p)
+        self.prefix = f"scrypt${n}${r}${p}$" if hasattr(hashlib, 'scrypt') else f"pbkdf2_sha256${PBKDF2_ITERATIONS}$"
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._dummy = None
+        _hashers.add(self)
+
+    def _after_fork(self):
+        # The pool's processes and threads belong to the parent; the child starts its own on first use
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # Forked, not spawned: spawning would re-run the server script in every pool process.
+                # With fork all pool processes start on the first submit; see start()
+                method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(method))
+            return self._pool
+
+    def start(self):
+        """Start the pool processes now, before the server has request threads to fork along"""
+        if self.workers > 0:
+            self._executor().submit(int).result()
+
+    def _submit(self, fn, *args, wait=False):
+        """Future for fn(*args); it holds a slot until it completes"""
+        if not self._slots.acquire(blocking=wait):
+            HASH_REJECTED.inc()
+            raise PasswordHasherBusy()
+        try:
+            if self.workers <= 0:
+                future = _completed(fn, *args)
+            else:
+                future = self._executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, operation, fn, *args):
+        start = time.perf_counter()
+        try:
+            return self._submit(fn, *args).result()
+        finally:
+            HASH_SECONDS.observe(time.perf_counter() - start, operation)
+
+    def hash(self, password):
+        return self._run('hash', make_hash, password, *self.params)
+
+    def hash_many(self, passwords):
+        """Hashes for a batch (bulk imports); waits for slots and keeps at most `workers` jobs queued"""
+        results, in_flight = [], deque()
+        with HASH_SECONDS.time('hash_many'):
+            for start in range(0, len(passwords), BULK_CHUNK):
+                if len(in_flight) >= max(1, self.workers):
+                    results.extend(in_flight.popleft().result())
+                in_flight.append(self._submit(make_hashes, passwords[start:start + BULK_CHUNK], *self.params,
+                                              wait=True))
+            while in_flight:
+                results.extend(in_flight.popleft().result())
+        return results
+
+    def affordable(self, stored):
+        """True if checking the stored hash costs no more than checking one this hasher made
+
+        Imported hashes must pass this: a hash with a huge scrypt N or PBKDF2 iteration
+        count would hold a pool process for as long as its parameters say on every login.
+        """
+        scheme, *fields = stored.split('$')
+        try:
+            if scheme == 'scrypt':
+                n, r, p = (int(field) for field in fields[:3])
+                return 1 < n <= self.params[0] and n & (n - 1) == 0 and 0 < r <= self.params[1] \
+                    and 0 < p <= self.params[2]
+            return 0 < int(fields[0]) <= PBKDF2_ITERATIONS
+        except ValueError:
+            return False
+
+    def verify(self, password, stored):
+        """(matches, needs_rehash); `stored` may be a legacy plaintext password"""
+        if not is_hashed(stored):
+            if stored is None:
+                self.verify_dummy(password)
+                return False, False
+            # Written before passwords were hashed
+            return hmac.compare_digest(str(stored).encode('utf-8'), password.encode('utf-8')), True
+        matches = self._run('verify', check_hash, password, stored)
+        return matches, matches and not stored.startswith(self.prefix)
+
+    def verify_dummy(self, password):
+        """Spend the time of a real check, so unknown emails can't be told apart by response time"""
+        if self._dummy is None:
+            self._dummy = self.hash(os.urandom(8).hex())
+        self._run('verify', check_hash, password, self._dummy)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: [hasher._after_fork() for hasher in list(_hashers)])
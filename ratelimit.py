@@ -0,0 +1,201 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from logs import parse_pairs
+from metrics import REGISTRY
+
+# Admission control for the Flask apps: a token bucket per (route budget, client) answers 429
+# with Retry-After once a client spends its budget, and a cap on requests in flight per process
+# answers 503 before queued requests drive every client's latency up.
+
+# Budgets are "rate/burst": tokens added per second / bucket size; "0" turns the limit off.
+# RADSAFE_RATE_LIMITS overrides single routes ("/api/radiation/current=2/4,/api/test=0").
+# Routes without a budget of their own share one RADSAFE_RATE_DEFAULT bucket per client.
+RATE_LIMITS = os.environ.get('RADSAFE_RATE_LIMITS', '')
+RATE_DEFAULT = os.environ.get('RADSAFE_RATE_DEFAULT', '20/40')
+RATE_MAX_KEYS = int(os.environ.get('RADSAFE_RATE_MAX_KEYS', '100000'))   # buckets kept per budget
+# Signed-in accounts get a bucket each, but one address gets at most this many account buckets
+RATE_MAX_PER_ADDRESS = int(os.environ.get('RADSAFE_RATE_MAX_PER_ADDRESS', '16'))
+MAX_IN_FLIGHT = int(os.environ.get('RADSAFE_MAX_IN_FLIGHT', '64'))        # per process; 0 = no cap
+
+DEFAULT_BUDGETS = {
+    '/api/radiation/current': '5/10',
+    '/api/proximity/status': '5/10',
+    '/api/radiation/stream': '0.2/3',
+    '/api/proximity/stream': '0.2/3',
+    '/api/radiation/search': '1/5',     # one outbound geocoding call per cache miss
+    '/api/auth/login': '1/5',
+    '/api/auth/register': '0.2/3',
+    '/api/health': '0',
+    '/metrics': '0',
+}
+
+RATE_LIMITED = REGISTRY.counter('radsafe_rate_limited_total', 'Requests answered 429 by the rate limiter',
+                                ('app', 'route'))
+SHED = REGISTRY.counter('radsafe_requests_shed_total', 'Requests answered 503 because too many were in flight',
+                        ('app',))
+
+
+def parse_budget(text):
+    """'5/10' -> (5.0, 10.0); '5' -> (5.0, 5.0); '0' -> None (unlimited)"""
+    rate, _, burst = str(text).partition('/')
+    rate = float(rate)
+    if rate <= 0:
+        return None
+    return rate, max(1.0, float(burst) if burst else rate)
+
+
+BUDGETS = {route: parse_budget(budget)
+           for route, budget in {**DEFAULT_BUDGETS, **parse_pairs(RATE_LIMITS, str)}.items()}
+
+
+# ========== TOKEN BUCKETS ==========
+class TokenBuckets:
+    """Token buckets keyed by (address, identity) clients, refilled lazily when touched
+
+    Each bucket is a (tokens, last touched) pair in an LRU. A bucket idle
+    for burst / rate seconds is full again, which is what a missing bucket
+    means, so those are dropped from the cold end as new ones are touched.
+    An address holding `max_per_address` identity buckets charges any further
+    identity to its own (address, None) bucket.
+    """
+
+    def __init__(self, rate, burst, max_keys=RATE_MAX_KEYS, max_per_address=RATE_MAX_PER_ADDRESS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.max_per_address = max_per_address
+        self._buckets = OrderedDict()   # key -> (tokens, monotonic time), least recently touched first
+        self._identities = {}           # address -> number of identity buckets it holds
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None):
+        """0.0 if a token was taken, else the seconds until one is available"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            key = self._bucket_key(key)
+            state = self._buckets.pop(key, None)
+            tokens = self.burst if state is None else min(self.burst, state[0] + (now - state[1]) * self.rate)
+            if tokens >= 1.0:
+                tokens -= 1.0
+                wait = 0.0
+            else:
+                wait = (1.0 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            self._evict(now)
+        return wait
+
+    def _bucket_key(self, key):
+        address, identity = key
+        if identity is None or key in self._buckets:
+            return key
+        held = self._identities.get(address, 0)
+        if held >= self.max_per_address:
+            return address, None
+        self._identities[address] = held + 1
+        return key
+
+    def _evict(self, now):
+        buckets = self._buckets
+        refill = self.burst / self.rate
+        while buckets:
+            key, (_, touched) = next(iter(buckets.items()))
+            if now - touched < refill and len(buckets) <= self.max_keys:
+                break
+            del buckets[key]
+            address, identity = key
+            if identity is not None:
+                held = self._identities.pop(address) - 1
+                if held:
+                    self._identities[address] = held
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """One set of buckets per route budget; routes without one share the default buckets"""
+
+    def __init__(self, budgets=None, default=RATE_DEFAULT, max_keys=RATE_MAX_KEYS):
+        budgets = BUDGETS if budgets is None else budgets
+        self._exempt = {route for route, budget in budgets.items() if budget is None}
+        self._routes = {route: TokenBuckets(*budget, max_keys) for route, budget in budgets.items() if budget}
+        default = parse_budget(default)
+        self._default = TokenBuckets(*default, max_keys) if default else None
+
+    def exempt(self, route):
+        return route in self._exempt or (route not in self._routes and self._default is None)
+
+    def take(self, route, client):
+        """0.0 if the request may go ahead, else the seconds the client should wait"""
+        return self._routes.get(route, self._default).take(client)
+
+
+class InFlightLimit:
+    def __init__(self, limit=MAX_IN_FLIGHT):
+        self.limit = limit
+        self.current = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            if self.limit and self.current >= self.limit:
+                return False
+            self.current += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.current -= 1
+
+
+def client_key(req):
+    """(address, None): headers such as X-Device-ID are the client's to pick, so they never choose the bucket"""
+    return req.remote_addr or '-', None
+
+
+# ========== FLASK ==========
+def limit_requests(app, name, identify=client_key):
+    """Per-client rate limits and the in-flight cap for every route of a Flask app
+
+    `identify(request)` names the client a bucket belongs to as an (address,
+    identity) pair; the identity must be verified, e.g. a signed token's
+    subject. Preflights and routes with a "0" budget are let through untouched.
+    """
+    from flask import jsonify, request
+
+    limiter = RateLimiter()
+    in_flight = InFlightLimit()
+
+    def refuse(status, error, wait):
+        response = jsonify({"error": error, "retry_after": round(wait, 3)})
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+        return response
+
+    @app.before_request
+    def admit_request():
+        req = request._get_current_object()
+        rule = req.url_rule
+        route = rule.rule if rule is not None else '<unmatched>'
+        if req.method == 'OPTIONS' or limiter.exempt(route):
+            return None
+        wait = limiter.take(route, identify(req))
+        if wait:
+            RATE_LIMITED.inc(name, route)
+            return refuse(429, "Too many requests", wait)
+        if not in_flight.enter():
+            SHED.inc(name)
+            return refuse(503, "Server busy, please retry", 1.0)
+        req.environ['radsafe.admitted'] = True
+
+    @app.teardown_request
+    def release_request(exc):
+        if request.environ.pop('radsafe.admitted', False):
+            in_flight.leave()
+
+    return app
@@ -0,0 +1,106 @@
+import math
+from datetime import datetime
+
+from fastjson import loads
+
+DEFAULT_UNIT = 'μSv/h'
+# Readings are stored in μSv/h; other dose-rate units are converted on ingest
+UNIT_SCALE = {'μSv/h': 1.0, 'µSv/h': 1.0, 'uSv/h': 1.0, 'nSv/h': 0.001, 'mSv/h': 1000.0}
+MAX_DEVICE_ID_LENGTH = 128
+
+
+def parse_timestamp(value):
+    """Epoch seconds (or milliseconds) or an ISO-8601 string -> epoch seconds"""
+    if isinstance(value, bool):
+        raise ValueError("timestamp must be a number or ISO-8601 string")
+    if isinstance(value, (int, float)):
+        if not math.isfinite(value):
+            raise ValueError("timestamp must be finite")
+        return value / 1000.0 if value > 1e11 else float(value)
+    if isinstance(value, str):
+        try:
+            return parse_timestamp(float(value))
+        except ValueError:
+            pass
+        # Naive strings are taken as server local time, like datetime.now().isoformat()
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    raise ValueError("timestamp must be a number or ISO-8601 string")
+
+
+def validate_batch(items, now=None):
+    """Validate raw `{deviceId, value, unit, timestamp, lat, lng}` items in one pass
+
+    Returns (accepted, errors): accepted readings normalized to μSv/h with the
+    timestamp in epoch seconds, and `{"index", "error"}` for each rejected item.
+    """
+    now = now if now is not None else datetime.now().timestamp()
+    accepted = []
+    errors = []
+    append = accepted.append
+    isfinite = math.isfinite
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("reading must be an object")
+            device_id = item.get('deviceId')
+            if not isinstance(device_id, str) or not device_id or len(device_id) > MAX_DEVICE_ID_LENGTH:
+                raise ValueError("deviceId is required")
+            value = item.get('value')
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not isfinite(value) or value < 0:
+                raise ValueError("value must be a non-negative number")
+            scale = UNIT_SCALE.get(item.get('unit', DEFAULT_UNIT))
+            if scale is None:
+                raise ValueError(f"unit must be one of {', '.join(UNIT_SCALE)}")
+            ts = item.get('timestamp')
+            reading = {
+                "deviceId": device_id,
+                "value": value * scale,
+                "timestamp": now if ts is None else parse_timestamp(ts)
+            }
+            lat = item.get('lat')
+            lng = item.get('lng')
+            if lat is not None or lng is not None:
+                if (isinstance(lat, bool) or isinstance(lng, bool)
+                        or not isinstance(lat, (int, float)) or not isinstance(lng, (int, float))
+                        or not -90 <= lat <= 90 or not -180 <= lng <= 180):
+                    raise ValueError("lat/lng must be valid coordinates")
+                reading["lat"] = float(lat)
+                reading["lng"] = float(lng)
+            append(reading)
+        except (ValueError, TypeError, OverflowError, OSError) as e:
+            errors.append({"index": index, "error": str(e)})
+    return accepted, errors
+
+
+def to_radiation_data(reading):
+    """Stored reading -> the RadiationData shape served to the frontend"""
+    data = {
+        "value": round(reading["value"], 4),
+        "unit": DEFAULT_UNIT,
+        "timestamp": datetime.fromtimestamp(reading["timestamp"]).isoformat()
+    }
+    if "lat" in reading:
+        data["location"] = {"lat": round(reading["lat"], 6), "lng": round(reading["lng"], 6)}
+    return data
+
+
+def iter_ndjson_batches(stream, batch_size):
+    """Yield lists of decoded items from a newline-delimited JSON body, `batch_size` at a time
+
+    Lines that are not valid JSON are yielded as None so validation rejects them
+    with their position intact.
+    """
+    batch = []
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            batch.append(loads(line))
+        except ValueError:
+            batch.append(None)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,467 @@
+import os
+import re
+import sqlite3
+import threading
+import weakref
+from bisect import bisect_right
+from contextlib import contextmanager
+
+from fastjson import dumps_text, loads
+from storage import EMPTY_DATABASE, DocumentStore
+
+COLLECTIONS = tuple(EMPTY_DATABASE)
+
+# Record fields copied into real SQLite columns so they can be indexed;
+# everything else lives in the JSON `data` column.
+SQLITE_COLUMNS = {
+    "users": ("email", "role", "createdAt"),
+    "profiles": ("userId", "createdAt"),
+    "readings": ("deviceId", "timestamp"),
+    "alerts": ("userId", "deviceId", "createdAt"),
+    "settings": ("userId",),
+}
+SQLITE_INDEXES = {
+    "users": (("email",), ("role",), ("createdAt",)),
+    "profiles": (("userId",),),
+    "readings": (("deviceId", "timestamp"),),
+    "alerts": (("userId", "createdAt"), ("deviceId", "createdAt")),
+    "settings": (("userId",),),
+}
+FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+FILTER_OPS = ('=', '>=', '<', 'prefix')
+SQLITE_MAX_PARAMS = 500   # values per IN (...) query, below SQLite's bound-parameter limit
+
+
+class DuplicateIdError(ValueError):
+    """insert() was given an id that another record already has"""
+
+
+def matches(record, filters):
+    """True if a record satisfies every (field, op, value) filter; 'prefix' ignores case like SQLite LIKE"""
+    for field, op, value in filters:
+        actual = record.get(field)
+        if op == '=':
+            if actual != value:
+                return False
+        elif actual is None:
+            return False
+        elif op == '>=':
+            if not actual >= value:
+                return False
+        elif op == '<':
+            if not actual < value:
+                return False
+        elif not (isinstance(actual, str) and actual.lower().startswith(value.lower())):
+            return False
+    return True
+
+
+class Repository:
+    """Storage interface shared by the JSON and SQLite backends
+
+    Records are plain dicts with an integer `id` assigned on insert.
+    """
+
+    path = None
+    shared_versions = False  # True if version() tokens mean the same data in every process
+
+    def open(self, default_data=None):
+        return self
+
+    def close(self):
+        pass
+
+    @contextmanager
+    def transaction(self):
+        """Group several calls so they are applied atomically"""
+        raise NotImplementedError
+
+    def find_one(self, collection, field, value):
+        raise NotImplementedError
+
+    def find_many(self, collection, field, values):
+        """{value: first record with that value by id} for each of `values` that is present"""
+        raise NotImplementedError
+
+    def all(self, collection):
+        raise NotImplementedError
+
+    def count(self, collection):
+        raise NotImplementedError
+
+    def insert(self, collection, record):
+        """Store `record`, assigning the next id if it has none, and return it
+
+        An id of the record's own must be unused (DuplicateIdError otherwise);
+        later ids are assigned above it.
+        """
+        raise NotImplementedError
+
+    def insert_many(self, collection, records):
+        """Store a batch of new records with one write and return them with their assigned ids"""
+        raise NotImplementedError
+
+    def update(self, collection, record_id, changes):
+        """Merge `changes` into a record and return it, or None if it does not exist"""
+        raise NotImplementedError
+
+    def update_many(self, collection, updates):
+        """Apply (record_id, changes) pairs with one write; the updated record or None for each pair"""
+        raise NotImplementedError
+
+    def page(self, collection, limit, after=None, filters=()):
+        """Up to `limit` records with id > `after` matching the (field, op, value) filters, by id"""
+        raise NotImplementedError
+
+    def version(self, collection):
+        """Token that changes whenever the collection is written"""
+        raise NotImplementedError
+
+    def files(self):
+        """Paths of the files that hold the data"""
+        return [self.path]
+
+    def delete(self, collection, record_id):
+        raise NotImplementedError
+
+    def snapshot(self):
+        return {name: self.all(name) for name in COLLECTIONS}
+
+
+# ========== JSON FILE BACKEND ==========
+class JsonRepository(Repository):
+    """The radsafe_database.json document, held in memory by a DocumentStore"""
+
+    def __init__(self, path, **store_options):
+        self.path = path
+        self.store = DocumentStore(path, **store_options)
+
+    def open(self, default_data=None):
+        self.store.open(default_data)
+        return self
+
+    def close(self):
+        self.store.close()
+
+    @contextmanager
+    def transaction(self):
+        with self.store.lock:
+            yield self
+
+    def find_one(self, collection, field, value):
+        return self.store.find_one(collection, field, value)
+
+    def find_many(self, collection, field, values):
+        return self.store.find_many(collection, field, values)
+
+    def all(self, collection):
+        return self.store.all(collection)
+
+    def count(self, collection):
+        return self.store.count(collection)
+
+    def version(self, collection):
+        return self.store.versions.get(collection, 0)
+
+    def files(self):
+        return [self.path, self.store.log_path, self.store.log_path + '.1']
+
+    def insert(self, collection, record):
+        with self.store.lock:
+            if record.get('id') is None:
+                fields = {k: v for k, v in record.items() if k != 'id'}
+                record = {"id": self.store.next_id(collection), **fields}
+            elif self.store.find_one(collection, 'id', record['id']) is not None:
+                raise DuplicateIdError(f"{collection} already has a record with id {record['id']}")
+            return dict(self.store.insert(collection, record))
+
+    def insert_many(self, collection, records):
+        if not records:
+            return []
+        with self.store.lock:
+            first_id = self.store.next_id(collection, len(records))
+            batch = [{"id": first_id + offset, **{k: v for k, v in record.items() if k != 'id'}}
+                     for offset, record in enumerate(records)]
+            self.store.insert_many(collection, batch)
+        return [dict(record) for record in batch]
+
+    def update(self, collection, record_id, changes):
+        return self.store.update(collection, record_id, changes)
+
+    def update_many(self, collection, updates):
+        return self.store.update_many(collection, updates)
+
+    def page(self, collection, limit, after=None, filters=()):
+        with self.store.lock:
+            ordered = self.store.ordered(collection)
+            position = 0 if after is None else bisect_right(ordered, after, key=lambda r: r['id'])
+            records = []
+            while position < len(ordered) and len(records) < limit:
+                if matches(ordered[position], filters):
+                    records.append(dict(ordered[position]))
+                position += 1
+            return records
+
+    def delete(self, collection, record_id):
+        return self.store.delete(collection, record_id)
+
+    def snapshot(self):
+        return self.store.snapshot()
+
+
+# ========== SQLITE BACKEND ==========
+_sqlite_repositories = weakref.WeakSet()
+
+class SqliteRepository(Repository):
+    """One table per collection in a WAL-mode SQLite file, safe to share between processes
+
+    Write counters live in the file's `_versions` table, bumped in the same
+    transaction as the write, so every process hands out the same versions.
+    """
+
+    shared_versions = True
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._counts = {}     # collection -> (version, row count)
+        _sqlite_repositories.add(self)
+
+    def _after_fork(self):
+        # SQLite connections must not be used across fork(); the child opens its own
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def _connection(self):
+        """Per-thread connection; sqlite3 caches the prepared statements on each one"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def open(self, default_data=None):
+        conn = self._connection()
+        with self.transaction():
+            for name in COLLECTIONS:
+                columns = "".join(f", {column}" for column in SQLITE_COLUMNS[name])
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {name} "
+                             f"(id INTEGER PRIMARY KEY AUTOINCREMENT{columns}, data TEXT NOT NULL)")
+                for fields in SQLITE_INDEXES[name]:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_{'_'.join(fields)} "
+                                 f"ON {name} ({', '.join(fields)})")
+            conn.execute("CREATE TABLE IF NOT EXISTS _versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            # The '' row tells this file apart from one recreated at the same path
+            conn.execute("INSERT OR IGNORE INTO _versions (name, version) VALUES ('', abs(random()))")
+            empty = conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+            if empty and default_data:
+                for name, items in default_data.items():
+                    for record in items:
+                        self.insert(name, dict(record))
+        return self
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    @contextmanager
+    def transaction(self):
+        conn = self._connection()
+        if conn.in_transaction:
+            yield self
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _row(row):
+        if row is None:
+            return None
+        return {"id": row[0], **loads(row[1])}
+
+    def _column_values(self, collection, record):
+        return [record.get(column) for column in SQLITE_COLUMNS[collection]]
+
+    def find_one(self, collection, field, value):
+        if not FIELD_NAME.match(field):
+            raise ValueError(f"Invalid field name: {field}")
+        if field == 'id' or field in SQLITE_COLUMNS[collection]:
+            sql = f"SELECT id, data FROM {collection} WHERE {field} = ? ORDER BY id LIMIT 1"
+        else:
+            sql = f"SELECT id, data FROM {collection} WHERE json_extract(data, '$.{field}') = ? ORDER BY id LIMIT 1"
+        return self._row(self._connection().execute(sql, (value,)).fetchone())
+
+    def find_many(self, collection, field, values):
+        if not FIELD_NAME.match(field):
+            raise ValueError(f"Invalid field name: {field}")
+        column = field if field == 'id' or field in SQLITE_COLUMNS[collection] \
+            else f"json_extract(data, '$.{field}')"
+        values = list(dict.fromkeys(values))
+        found = {}
+        conn = self._connection()
+        for start in range(0, len(values), SQLITE_MAX_PARAMS):
+            chunk = values[start:start + SQLITE_MAX_PARAMS]
+            rows = conn.execute(f"SELECT {column}, id, data FROM {collection} "
+                                f"WHERE {column} IN ({', '.join('?' * len(chunk))}) ORDER BY id", chunk)
+            for row in rows:
+                if row[0] not in found:
+                    found[row[0]] = self._row(row[1:])
+        return found
+
+    def all(self, collection):
+        rows = self._connection().execute(f"SELECT id, data FROM {collection} ORDER BY id")
+        return [self._row(row) for row in rows]
+
+    def count(self, collection):
+        version = self.version(collection)
+        cached = self._counts.get(collection)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        count = self._connection().execute(f"SELECT COUNT(*) FROM {collection}").fetchone()[0]
+        self._counts[collection] = (version, count)
+        return count
+
+    def version(self, collection):
+        # data_version moves when any other connection commits, including other processes;
+        # until then this connection's copy of the counters is current
+        conn = self._connection()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        versions = getattr(self._local, 'versions', None)
+        if versions is None or data_version != self._local.data_version:
+            versions = self._local.versions = dict(conn.execute("SELECT name, version FROM _versions"))
+            self._local.data_version = data_version
+        return versions.get(''), versions.get(collection, 0)
+
+    def files(self):
+        return [self.path, self.path + '-wal', self.path + '-shm']
+
+    def _bump(self, collection):
+        """Count a write to `collection`; call inside the write's transaction"""
+        self._connection().execute("INSERT INTO _versions (name, version) VALUES (?, 1) "
+                                   "ON CONFLICT (name) DO UPDATE SET version = version + 1", (collection,))
+        self._local.versions = None
+
+    def insert(self, collection, record):
+        columns = SQLITE_COLUMNS[collection]
+        placeholders = ", ".join("?" for _ in range(len(columns) + 2))
+        sql = f"INSERT INTO {collection} (id, {', '.join(columns + ('data',))}) VALUES ({placeholders})"
+        data = {k: v for k, v in record.items() if k != 'id'}
+        with self.transaction():
+            try:
+                cursor = self._connection().execute(
+                    sql, [record.get('id'), *self._column_values(collection, record), dumps_text(data)])
+            except sqlite3.IntegrityError as e:
+                raise DuplicateIdError(f"{collection} already has a record with id {record['id']}") from e
+            self._bump(collection)
+        return {"id": cursor.lastrowid, **data}
+
+    def insert_many(self, collection, records):
+        columns = SQLITE_COLUMNS[collection]
+        placeholders = ", ".join("?" for _ in range(len(columns) + 1))
+        sql = f"INSERT INTO {collection} ({', '.join(columns + ('data',))}) VALUES ({placeholders})"
+        batch = [{k: v for k, v in record.items() if k != 'id'} for record in records]
+        if not batch:
+            return []
+        rows = [[*self._column_values(collection, record), dumps_text(record)] for record in batch]
+        with self.transaction():
+            conn = self._connection()
+            conn.executemany(sql, rows)
+            # BEGIN IMMEDIATE holds the write lock, so the batch got consecutive ids
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            self._bump(collection)
+        first_id = last_id - len(batch) + 1
+        return [{"id": first_id + offset, **record} for offset, record in enumerate(batch)]
+
+    def update(self, collection, record_id, changes):
+        with self.transaction():
+            record = self.find_one(collection, 'id', record_id)
+            if record is None:
+                return None
+            record.update(changes)
+            record['id'] = record_id
+            columns = SQLITE_COLUMNS[collection]
+            assignments = ", ".join(f"{column} = ?" for column in columns + ('data',))
+            data = {k: v for k, v in record.items() if k != 'id'}
+            self._connection().execute(
+                f"UPDATE {collection} SET {assignments} WHERE id = ?",
+                [*self._column_values(collection, record), dumps_text(data), record_id])
+            self._bump(collection)
+            return record
+
+    def update_many(self, collection, updates):
+        columns = SQLITE_COLUMNS[collection]
+        assignments = ", ".join(f"{column} = ?" for column in columns + ('data',))
+        with self.transaction():
+            found = self.find_many(collection, 'id', [record_id for record_id, _ in updates])
+            changed = {}
+            for record_id, changes in updates:
+                record = found.get(record_id)
+                if record is not None:
+                    record.update(changes)
+                    record['id'] = record_id
+                    changed[record_id] = record
+            rows = [[*self._column_values(collection, record), dumps_text({k: v for k, v in record.items() if k != 'id'}),
+                     record_id] for record_id, record in changed.items()]
+            self._connection().executemany(f"UPDATE {collection} SET {assignments} WHERE id = ?", rows)
+            self._bump(collection)
+        return [found.get(record_id) for record_id, _ in updates]
+
+    def page(self, collection, limit, after=None, filters=()):
+        clauses, params = [], []
+        if after is not None:
+            clauses.append("id > ?")
+            params.append(after)
+        for field, op, value in filters:
+            if not FIELD_NAME.match(field) or op not in FILTER_OPS:
+                raise ValueError(f"Invalid filter: {field} {op}")
+            column = field if field == 'id' or field in SQLITE_COLUMNS[collection] \
+                else f"json_extract(data, '$.{field}')"
+            if op == 'prefix':
+                escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                clauses.append(f"{column} LIKE ? ESCAPE '\\'")
+                params.append(escaped + '%')
+            else:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        rows = self._connection().execute(
+            f"SELECT id, data FROM {collection} {where}ORDER BY id LIMIT ?", [*params, limit])
+        return [self._row(row) for row in rows]
+
+    def delete(self, collection, record_id):
+        with self.transaction():
+            cursor = self._connection().execute(f"DELETE FROM {collection} WHERE id = ?", (record_id,))
+            self._bump(collection)
+        return cursor.rowcount > 0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: [repo._after_fork() for repo in list(_sqlite_repositories)])
+
+
+def create_repository(backend=None, json_path=None, sqlite_path=None, **store_options):
+    """Build the repository selected by RADSAFE_STORAGE ('json' or 'sqlite')"""
+    backend = backend or os.environ.get('RADSAFE_STORAGE', 'json')
+    if backend == 'sqlite':
+        return SqliteRepository(sqlite_path or os.environ.get('RADSAFE_SQLITE_FILE', 'radsafe.db'))
+    if backend == 'json':
+        return JsonRepository(json_path, **store_options)
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,132 @@
+import heapq
+import re
+import threading
+
+ALL_DEVICES = '*'
+
+# Stored bucket sizes (seconds) and how many of each are kept per device
+RESOLUTIONS = {60: 3 * 1440, 3600: 90 * 24, 86400: 3650}
+MAX_POINTS = 1500
+
+DURATION = re.compile(r'^(\d+(?:\.\d+)?)\s*([smhdw]?)$')
+DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_duration(text):
+    """'90', '5m', '24h', '7d' -> seconds"""
+    match = DURATION.match(str(text).strip().lower())
+    if not match:
+        raise ValueError(f"Invalid duration: {text}")
+    seconds = float(match.group(1)) * DURATION_UNITS[match.group(2)]
+    if seconds <= 0:
+        raise ValueError(f"Invalid duration: {text}")
+    return int(seconds)
+
+
+class RollupEngine:
+    """Incrementally maintained min/max/sum/count/last buckets per device at 1m, 1h and 1d"""
+
+    def __init__(self, resolutions=RESOLUTIONS):
+        self.resolutions = dict(sorted(resolutions.items()))
+        self.lock = threading.Lock()
+        # (device, resolution) -> {bucket_start: [min, max, sum, count, last, last_ts]}
+        self._buckets = {}
+        # (device, resolution) -> min-heap of bucket starts, so the oldest bucket is evicted
+        # even when readings arrive out of time order (rebuild() fills ALL_DEVICES device by device)
+        self._starts = {}
+
+    # ========== INGEST ==========
+    def add_many(self, readings):
+        """Fold validated readings (`timestamp` in epoch seconds) into every resolution"""
+        with self.lock:
+            for reading in readings:
+                ts = reading["timestamp"]
+                value = reading["value"]
+                for device in (reading["deviceId"], ALL_DEVICES):
+                    for resolution in self.resolutions:
+                        self._add(device, resolution, ts, value)
+
+    def _add(self, device, resolution, ts, value):
+        buckets = self._buckets.get((device, resolution))
+        if buckets is None:
+            buckets = self._buckets[(device, resolution)] = {}
+            self._starts[(device, resolution)] = []
+        start = int(ts // resolution) * resolution
+        bucket = buckets.get(start)
+        if bucket is None:
+            buckets[start] = [value, value, value, 1, value, ts]
+            starts = self._starts[(device, resolution)]
+            heapq.heappush(starts, start)
+            while len(buckets) > self.resolutions[resolution]:
+                del buckets[heapq.heappop(starts)]
+            return
+        if value < bucket[0]:
+            bucket[0] = value
+        if value > bucket[1]:
+            bucket[1] = value
+        bucket[2] += value
+        bucket[3] += 1
+        if ts >= bucket[5]:
+            bucket[4] = value
+            bucket[5] = ts
+
+    def rebuild(self, readings_store):
+        """Recompute every bucket from the raw readings on disk"""
+        with self.lock:
+            self._buckets = {}
+            self._starts = {}
+        for device in readings_store.devices():
+            for batch in readings_store.scan(device):
+                self.add_many({"deviceId": device, "timestamp": row[0], "value": row[1]} for row in batch)
+
+    # ========== QUERIES ==========
+    def source_resolution(self, resolution, window):
+        """Coarsest stored bucket size that can produce `resolution` for `window`
+
+        Without an explicit resolution, the finest stored size giving at most
+        MAX_POINTS buckets is used.
+        """
+        if resolution is None:
+            for size in self.resolutions:
+                if window / size <= MAX_POINTS:
+                    return size, size
+            size = max(self.resolutions)
+            return size, size
+        candidates = [size for size in self.resolutions if size <= resolution and resolution % size == 0]
+        size = max(candidates) if candidates else min(self.resolutions)
+        # Round up to whole source buckets so output buckets never split one
+        resolution = -(-resolution // size) * size
+        # Never serve more than MAX_POINTS points
+        while window / resolution > MAX_POINTS:
+            resolution *= 2
+        return size, resolution
+
+    def history(self, device, start, end, resolution=None):
+        """Aggregated points covering [start, end) at `resolution` seconds, oldest first"""
+        source, resolution = self.source_resolution(resolution, end - start)
+        first = int(start // source) * source
+        points = {}
+        with self.lock:
+            buckets = self._buckets.get((device, source), {})
+            if len(buckets) < (end - first) / source:
+                keys = sorted(key for key in buckets if first <= key < end)
+            else:
+                keys = [key for key in range(first, int(end), source) if key in buckets]
+            for key in keys:
+                low, high, total, count, last, last_ts = buckets[key]
+                out = int(key // resolution) * resolution
+                point = points.get(out)
+                if point is None:
+                    points[out] = [low, high, total, count, last, last_ts]
+                    continue
+                point[0] = min(point[0], low)
+                point[1] = max(point[1], high)
+                point[2] += total
+                point[3] += count
+                if last_ts >= point[5]:
+                    point[4] = last
+                    point[5] = last_ts
+        return source, resolution, [
+            {"timestamp": key, "min": p[0], "max": p[1], "mean": p[2] / p[3], "count": p[3], "last": p[4]}
+            for key, p in sorted(points.items())
+        ]
@@ -1,27 +1,22 @@
-import socket 
-import json 
-import time 
+from fastjson import dumps
+from minihttp import ThreadPoolServer 
  
-server = socket.socket() 
-server.bind(("localhost", 8000)) 
-server.listen(5) 
-print("? BACKEND STARTED ON PORT 8000") 
-print("? Will accept ALL connections") 
+# Same body for every request, encoded once
+RESPONSE = dumps({ 
+    "success": True, 
+    "message": "RadSafe Project - Connected!", 
+    "data": {"user_id": 123, "status": "active"} 
+}) 
  
-while True: 
-    client, addr = server.accept() 
-    data = client.recv(1024).decode() 
-    print(f"?? Request from {addr}") 
+def handle_request(request): 
+    # Requests are access-logged by the server
+    return 201, RESPONSE 
  
-    response = "HTTP/1.1 201 OK\r\n" 
-    response += "Content-Type: application/json\r\n" 
-    response += "Access-Control-Allow-Origin: *\r\n" 
-    response += "\r\n" 
-    response += json.dumps({ 
-        "success": True, 
-        "message": "RadSafe Project - Connected!", 
-        "data": {"user_id": 123, "status": "active"} 
-    }) 
+server = ThreadPoolServer(handle_request, host="localhost", port=8000, workers=8, backlog=1024, name='simple_server') 
+print("? BACKEND STARTED ON PORT 8000") 
+print("? Will accept ALL connections") 
  
-    client.send(response.encode()) 
-    client.close() 
+try: 
+    server.serve_forever() 
+except KeyboardInterrupt: 
+    print("Server stopped") 
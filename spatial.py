@@ -0,0 +1,180 @@
+import heapq
+import math
+import threading
+from array import array
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class Cell:
+    __slots__ = ("lat", "lng", "value", "ts", "device")
+
+    def __init__(self):
+        self.lat = array('d')
+        self.lng = array('d')
+        self.value = array('d')
+        self.ts = array('d')
+        self.device = []
+
+    def append(self, lat, lng, value, ts, device):
+        self.lat.append(lat)
+        self.lng.append(lng)
+        self.value.append(value)
+        self.ts.append(ts)
+        self.device.append(device)
+
+    def rows(self):
+        return zip(self.lat, self.lng, self.value, self.ts, self.device)
+
+
+class GridIndex:
+    """Uniform lat/lng grid over located readings for bounding-box and nearest-neighbour queries
+
+    Only readings newer than `retention` seconds are kept; prune() drops the rest.
+    """
+
+    def __init__(self, cell_size=0.01, retention=7 * 86400):
+        self.cell_size = cell_size
+        self.retention = retention
+        self.lock = threading.RLock()
+        self._cells = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _key(self, lat, lng):
+        return int(math.floor(lng / self.cell_size)), int(math.floor(lat / self.cell_size))
+
+    # ========== WRITES ==========
+    def add_many(self, readings):
+        """Index validated readings that carry lat/lng (`timestamp` in epoch seconds)"""
+        with self.lock:
+            for reading in readings:
+                lat = reading.get("lat")
+                if lat is None:
+                    continue
+                lng = reading["lng"]
+                key = self._key(lat, lng)
+                cell = self._cells.get(key)
+                if cell is None:
+                    cell = self._cells[key] = Cell()
+                cell.append(lat, lng, reading["value"], reading["timestamp"], reading["deviceId"])
+                self._count += 1
+
+    def prune(self, before):
+        """Drop readings older than `before` (epoch seconds) and return them"""
+        dropped = []
+        with self.lock:
+            for key, cell in list(self._cells.items()):
+                if min(cell.ts) >= before:
+                    continue
+                kept = Cell()
+                for row in cell.rows():
+                    if row[3] >= before:
+                        kept.append(*row)
+                    else:
+                        dropped.append(self._reading(*row))
+                self._count -= len(cell.ts) - len(kept.ts)
+                if kept.ts:
+                    self._cells[key] = kept
+                else:
+                    del self._cells[key]
+        return dropped
+
+    def rebuild(self, readings_store, now):
+        """Index the located readings of the last `retention` seconds from the readings store"""
+        with self.lock:
+            self._cells = {}
+            self._count = 0
+            start = now - self.retention
+            for device in readings_store.devices():
+                for batch in readings_store.scan(device, start=start):
+                    self.add_many({"deviceId": device, "timestamp": ts, "value": value, "lat": lat, "lng": lng}
+                                  for ts, value, lat, lng in batch if ts >= start and lat == lat)
+
+    # ========== QUERIES ==========
+    def points(self, min_lat, min_lng, max_lat, max_lng, since=None):
+        """(lat, lng, value, ts, device) rows inside the bounding box, in no particular order"""
+        x0, y0 = self._key(min_lat, min_lng)
+        x1, y1 = self._key(max_lat, max_lng)
+        since = -math.inf if since is None else since
+        found = []
+        with self.lock:
+            # Walk the covered cells, or every non-empty cell if that is fewer
+            if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(self._cells):
+                cells = (self._cells.get((x, y)) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+            else:
+                cells = (cell for (x, y), cell in self._cells.items() if x0 <= x <= x1 and y0 <= y <= y1)
+            for cell in cells:
+                if cell is None:
+                    continue
+                found.extend(row for row in cell.rows()
+                             if row[3] >= since and min_lat <= row[0] <= max_lat and min_lng <= row[1] <= max_lng)
+        return found
+
+    def within(self, min_lat, min_lng, max_lat, max_lng, since=None, limit=10000):
+        """Readings inside the bounding box, newest first"""
+        found = [(ts, lat, lng, value, device)
+                 for lat, lng, value, ts, device in self.points(min_lat, min_lng, max_lat, max_lng, since)]
+        found = heapq.nlargest(limit, found) if len(found) > limit else sorted(found, reverse=True)
+        return [self._reading(lat, lng, value, ts, device) for ts, lat, lng, value, device in found]
+
+    def nearest(self, lat, lng, k=10, since=None):
+        """The `k` readings closest to a point, nearest first, with `distance_km`"""
+        cx, cy = self._key(lat, lng)
+        since = -math.inf if since is None else since
+        best = []  # max-heap of (-distance, ...) holding the k nearest so far
+        with self.lock:
+            visited = 0
+            ring = 0
+            while visited < len(self._cells):
+                if ring == 0:
+                    keys = [(cx, cy)]
+                else:
+                    keys = [(x, y) for x in range(cx - ring, cx + ring + 1) for y in (cy - ring, cy + ring)]
+                    keys += [(x, y) for x in (cx - ring, cx + ring) for y in range(cy - ring + 1, cy + ring)]
+                exhaustive = len(keys) > len(self._cells)
+                if exhaustive:
+                    # The rings have outgrown the data: finish with the cells not visited yet
+                    keys = [key for key in self._cells if max(abs(key[0] - cx), abs(key[1] - cy)) >= ring]
+                for key in keys:
+                    cell = self._cells.get(key)
+                    if cell is None:
+                        continue
+                    visited += 1
+                    for row in cell.rows():
+                        if row[3] < since:
+                            continue
+                        distance = haversine_km(lat, lng, row[0], row[1])
+                        if len(best) < k:
+                            heapq.heappush(best, (-distance, row))
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, (-distance, row))
+                if exhaustive:
+                    break
+                # Anything beyond this ring is at least `ring` whole cells away along one axis
+                edge_lat = min(89.9, abs(lat) + (ring + 1) * self.cell_size)
+                bound = ring * self.cell_size * KM_PER_DEGREE * math.cos(math.radians(edge_lat))
+                if len(best) == k and -best[0][0] <= bound:
+                    break
+                ring += 1
+        results = []
+        for negative_distance, (r_lat, r_lng, value, ts, device) in sorted(best, reverse=True):
+            reading = self._reading(r_lat, r_lng, value, ts, device)
+            reading["distance_km"] = round(-negative_distance, 4)
+            results.append(reading)
+        return results
+
+    @staticmethod
+    def _reading(lat, lng, value, ts, device):
+        return {"deviceId": device, "timestamp": ts, "value": value, "lat": lat, "lng": lng}
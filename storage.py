@@ -0,0 +1,473 @@
+import atexit
+import copy
+import os
+import shutil
+import tempfile
+import threading
+import time
+from bisect import bisect_left, insort
+
+from fastjson import dumps, dumps_text, loads
+from metrics import STORAGE_SECONDS
+
+EMPTY_DATABASE = {"users": [], "profiles": [], "readings": [], "alerts": [], "settings": []}
+
+# Fields looked up by equality on hot paths; each maps value -> first matching record
+DEFAULT_INDEXES = {"users": ("id", "email"), "profiles": ("id", "userId")}
+ID_ORDER = '#order'  # stands for the `by_id` list where _index/_unindex take a list of fields
+
+
+class OperationLog:
+    """Append-only JSON-lines log of insert/update/delete operations"""
+
+    def __init__(self, path, fsync_batch=0):
+        self.path = path
+        self.fsync_batch = fsync_batch
+        self._file = None
+        self._unsynced = 0
+
+    def open(self):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self
+
+    def append(self, op):
+        """One small write per operation; fsync every `fsync_batch` appends (0 = leave it to sync())"""
+        self.open()
+        self._file.write(dumps_text(op) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self.fsync_batch and self._unsynced >= self.fsync_batch:
+            self.sync()
+
+    def sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def size(self):
+        return self._file.tell() if self._file is not None else 0
+
+    def rotate(self, rotated_path):
+        """Move the current log aside and start an empty one"""
+        self.close()
+        if os.path.exists(rotated_path) and os.path.exists(self.path):
+            # An earlier compaction failed; keep its operations ahead of ours
+            with open(rotated_path, 'ab') as dst, open(self.path, 'rb') as src:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.path)
+        elif os.path.exists(self.path):
+            os.replace(self.path, rotated_path)
+        self.open()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def replay(path):
+        """Yield logged operations, dropping a torn last line left by a crash"""
+        if not os.path.exists(path):
+            return
+        good_bytes = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    op = loads(line)
+                except ValueError:
+                    break
+                good_bytes += len(line)
+                yield op
+        if good_bytes < os.path.getsize(path):
+            print(f"⚠️  Truncating torn write at end of {path}")
+            with open(path, 'r+b') as f:
+                f.truncate(good_bytes)
+
+
+class DocumentStore:
+    """Process-resident copy of the JSON database backed by a snapshot plus an operation log
+
+    Writes cost one log append; the log is folded into a new snapshot once it
+    grows past `compact_bytes`, and on shutdown.
+    """
+
+    def __init__(self, path, flush_interval=1.0, compact_bytes=4 * 1024 * 1024, fsync_batch=0,
+                 indexes=DEFAULT_INDEXES):
+        self.path = path
+        self.log_path = os.path.splitext(path)[0] + '.wal'
+        self.flush_interval = flush_interval
+        self.compact_bytes = compact_bytes
+        self.lock = threading.RLock()
+        self.data = None
+        self.indexes = {name: {field: {} for field in fields} for name, fields in indexes.items()}
+        self.by_id = {}     # collection -> records with integer ids, in id order
+        self.counters = {}
+        self.versions = {}  # collection -> number of writes since the store was opened
+        self.log = OperationLog(self.log_path, fsync_batch=fsync_batch)
+        self._encoded = {}
+        self._compact_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._flusher = None
+
+    # ========== LIFECYCLE ==========
+    def open(self, default_data=None):
+        """Load the snapshot, replay the log and start the background flusher"""
+        with self.lock:
+            if self.data is not None:
+                return self
+            started = time.perf_counter()
+            has_snapshot = os.path.exists(self.path)
+            if has_snapshot:
+                try:
+                    with open(self.path, 'rb') as f:
+                        self.data = loads(f.read())
+                except Exception as e:
+                    print(f"⚠️  Error loading database: {e}")
+                    self.data = copy.deepcopy(EMPTY_DATABASE)
+            else:
+                self.data = copy.deepcopy(default_data or EMPTY_DATABASE)
+            self.counters = self.data.pop('_counters', {})
+            for name in EMPTY_DATABASE:
+                self.data.setdefault(name, [])
+            for name, items in self.data.items():
+                self._reindex(name)
+                # Files written before counters existed start from max(id)
+                top = max((item.get('id', 0) for item in items if isinstance(item.get('id'), int)), default=0)
+                self.counters[name] = max(self.counters.get(name, 0), top)
+
+            replayed = 0
+            for path in (self.log_path + '.1', self.log_path):
+                for op in OperationLog.replay(path):
+                    self._apply(op)
+                    replayed += 1
+            if replayed:
+                print(f"🔁 Replayed {replayed} logged operations")
+            self.log.open()
+            STORAGE_SECONDS.observe(time.perf_counter() - started, 'load')
+
+        if not has_snapshot or replayed:
+            self.compact()
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="radsafe-flusher", daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+        return self
+
+    def close(self):
+        """Stop the flusher and fold the log into the snapshot"""
+        self._stopping = True
+        self._wake.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=5)
+        if self.data is not None:
+            self.compact()
+        self.log.close()
+
+    def _flush_loop(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopping:
+                break
+            self.flush()
+
+    # ========== READS ==========
+    # Reads hand out shallow copies: the live records are mutated by writers under `lock`
+    def collection(self, name):
+        """Live list for a collection; hold `lock` while using it"""
+        if self.data is None:
+            self.open()
+        return self.data.setdefault(name, [])
+
+    def all(self, name):
+        with self.lock:
+            return [dict(item) for item in self.collection(name)]
+
+    def count(self, name):
+        with self.lock:
+            return len(self.collection(name))
+
+    def find_one(self, name, field, value):
+        with self.lock:
+            index = self.indexes.get(name, {}).get(field)
+            if index is not None:
+                if self.data is None:
+                    self.open()
+                bucket = index.get(value)
+                record = bucket[0] if bucket else None
+            else:
+                record = next((item for item in self.collection(name) if item.get(field) == value), None)
+            return dict(record) if record is not None else None
+
+    def ordered(self, name):
+        """Live records sorted by id; hold `lock` while using it"""
+        if self.data is None:
+            self.open()
+        return self.by_id.setdefault(name, [])
+
+    def find_many(self, name, field, values):
+        """{value: first record with that value} for each of `values` that is present"""
+        with self.lock:
+            return {value: dict(record) for value, record in self._find_many(name, field, values).items()}
+
+    def _find_many(self, name, field, values):
+        with self.lock:
+            index = self.indexes.get(name, {}).get(field)
+            if index is not None:
+                if self.data is None:
+                    self.open()
+                return {value: index[value][0] for value in values if value in index}
+            wanted = set(values)
+            found = {}
+            for item in self.collection(name):
+                value = item.get(field)
+                if value in wanted and value not in found:
+                    found[value] = item
+            return found
+
+    def snapshot(self):
+        with self.lock:
+            if self.data is None:
+                self.open()
+            return {name: [dict(item) for item in items] for name, items in self.data.items()}
+
+    # ========== WRITES ==========
+    def next_id(self, name, count=1):
+        """Reserve `count` ids from the collection's monotonic counter and return the first"""
+        with self.lock:
+            if self.data is None:
+                self.open()
+            first = self.counters.get(name, 0) + 1
+            self.counters[name] = first + count - 1
+            return first
+
+    def _advance(self, name, record):
+        # Records stored with an id of their own (imports) must not be handed that id again
+        if isinstance(record.get('id'), int):
+            self.counters[name] = max(self.counters.get(name, 0), record['id'])
+
+    def insert(self, name, record):
+        with self.lock:
+            self.collection(name).append(record)
+            self._index(name, record)
+            self._advance(name, record)
+            self._log({"op": "insert", "collection": name, "record": record})
+        return record
+
+    def insert_many(self, name, records):
+        """Append a batch of records with a single log write"""
+        with self.lock:
+            self.collection(name).extend(records)
+            for record in records:
+                self._index(name, record)
+                self._advance(name, record)
+            self._log({"op": "insert_many", "collection": name, "records": records})
+        return records
+
+    def update(self, name, record_id, changes):
+        """Merge `changes` into a record and return a copy of it, or None if it does not exist"""
+        with self.lock:
+            record = self._find_by_id(name, record_id)
+            if record is None:
+                return None
+            moved = self._unindex(name, record, changes)
+            record.update(changes)
+            self._index(name, record, moved)
+            self._log({"op": "update", "collection": name, "id": record_id, "changes": changes})
+            return dict(record)
+
+    def update_many(self, name, updates):
+        """Apply (record id, changes) pairs with a single log write; a copy of the record or None per pair"""
+        with self.lock:
+            found = self._find_many(name, 'id', [record_id for record_id, _ in updates])
+            applied = []
+            for record_id, changes in updates:
+                record = found.get(record_id)
+                if record is not None:
+                    moved = self._unindex(name, record, changes)
+                    record.update(changes)
+                    self._index(name, record, moved)
+                    applied.append({"id": record_id, "changes": changes})
+            if applied:
+                self._log({"op": "update_many", "collection": name, "updates": applied})
+            return [dict(found[record_id]) if record_id in found else None for record_id, _ in updates]
+
+    def delete(self, name, record_id):
+        with self.lock:
+            record = self._find_by_id(name, record_id)
+            if record is None:
+                return False
+            self._remove(name, record)
+            self._unindex(name, record)
+            self._log({"op": "delete", "collection": name, "id": record_id})
+            return True
+
+    def _log(self, op):
+        self._encoded.pop(op["collection"], None)
+        self.versions[op["collection"]] = self.versions.get(op["collection"], 0) + 1
+        self.log.append(op)
+        if self.log.size() >= self.compact_bytes:
+            self._wake.set()
+
+    def _apply(self, op):
+        # Replay is idempotent: a crash between writing a snapshot and retiring
+        # the rotated log replays operations the snapshot already contains.
+        name = op["collection"]
+        items = self.collection(name)
+        if op["op"] == "insert_many":
+            for record in op["records"]:
+                self._apply({"op": "insert", "collection": name, "record": record})
+        elif op["op"] == "insert":
+            record = op["record"]
+            existing = self._find_by_id(name, record.get('id')) if 'id' in record else None
+            if existing is None:
+                items.append(record)
+                self._index(name, record)
+            else:
+                self._unindex(name, existing)
+                existing.clear()
+                existing.update(record)
+                self._index(name, existing)
+            self._advance(name, record)
+        elif op["op"] == "update_many":
+            for update in op["updates"]:
+                self._apply({"op": "update", "collection": name, **update})
+        elif op["op"] == "update":
+            record = self._find_by_id(name, op["id"])
+            if record is not None:
+                moved = self._unindex(name, record, op["changes"])
+                record.update(op["changes"])
+                self._index(name, record, moved)
+        elif op["op"] == "delete":
+            record = self._find_by_id(name, op["id"])
+            if record is not None:
+                self._remove(name, record)
+                self._unindex(name, record)
+
+    def _remove(self, name, record):
+        items = self.collection(name)
+        # Ids are assigned in increasing order, so a binary search almost always lands on the record;
+        # records stored with ids of their own can break that order, and then it takes a scan
+        try:
+            position = bisect_left(items, record['id'], key=lambda item: item['id'])
+        except (KeyError, TypeError):   # records without comparable ids
+            position = len(items)
+        if position >= len(items) or items[position] is not record:
+            position = next(i for i in range(len(items) - 1, -1, -1) if items[i] is record)
+        del items[position]
+
+    def _find_by_id(self, name, record_id):
+        if "id" in self.indexes.get(name, {}):
+            bucket = self.indexes[name]["id"].get(record_id)
+            return bucket[0] if bucket else None
+        return next((item for item in self.collection(name) if item.get('id') == record_id), None)
+
+    # ========== INDEXES ==========
+    # Each index maps a value to the records holding it, oldest first; lookups answer with the first.
+    # `by_id` keeps every collection's records in id order for paging.
+    def _reindex(self, name):
+        for index in self.indexes.get(name, {}).values():
+            index.clear()
+        items = self.collection(name)
+        self.by_id[name] = sorted((item for item in items if isinstance(item.get('id'), int)),
+                                  key=lambda item: item['id'])
+        for record in items:
+            self._index(name, record, tuple(self.indexes.get(name, ())))
+
+    def _index(self, name, record, fields=None):
+        if (fields is None or ID_ORDER in fields) and isinstance(record.get('id'), int):
+            ordered = self.by_id.setdefault(name, [])
+            if not ordered or ordered[-1]['id'] < record['id']:
+                ordered.append(record)
+            else:
+                insort(ordered, record, key=lambda item: item['id'])
+        for field, index in self.indexes.get(name, {}).items():
+            if fields is not None and field not in fields:
+                continue
+            value = record.get(field)
+            if value is not None:
+                index.setdefault(value, []).append(record)
+
+    def _unindex(self, name, record, changes=None):
+        """Drop index entries for `record`, or only those `changes` would alter; returns the fields dropped"""
+        dropped = []
+        if changes is None or changes.get('id', record.get('id')) != record.get('id'):
+            dropped.append(ID_ORDER)
+            if isinstance(record.get('id'), int):
+                ordered = self.by_id[name]
+                position = bisect_left(ordered, record['id'], key=lambda item: item['id'])
+                while ordered[position] is not record:
+                    position += 1
+                del ordered[position]
+        for field, index in self.indexes.get(name, {}).items():
+            if changes is not None and (field not in changes or changes[field] == record.get(field)):
+                continue
+            dropped.append(field)
+            bucket = index.get(record.get(field))
+            if bucket is None:
+                continue
+            for position, item in enumerate(bucket):
+                if item is record:
+                    del bucket[position]
+                    break
+            if not bucket:
+                del index[record.get(field)]
+        return dropped
+
+    # ========== PERSISTENCE ==========
+    def flush(self):
+        """Make logged writes durable and compact once the log is large enough"""
+        with self.lock:
+            started = time.perf_counter()
+            self.log.sync()
+            STORAGE_SECONDS.observe(time.perf_counter() - started, 'sync')
+            due = self.log.size() >= self.compact_bytes
+        if due:
+            self.compact()
+        return due
+
+    def compact(self):
+        """Fold the log into a new snapshot written beside the old one and renamed over it"""
+        with self._compact_lock:
+            started = time.perf_counter()
+            with self.lock:
+                if self.data is None:
+                    return False
+                if not self.log.size() and not os.path.exists(self.log_path + '.1') and os.path.exists(self.path):
+                    return False
+                for name, items in self.data.items():
+                    if name not in self._encoded:
+                        # Compact '"name":[...]', encoded one collection at a time
+                        self._encoded[name] = dumps({name: items})[1:-1]
+                fragments = [self._encoded[name] for name in self.data]
+                fragments.append(dumps({"_counters": self.counters})[1:-1])
+                document = b"{" + b",".join(fragments) + b"}"
+                self.log.rotate(self.log_path + '.1')
+
+            try:
+                self._atomic_write(document)
+            except Exception as e:
+                # The rotated log is kept and replayed on the next start
+                print(f"❌ Error saving database: {e}")
+                return False
+            if os.path.exists(self.log_path + '.1'):
+                os.remove(self.log_path + '.1')
+            STORAGE_SECONDS.observe(time.perf_counter() - started, 'compact')
+            return True
+
+    def _atomic_write(self, document):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".radsafe-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(document)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
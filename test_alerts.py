@@ -0,0 +1,90 @@
+from alerts import DANGER, WARNING, AlertEngine
+from repository import JsonRepository
+
+
+def feed(engine, device, values, start=0.0, step=1.0):
+    """One reading per `step` seconds; total alerts raised"""
+    return engine.evaluate([{"deviceId": device, "timestamp": start + i * step, "value": v}
+                            for i, v in enumerate(values)])
+
+
+def quiet(**overrides):
+    """Thresholds with the rate rule out of the way"""
+    return dict({"ratePerMinute": 1000}, **overrides)
+
+
+def test_level_must_be_sustained():
+    engine = AlertEngine()
+    engine.set_thresholds(None, "d", quiet(sustainSeconds=5))
+    assert feed(engine, "d", [0.3] * 3 + [0.1] * 3 + [0.3] * 5) == 0
+    assert feed(engine, "d", [0.3], start=11) == 1
+    assert engine._inserts[0]["type"] == WARNING and engine._inserts[0]["rule"] == "level"
+
+
+def test_hysteresis_keeps_level_near_threshold():
+    engine = AlertEngine()
+    engine.set_thresholds(None, "d", quiet(sustainSeconds=0, hysteresis=0.05))
+    feed(engine, "d", [0.25, 0.18, 0.16])
+    state = engine._states[(None, "d")]
+    assert state.level == WARNING and engine._inserts[0]["resolvedAt"] is None
+    feed(engine, "d", [0.1], start=3)
+    assert engine._inserts[0]["resolvedAt"] is not None
+
+
+def test_repeats_within_cooldown_are_coalesced():
+    engine = AlertEngine()
+    engine.set_thresholds(None, "d", quiet(sustainSeconds=0, hysteresis=0, cooldownSeconds=60))
+    assert feed(engine, "d", [0.3, 0.1, 0.4, 0.1]) == 1
+    alert = engine._inserts[0]
+    assert alert["count"] == 2 and alert["peak"] == 0.4
+    # After the cooldown the same rule raises a new alert, and DANGER always does
+    assert feed(engine, "d", [0.3], start=100) == 1
+    assert feed(engine, "d", [0.6], start=101) == 1
+    assert [a["type"] for a in engine._inserts] == [WARNING, WARNING, DANGER]
+
+
+def test_fast_rise_raises_rate_alert():
+    engine = AlertEngine()
+    engine.set_thresholds(None, "d", {"warning": 10, "danger": 20, "ratePerMinute": 0.6})
+    assert feed(engine, "d", [0.10, 0.11, 0.12, 0.13, 0.14, 0.15, 0.16]) == 1
+    alert = engine._inserts[0]
+    assert alert["rule"] == "rate" and alert["rate"] == 0.6
+
+
+def test_thresholds_apply_per_subscriber():
+    engine = AlertEngine()
+    engine.load_settings([
+        {"userId": 1, "deviceId": "d", "warning": 0.1, "sustainSeconds": 0},
+        {"userId": 2, "deviceId": "d", "warning": 0.3, "sustainSeconds": 0},
+        {"userId": 3, "warning": 0.01},  # no device: ignored
+    ])
+    assert feed(engine, "d", [0.15]) == 1
+    assert engine._inserts[0]["userId"] == 1
+    # Devices nobody configured use the defaults
+    assert feed(engine, "other", [0.3] * 12, start=10) == 1
+    assert engine._inserts[1]["userId"] is None
+
+
+def test_out_of_order_readings_are_ignored():
+    engine = AlertEngine()
+    engine.set_thresholds(None, "d", quiet(sustainSeconds=0))
+    feed(engine, "d", [0.1], start=10)
+    assert feed(engine, "d", [0.9], start=5) == 0
+
+
+def test_flush_inserts_then_updates(tmp_path):
+    repo = JsonRepository(str(tmp_path / 'db.json'), flush_interval=3600).open({"alerts": []})
+    engine = AlertEngine()
+    engine.set_thresholds(None, "d", quiet(sustainSeconds=0, hysteresis=0))
+    feed(engine, "d", [0.3, 0.1, 0.3])
+    # The repeat happened before the insert was written, so one insert carries it
+    assert engine.flush(repo) == 1
+    [saved] = repo.all('alerts')
+    assert saved["count"] == 2 and "_lastSeen" not in saved
+    assert engine.flush(repo) == 0
+
+    feed(engine, "d", [0.1, 0.3], start=3)
+    assert engine.pending == 1
+    assert engine.flush(repo) == 1
+    assert repo.all('alerts')[0]["count"] == 3
+    repo.close()
@@ -0,0 +1,77 @@
+import asyncio
+
+from async_server import AsyncServer
+from fastjson import loads
+
+
+async def started(server, handler):
+    listener = await asyncio.start_server(handler, '127.0.0.1', 0)
+    return listener, listener.sockets[0].getsockname()[1]
+
+
+async def http_get(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n".encode('ascii'))
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ")[1]), body
+
+
+def test_http_routes():
+    async def scenario():
+        server = AsyncServer()
+        listener, port = await started(server, server.handle_http)
+        async with listener:
+            status, body = await http_get(port, '/api/health')
+            assert status == 200 and loads(body)['status'] == 'healthy'
+            status, _ = await http_get(port, '/api/missing')
+            assert status == 404
+    asyncio.run(scenario())
+
+
+def test_sensor_readings_are_broadcast_and_stored():
+    stored = []
+
+    async def scenario():
+        server = AsyncServer(ingest=stored.extend)
+        subscription = server.radiation_stream.subscribe()
+        listener, port = await started(server, server.handle_sensor)
+        async with listener:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'{"deviceId": "s1", "value": 0.12, "timestamp": 1700000000}\n'
+                         b'{"deviceId": "s1", "value": -1}\n'
+                         b'{"deviceId": "s2", "value": 0.2, "timestamp": 1700000001}\n')
+            await writer.drain()
+            error = loads(await asyncio.wait_for(reader.readline(), 5))
+            assert 'value' in error['error']
+            writer.close()
+            for _ in range(100):
+                if len(server._unstored) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            assert await server.flush_readings() == 2
+        return subscription.drain()
+
+    frames = asyncio.run(scenario())
+    assert [r['deviceId'] for r in stored] == ["s1", "s2"]
+    assert len(frames) == 2 and all(frame.startswith(b"event: reading\n") for frame in frames)
+
+
+def test_failed_ingest_keeps_readings_for_the_next_flush():
+    calls = []
+
+    def flaky(readings):
+        calls.append(list(readings))
+        if len(calls) == 1:
+            raise ConnectionError("database server down")
+
+    async def scenario():
+        server = AsyncServer(ingest=flaky)
+        server._unstored.extend([{"deviceId": "s1", "value": 1.0, "timestamp": 1.0}])
+        assert await server.flush_readings() == 0
+        assert await server.flush_readings() == 1
+        assert server._unstored == []
+
+    asyncio.run(scenario())
+    assert calls[0] == calls[1]
@@ -0,0 +1,62 @@
+import json
+
+import clean_backend
+from broadcast import Broadcaster, encode_event
+
+
+def parse(frame):
+    lines = frame.decode('utf-8').strip().split('\n')
+    fields = dict(line.split(': ', 1) for line in lines)
+    return fields.get('event'), json.loads(fields['data'])
+
+
+def test_encode_event():
+    assert encode_event({"a": 1}) == b'data: {"a":1}\n\n'
+    assert parse(encode_event({"a": 1}, event='radiation')) == ('radiation', {"a": 1})
+
+
+def test_every_subscriber_gets_the_same_frame():
+    broadcaster = Broadcaster()
+    first, second = broadcaster.subscribe(), broadcaster.subscribe()
+    assert broadcaster.publish({"n": 1}) == 2
+    frame = first.get(timeout=1)
+    assert frame is second.get(timeout=1)
+    assert first.get(timeout=0) is None
+
+
+def test_new_subscriber_starts_with_latest_frame():
+    broadcaster = Broadcaster()
+    broadcaster.publish({"n": 1})
+    broadcaster.publish({"n": 2})
+    assert parse(broadcaster.subscribe().get(timeout=1)) == (None, {"n": 2})
+
+
+def test_slow_subscriber_is_dropped():
+    broadcaster = Broadcaster(max_queue=2)
+    slow, fast = broadcaster.subscribe(), broadcaster.subscribe()
+    for n in range(3):
+        broadcaster.publish({"n": n})
+        fast.drain()
+    assert slow.dropped and not fast.dropped
+    assert len(broadcaster) == 1
+    assert slow.get(timeout=0) is None
+
+
+def test_closed_subscription_stops_receiving():
+    broadcaster = Broadcaster()
+    subscription = broadcaster.subscribe()
+    subscription.close()
+    assert broadcaster.publish({"n": 1}) == 0
+
+
+def test_stream_endpoint_relays_frames():
+    client = clean_backend.create_app().test_client()
+    response = client.get('/api/radiation/stream', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    chunks = iter(response.response)
+    assert next(chunks) == b"retry: 3000\n\n"
+    event, data = parse(next(chunks))
+    assert event == 'radiation' and 'radiation_level' in data
+    response.close()
+    assert len(clean_backend.radiation_stream) == 0
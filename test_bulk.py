@@ -0,0 +1,102 @@
+import os
+import tempfile
+
+import pytest
+
+from passwords import PasswordHasher
+
+# database.py configures itself from the environment at import
+_workdir = tempfile.mkdtemp(prefix='radsafe-test-')
+for name, default in (('RADSAFE_DB_FILE', 'db.json'), ('RADSAFE_READINGS_DIR', 'readings'),
+                      ('RADSAFE_TOKEN_SECRET_FILE', 'token.key')):
+    os.environ.setdefault(name, os.path.join(_workdir, default))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    database.init_database()
+    monkeypatch.setattr(database, 'password_hasher', PasswordHasher(workers=0, n=2 ** 10))
+    return database.create_app().test_client()
+
+
+def statuses(body):
+    return [result['status'] for result in body['results']]
+
+
+# ========== USERS ==========
+def test_users_are_created_and_updated_in_request_order(client):
+    body = client.post('/api/users/bulk', json={"users": [
+        {"email": "bulk-a@x", "name": "A"},
+        {"email": "bulk-b@x", "name": "B", "role": "admin"},
+        {"email": "bulk-a@x", "name": "A again"},
+        {"name": "no email"},
+        {"id": 10 ** 9, "name": "missing"},
+    ]}).get_json()
+    assert statuses(body) == [201, 201, 409, 400, 404]
+    assert (body['created'], body['updated'], body['failed'], body['success']) == (2, 0, 3, False)
+    first, second = (result['id'] for result in body['results'][:2])
+
+    body = client.post('/api/users/bulk', json=[
+        {"id": first, "email": "bulk-b@x"},
+        {"id": second, "email": "bulk-c@x", "name": "B2"},
+        {"id": first, "email": "bulk-b@x"},
+    ]).get_json()
+    # bulk-b@x is free once the second user moved off it earlier in the same request
+    assert statuses(body) == [409, 200, 200]
+    users = {user['id']: user for user in database.repo.all('users')}
+    assert users[first]['email'] == "bulk-b@x"
+    assert (users[second]['email'], users[second]['name'], users[second]['role']) == ("bulk-c@x", "B2", "admin")
+
+
+def test_plaintext_passwords_are_hashed(client):
+    body = client.post('/api/users/bulk', json=[{"email": "bulk-p@x", "name": "P", "password": "secret"}]).get_json()
+    user = database.repo.find_one('users', 'id', body['results'][0]['id'])
+    assert user['password'] != "secret"
+    assert database.password_hasher.verify("secret", user['password']) == (True, False)
+
+
+
+def test_imported_hashes_costlier_than_ours_are_rejected(client):
+    weaker = PasswordHasher(workers=0, n=2 ** 8).hash("secret")
+    body = client.post('/api/users/bulk', json=[
+        {"email": "bulk-h1@x", "name": "H", "password": weaker},
+        {"email": "bulk-h2@x", "name": "H", "password": "scrypt$1048576$8$1$c2FsdA==$ZGlnZXN0"},
+    ]).get_json()
+    assert statuses(body) == [201, 400]
+    user = database.repo.find_one('users', 'email', "bulk-h1@x")
+    assert user['password'] == weaker
+    assert database.repo.find_one('users', 'email', "bulk-h2@x") is None
+
+
+def test_bad_bodies_are_rejected(client, monkeypatch):
+    assert client.post('/api/users/bulk', json={"users": "nope"}).status_code == 400
+    assert client.post('/api/users/bulk', json=[1, 2]).status_code == 400
+    monkeypatch.setattr(database, 'MAX_BULK_ITEMS', 2)
+    assert client.post('/api/users/bulk', json=[{}, {}, {}]).status_code == 400
+    body = client.post('/api/users/bulk', json=[{"email": 5, "name": "N"}, {"email": "x@x", "name": "N", "password": 1}])
+    assert statuses(body.get_json()) == [400, 400]
+
+
+# ========== PROFILES ==========
+def test_profiles_are_patched_by_id_or_user(client):
+    users = client.post('/api/users/bulk', json=[{"email": f"bulk-prof{i}@x", "name": "P"} for i in range(2)])
+    first, second = (result['id'] for result in users.get_json()['results'])
+    profile = database.repo.insert('profiles', {"userId": first, "bio": "old"})
+
+    body = client.patch('/api/profiles/bulk', json={"profiles": [
+        {"id": profile['id'], "bio": "by id"},
+        {"userId": second, "bio": "new"},
+        {"userId": second, "location": "Oslo"},
+        {"id": 10 ** 9, "bio": "missing"},
+        {"bio": "no key"},
+    ]}).get_json()
+    assert statuses(body) == [200, 201, 201, 404, 400]
+    assert body['results'][1]['id'] == body['results'][2]['id']
+    assert database.repo.find_one('profiles', 'id', profile['id'])['bio'] == "by id"
+    created = database.repo.find_one('profiles', 'userId', second)
+    assert (created['bio'], created['location']) == ("new", "Oslo")
+
+    body = client.patch('/api/profiles/bulk', json=[{"userId": first, "bio": "by user"}]).get_json()
+    assert body['results'] == [{"index": 0, "status": 200, "id": profile['id']}]
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from geocache import GeocodeCache
+from repository import SqliteRepository
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork()")
+
+
+def in_child(check):
+    """Run `check()` in a forked child; True if it returned truthy there"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os._exit(0 if check() else 1)
+        except BaseException:
+            os._exit(2)
+    return os.waitpid(pid, 0)[1] == 0
+
+
+def test_geocode_cache_reopens_sqlite_after_fork(tmp_path):
+    cache = GeocodeCache(resolver=lambda query: (1.0, 2.0), path=str(tmp_path / 'geocode.db'))
+    inherited = cache._db
+    cache.lookup("Paris")
+
+    def check():
+        if cache._db is not None:
+            return False
+        return cache.lookup("Berlin") == (1.0, 2.0) and cache._db is not inherited
+
+    assert in_child(check)
+    assert cache._db is inherited
+    cache.close()
+    # What the child stored is visible to the next process
+    reopened = GeocodeCache(resolver=lambda query: None, path=str(tmp_path / 'geocode.db'))
+    assert reopened.lookup("berlin") == (1.0, 2.0)
+    reopened.close()
+
+
+def test_sqlite_repository_opens_own_connection_after_fork(tmp_path):
+    repo = SqliteRepository(str(tmp_path / 'db.sqlite')).open()
+    repo.insert('users', {"email": "parent@x"})
+    inherited = repo._connection()
+
+    def check():
+        return repo._connection() is not inherited and repo.insert('users', {"email": "child@x"})['id'] == 2
+
+    assert in_child(check)
+    assert [u['email'] for u in repo.all('users')] == ["parent@x", "child@x"]
+    repo.close()
@@ -0,0 +1,109 @@
+import threading
+import types
+
+import pytest
+
+import geocache
+from geocache import GeocodeCache
+
+
+class Resolver:
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    def __call__(self, query):
+        self.calls.append(query)
+        answer = self.answers[query]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(geocache, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_hits_skip_the_resolver_and_queries_are_normalized(clock):
+    resolver = Resolver({"Paris": (48.85, 2.35)})
+    cache = GeocodeCache(resolver=resolver)
+    assert cache.lookup("Paris") == (48.85, 2.35)
+    assert cache.lookup("  paris ") == (48.85, 2.35)
+    assert resolver.calls == ["Paris"]
+
+
+def test_entries_expire_after_ttl(clock):
+    resolver = Resolver({"Paris": (48.85, 2.35), "Atlantis": None})
+    cache = GeocodeCache(resolver=resolver, ttl=100, negative_ttl=10)
+    cache.lookup("Paris")
+    assert cache.lookup("Atlantis") is None
+    clock[0] += 11
+    cache.lookup("Paris")
+    cache.lookup("Atlantis")
+    assert resolver.calls == ["Paris", "Atlantis", "Atlantis"]
+    clock[0] += 100
+    cache.lookup("Paris")
+    assert resolver.calls[-1] == "Paris"
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    resolver = Resolver({"a": (1.0, 1.0), "b": (2.0, 2.0), "c": (3.0, 3.0)})
+    cache = GeocodeCache(resolver=resolver, max_entries=2)
+    cache.lookup("a")
+    cache.lookup("b")
+    cache.lookup("a")
+    cache.lookup("c")
+    assert list(cache._entries) == ["a", "c"]
+    cache.lookup("b")
+    assert resolver.calls == ["a", "b", "c", "b"]
+
+
+def test_errors_are_not_cached(clock):
+    resolver = Resolver({"Paris": OSError("timed out")})
+    cache = GeocodeCache(resolver=resolver)
+    with pytest.raises(OSError):
+        cache.lookup("Paris")
+    resolver.answers["Paris"] = (48.85, 2.35)
+    assert cache.lookup("Paris") == (48.85, 2.35)
+    assert len(resolver.calls) == 2
+
+
+def test_concurrent_misses_share_one_call():
+    release = threading.Event()
+    calls = []
+
+    def resolver(query):
+        calls.append(query)
+        release.wait(5)
+        return (1.0, 2.0)
+
+    cache = GeocodeCache(resolver=resolver)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.lookup("Paris"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while not cache._inflight:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == [(1.0, 2.0)] * 8
+    assert calls == ["Paris"]
+
+
+def test_answers_persist_across_instances(tmp_path, clock):
+    path = str(tmp_path / 'geocode.db')
+    cache = GeocodeCache(resolver=Resolver({"Paris": (48.85, 2.35), "Atlantis": None}), path=path)
+    cache.lookup("Paris")
+    cache.lookup("Atlantis")
+    cache.close()
+
+    resolver = Resolver({})
+    reopened = GeocodeCache(resolver=resolver, path=path)
+    assert reopened.lookup("paris") == (48.85, 2.35)
+    assert reopened.lookup("atlantis") is None
+    assert resolver.calls == []
+    reopened.close()
@@ -0,0 +1,51 @@
+from flask import Flask
+
+from httpcache import ResponseCache
+from repository import JsonRepository, SqliteRepository
+
+
+def worker(repo):
+    """One worker process's app: a cached list of users"""
+    app = Flask(__name__)
+    cache = ResponseCache(repo)
+
+    @app.route('/api/users')
+    @cache.cached('users')
+    def users():
+        return {"users": repo.all('users')}
+
+    return app.test_client()
+
+
+def test_sqlite_etags_match_across_workers(tmp_path):
+    path = str(tmp_path / 'db.sqlite')
+    first, second = SqliteRepository(path).open(), SqliteRepository(path).open()
+    first.insert('users', {"email": "a@x"})
+    etag = worker(first).get('/api/users').headers['ETag']
+
+    other = worker(second)
+    assert other.get('/api/users', headers={'If-None-Match': etag}).status_code == 304
+    second.insert('users', {"email": "b@x"})
+    response = worker(first).get('/api/users', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+    assert other.get('/api/users', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    first.close()
+    second.close()
+
+
+def test_sqlite_versions_do_not_carry_over_to_a_new_file(tmp_path):
+    repo = SqliteRepository(str(tmp_path / 'db.sqlite')).open()
+    before = repo.version('users')
+    repo.close()
+    (tmp_path / 'db.sqlite').unlink()
+    fresh = SqliteRepository(str(tmp_path / 'db.sqlite')).open()
+    assert fresh.version('users') != before
+    fresh.close()
+
+
+def test_json_etags_are_per_process(tmp_path):
+    repo = JsonRepository(str(tmp_path / 'db.json'), flush_interval=3600).open()
+    etag = worker(repo).get('/api/users').headers['ETag']
+    # Another process counts its own writes, so the same version number is not the same data
+    assert worker(repo).get('/api/users', headers={'If-None-Match': etag}).status_code == 200
+    repo.close()
@@ -0,0 +1,41 @@
+import sqlite3
+
+import pytest
+
+from migrate_to_sqlite import migrate
+from repository import JsonRepository, SqliteRepository
+
+
+def test_migrate_keeps_records_ids_and_counters(tmp_path):
+    json_path, sqlite_path = str(tmp_path / 'db.json'), str(tmp_path / 'db.sqlite')
+    source = JsonRepository(json_path, flush_interval=3600).open({"users": [], "profiles": []})
+    source.insert_many('users', [{"email": f"u{i}@x"} for i in range(3)])
+    source.delete('users', 3)
+    source.insert('profiles', {"userId": 2})
+    source.close()
+
+    counts = migrate(json_path, sqlite_path)
+    assert counts['users'] == 2 and counts['profiles'] == 1
+
+    target = SqliteRepository(sqlite_path).open()
+    assert [u['email'] for u in target.all('users')] == ["u0@x", "u1@x"]
+    # The deleted id 3 is not handed out again
+    assert target.insert('users', {"email": "new@x"})['id'] == 4
+    target.close()
+
+
+def test_migrate_refuses_missing_source(tmp_path):
+    sqlite_path = tmp_path / 'db.sqlite'
+    with pytest.raises(FileNotFoundError):
+        migrate(str(tmp_path / 'missing.json'), str(sqlite_path))
+    assert not sqlite_path.exists()
+
+
+def test_migrate_refuses_non_empty_target(tmp_path):
+    json_path, sqlite_path = str(tmp_path / 'db.json'), str(tmp_path / 'db.sqlite')
+    JsonRepository(json_path).open({"users": [{"id": 1, "email": "a@x"}]}).close()
+    migrate(json_path, sqlite_path)
+    with pytest.raises(RuntimeError):
+        migrate(json_path, sqlite_path)
+    with sqlite3.connect(sqlite_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
@@ -0,0 +1,80 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from fastjson import loads
+from minihttp import HttpError, ThreadPoolServer, parse_head
+
+
+def handler(request):
+    if request.path == '/echo':
+        return 200, {"method": request.method, "args": request.args, "body": request.json()}
+    raise HttpError(404, "Not found")
+
+
+@pytest.fixture
+def server():
+    server = ThreadPoolServer(handler, host='127.0.0.1', port=0, workers=2, request_timeout=0.5)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if server._running:
+            break
+        time.sleep(0.01)
+    yield server
+    server.shutdown()
+
+
+def connect(server):
+    sock = socket.create_connection(server.sock.getsockname(), timeout=5)
+    return sock
+
+
+def read_response(sock):
+    data = b""
+    while b"\r\n\r\n" not in data:
+        data += sock.recv(65536)
+    head, _, body = data.partition(b"\r\n\r\n")
+    length = int(next(line.split(b":")[1] for line in head.split(b"\r\n") if line.lower().startswith(b"content-length")))
+    while len(body) < length:
+        body += sock.recv(65536)
+    return int(head.split(b" ")[1]), loads(body[:length])
+
+
+def test_parse_head():
+    request = parse_head(b"GET /a/b?x=1 HTTP/1.1\r\nHost: h\r\nConnection: close")
+    assert (request.method, request.path, request.args) == ('GET', '/a/b', {'x': '1'})
+    assert not request.keep_alive
+    with pytest.raises(HttpError):
+        parse_head(b"nonsense")
+
+
+def test_keep_alive_and_pipelining(server):
+    sock = connect(server)
+    body = b'{"n": 1}'
+    sock.sendall(b"GET /echo?x=1 HTTP/1.1\r\nHost: t\r\n\r\n"
+                 b"POST /echo HTTP/1.1\r\nHost: t\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+    assert read_response(sock) == (200, {"method": "GET", "args": {"x": "1"}, "body": None})
+    assert read_response(sock) == (200, {"method": "POST", "args": {}, "body": {"n": 1}})
+    sock.sendall(b"GET /missing HTTP/1.1\r\nHost: t\r\n\r\n")
+    assert read_response(sock)[0] == 404
+    sock.close()
+
+
+def test_trickling_client_is_cut_off_at_the_request_deadline(server):
+    sock = connect(server)
+    started = time.monotonic()
+    request = b"GET /echo HTTP/1.1\r\nHost: t\r\nX-Padding: " + b"a" * 40
+    try:
+        for byte in request:
+            sock.sendall(bytes([byte]))
+            time.sleep(0.05)
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    status, _ = read_response(sock)
+    assert status == 408
+    # Each byte arrived well within the timeout; only the whole-request deadline stops it
+    assert time.monotonic() - started < 2.0
+    sock.close()
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+import tokens
+from passwords import PBKDF2_ITERATIONS, PasswordHasher, PasswordHasherBusy, is_hashed
+from tokens import TokenSigner, load_secret
+
+
+@pytest.fixture
+def hasher():
+    return PasswordHasher(workers=0, n=2 ** 10)
+
+
+# ========== PASSWORDS ==========
+def test_hash_and_verify(hasher):
+    stored = hasher.hash("secret")
+    assert is_hashed(stored) and stored.startswith(hasher.prefix)
+    assert hasher.verify("secret", stored) == (True, False)
+    assert hasher.verify("wrong", stored) == (False, False)
+    assert hasher.hash("secret") != stored
+    assert [hasher.verify("p1", h)[0] for h in hasher.hash_many(["p1"] * 3)] == [True] * 3
+
+
+def test_old_parameters_and_plaintext_need_rehash(hasher):
+    weaker = PasswordHasher(workers=0, n=2 ** 8).hash("secret")
+    assert hasher.verify("secret", weaker) == (True, True)
+    assert hasher.verify("secret", "secret") == (True, True)
+    assert hasher.verify("secret", None) == (False, False)
+
+
+def test_affordable_rejects_costlier_parameters(hasher):
+    assert hasher.affordable(hasher.hash("secret"))
+    assert hasher.affordable(PasswordHasher(workers=0, n=2 ** 8).hash("secret"))
+    assert not hasher.affordable("scrypt$1048576$8$1$c2FsdA==$ZGlnZXN0")
+    assert not hasher.affordable("scrypt$1024$64$1$c2FsdA==$ZGlnZXN0")
+    assert not hasher.affordable("scrypt$1000$8$1$c2FsdA==$ZGlnZXN0")
+    assert not hasher.affordable("scrypt$x$8$1$c2FsdA==$ZGlnZXN0")
+    assert hasher.affordable(f"pbkdf2_sha256${PBKDF2_ITERATIONS}$c2FsdA==$ZGlnZXN0")
+    assert not hasher.affordable(f"pbkdf2_sha256${PBKDF2_ITERATIONS * 100}$c2FsdA==$ZGlnZXN0")
+
+
+def test_full_queue_is_refused():
+    hasher = PasswordHasher(workers=0, max_pending=1, n=2 ** 10)
+    hasher._slots.acquire()   # a hash in progress
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash("secret")
+    hasher._slots.release()
+    assert is_hashed(hasher.hash("secret"))
+
+
+# ========== TOKENS ==========
+def test_token_round_trip_and_tampering():
+    signer = TokenSigner(b"key", ttl=60)
+    token = signer.issue({"id": 7, "role": "admin"})
+    claims = signer.verify(token)
+    assert (claims["sub"], claims["role"]) == (7, "admin")
+    assert signer.verify(token) == claims and signer.hits == 1
+    payload, _, signature = token.partition('.')
+    assert signer.verify(payload + "." + signature[::-1]) is None
+    assert TokenSigner(b"other").verify(token) is None
+    assert signer.verify("garbage") is None
+
+
+def test_expired_tokens_are_refused_even_when_cached(monkeypatch):
+    signer = TokenSigner(b"key", ttl=60)
+    token = signer.issue({"id": 1})
+    assert signer.verify(token) is not None
+    now = time.time()
+    monkeypatch.setattr(tokens.time, 'time', lambda: now + 61)
+    assert signer.verify(token) is None
+    assert TokenSigner(b"key").verify(token) is None
+
+
+def test_verified_tokens_are_bounded():
+    signer = TokenSigner(b"key", cache_entries=2)
+    for user_id in range(5):
+        signer.verify(signer.issue({"id": user_id}))
+    assert len(signer._verified) == 2
+
+
+def test_secret_is_created_once(tmp_path):
+    path = str(tmp_path / 'token.key')
+    secret = load_secret(path)
+    assert len(secret) == 64 and load_secret(path) == secret
@@ -0,0 +1,53 @@
+from flask import Flask
+
+from ratelimit import TokenBuckets, limit_requests, parse_budget
+
+
+def test_parse_budget():
+    assert parse_budget('5/10') == (5.0, 10.0)
+    assert parse_budget('5') == (5.0, 5.0)
+    assert parse_budget('0') is None
+
+
+# ========== TOKEN BUCKETS ==========
+def test_bucket_spends_burst_then_refills():
+    buckets = TokenBuckets(rate=2, burst=3)
+    client = ('10.0.0.1', None)
+    assert [buckets.take(client, now=0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.take(client, now=0) == 0.5
+    assert buckets.take(client, now=0.5) == 0.0
+    assert buckets.take(('10.0.0.2', None), now=0.5) == 0.0
+
+
+def test_idle_buckets_are_dropped():
+    buckets = TokenBuckets(rate=1, burst=2, max_keys=10)
+    for i in range(5):
+        buckets.take((f'10.0.0.{i}', None), now=0)
+    buckets.take(('10.0.0.9', None), now=10)
+    assert len(buckets) == 1
+
+
+def test_identities_per_address_are_capped():
+    buckets = TokenBuckets(rate=1, burst=1, max_per_address=2)
+    assert buckets.take(('10.0.0.1', 'user:1'), now=0) == 0.0
+    assert buckets.take(('10.0.0.1', 'user:2'), now=0) == 0.0
+    # A third account from the address shares the address's own bucket
+    assert buckets.take(('10.0.0.1', 'user:3'), now=0) == 0.0
+    assert buckets.take(('10.0.0.1', 'user:4'), now=0) == 1.0
+    assert buckets.take(('10.0.0.1', None), now=0) == 1.0
+    assert buckets.take(('10.0.0.2', 'user:3'), now=0) == 0.0
+
+
+# ========== FLASK ==========
+def test_rotating_device_ids_share_one_bucket():
+    app = Flask(__name__)
+
+    @app.route('/api/radiation/current')
+    def current():
+        return 'ok'
+
+    client = limit_requests(app, 'test').test_client()
+    statuses = [client.get('/api/radiation/current', headers={'X-Device-ID': f'sensor-{i}'}).status_code
+                for i in range(12)]
+    # The route's budget is 5/10: ten requests, then 429 whatever the header says
+    assert statuses == [200] * 10 + [429] * 2
@@ -0,0 +1,108 @@
+import os
+import resource
+import tempfile
+from array import array
+
+import pytest
+
+from timeseries import ReadingsStore
+
+# database.py configures itself from the environment at import
+_workdir = tempfile.mkdtemp(prefix='radsafe-test-')
+os.environ.update({
+    'RADSAFE_DB_FILE': os.path.join(_workdir, 'db.json'),
+    'RADSAFE_READINGS_DIR': os.path.join(_workdir, 'readings'),
+    'RADSAFE_TOKEN_SECRET_FILE': os.path.join(_workdir, 'token.key'),
+})
+
+import database  # noqa: E402
+
+START = 1700000000.0
+
+
+def burst(device, count, per_ms):
+    """`count` readings, `per_ms` of them in each millisecond"""
+    return [{"deviceId": device, "timestamp": START + (i // per_ms) / 1000.0, "value": float(i)}
+            for i in range(count)]
+
+
+def read_all(client, device, limit):
+    values, pages, after = [], 0, None
+    while True:
+        query = {'device': device, 'from': START, 'to': START + 60, 'limit': limit}
+        if after is not None:
+            query['after'] = after
+        body = client.get('/api/readings', query_string=query).get_json()
+        values += [r['value'] for r in body['readings']]
+        pages += 1
+        after = body['nextCursor']
+        if after is None:
+            return values, pages
+
+
+@pytest.fixture
+def client():
+    return database.create_app().test_client()
+
+
+# ========== CURSOR PAGING ==========
+def test_pages_keep_readings_that_share_a_millisecond(client):
+    database.readings_store.append_many(burst('same-ms', 1220, 7))
+    values, pages = read_all(client, 'same-ms', 50)
+    assert sorted(values) == [float(i) for i in range(1220)]
+    assert pages == 25
+
+
+def test_one_millisecond_spans_several_pages(client):
+    database.readings_store.append_many(burst('one-ms', 10, 10))
+    values, _ = read_all(client, 'one-ms', 3)
+    assert sorted(values) == [float(i) for i in range(10)]
+
+
+def test_bare_millisecond_cursor_resumes_after_it(client):
+    database.readings_store.append_many(burst('legacy', 6, 2))
+    query = {'device': 'legacy', 'from': START, 'to': START + 60, 'after': int(START * 1000)}
+    body = client.get('/api/readings', query_string=query).get_json()
+    assert [r['value'] for r in body['readings']] == [2.0, 3.0, 4.0, 5.0]
+    query['after'] = 'not-a-cursor'
+    assert client.get('/api/readings', query_string=query).status_code == 400
+
+
+# ========== CHUNK FILES ==========
+def test_append_after_torn_write_keeps_columns_aligned(tmp_path):
+    store = ReadingsStore(str(tmp_path), chunk_seconds=3600)
+    store.append_many([{"deviceId": "d", "timestamp": 10.0 + i, "value": float(i)} for i in range(3)])
+    chunk = store._chunk("d", 0)
+    # A writer died after the value/lat/lng files but before the timestamps
+    for column, typecode in (("value", "f"), ("lat", "f"), ("lng", "f")):
+        with open(chunk.path(column), 'ab') as f:
+            array(typecode, [99.0]).tofile(f)
+    store.append_many([{"deviceId": "d", "timestamp": 20.0, "value": 3.0}])
+    assert [(r["timestamp"], r["value"]) for r in store.query("d", 0, 3600)] == \
+        [(10.0, 0.0), (11.0, 1.0), (12.0, 2.0), (20.0, 3.0)]
+    store.close()
+
+
+def test_late_readings_are_merged_in_order(tmp_path):
+    store = ReadingsStore(str(tmp_path), chunk_seconds=3600)
+    store.append_many([{"deviceId": "d", "timestamp": t, "value": t} for t in (10.0, 30.0)])
+    store.append_many([{"deviceId": "d", "timestamp": 20.0, "value": 20.0, "lat": 1.5, "lng": 2.5}])
+    readings = store.query("d", 0, 3600)
+    assert [r["timestamp"] for r in readings] == [10.0, 20.0, 30.0]
+    assert readings[1]["lat"] == 1.5 and "lat" not in readings[0]
+    store.close()
+
+
+# ========== OPEN CHUNKS ==========
+def test_mapped_chunks_are_bounded(tmp_path):
+    store = ReadingsStore(str(tmp_path), chunk_seconds=1, max_open_chunks=8)
+    store.append_many([{"deviceId": "d", "timestamp": i + 0.5, "value": 1.0} for i in range(300)])
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, len(os.listdir('/proc/self/fd')) + 64), hard))
+    try:
+        assert len(store.query("d", 0, 400)) == 300
+        assert sum(len(rows) for rows in store.scan("d")) == 300
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    assert len(store._chunks) == 8
+    store.close()
@@ -0,0 +1,52 @@
+import math
+
+from spatial import GridIndex, haversine_km
+from timeseries import ReadingsStore
+
+
+def reading(device, lat, lng, ts, value=1.0):
+    return {"deviceId": device, "timestamp": ts, "value": value, "lat": lat, "lng": lng}
+
+
+def test_haversine():
+    assert haversine_km(0, 0, 0, 0) == 0
+    # One degree of latitude is about 111.2 km
+    assert math.isclose(haversine_km(10, 20, 11, 20), 111.19, abs_tol=0.01)
+
+
+def test_within_box_newest_first():
+    index = GridIndex(cell_size=0.1)
+    index.add_many([reading("a", 1.05, 1.05, 10), reading("b", 1.15, 1.25, 30), reading("c", 2.0, 2.0, 20),
+                    {"deviceId": "no-location", "timestamp": 40, "value": 1.0}])
+    assert len(index) == 3
+    assert [r["deviceId"] for r in index.within(1.0, 1.0, 1.5, 1.5)] == ["b", "a"]
+    assert [r["deviceId"] for r in index.within(1.0, 1.0, 1.5, 1.5, since=20)] == ["b"]
+    assert [r["deviceId"] for r in index.within(-90, -180, 90, 180, limit=2)] == ["b", "c"]
+
+
+def test_nearest_matches_brute_force():
+    index = GridIndex(cell_size=0.05)
+    points = [reading(f"d{i}", 48.0 + (i * 37 % 101) / 100, 2.0 + (i * 53 % 97) / 100, i) for i in range(300)]
+    index.add_many(points)
+    found = index.nearest(48.5, 2.5, k=5)
+    expected = sorted(points, key=lambda r: haversine_km(48.5, 2.5, r["lat"], r["lng"]))[:5]
+    assert [r["deviceId"] for r in found] == [r["deviceId"] for r in expected]
+    assert found == sorted(found, key=lambda r: r["distance_km"])
+
+
+def test_prune_drops_old_readings():
+    index = GridIndex(cell_size=0.1)
+    index.add_many([reading("old", 1.0, 1.0, 10), reading("new", 1.0, 1.0, 50), reading("gone", 5.0, 5.0, 5)])
+    index.prune(before=20)
+    assert len(index) == 1
+    assert [r["deviceId"] for r in index.within(-90, -180, 90, 180)] == ["new"]
+
+
+def test_rebuild_from_readings_store(tmp_path):
+    store = ReadingsStore(str(tmp_path))
+    store.append_many([reading("a", 1.0, 1.0, 1000.0), reading("a", 1.0, 1.0, 9000.0),
+                       {"deviceId": "a", "timestamp": 9500.0, "value": 2.0}])
+    index = GridIndex(retention=5000)
+    index.rebuild(store, now=10000.0)
+    assert [r["timestamp"] for r in index.within(-90, -180, 90, 180)] == [9000.0]
+    store.close()
@@ -0,0 +1,166 @@
+import pytest
+
+from repository import DuplicateIdError, JsonRepository, SqliteRepository
+from storage import DocumentStore
+
+
+def open_repo(tmp_path, **options):
+    options.setdefault('flush_interval', 3600)
+    return JsonRepository(str(tmp_path / 'db.json'), **options).open({"users": [], "profiles": []})
+
+
+def crash(repo):
+    """Stop a repository the way a killed process would: the log is on disk, no snapshot is written"""
+    repo.store.log.sync()
+    repo.store._stopping = True
+    repo.store._wake.set()
+
+
+# ========== WAL REPLAY ==========
+def test_replay_restores_every_logged_write(tmp_path):
+    repo = open_repo(tmp_path)
+    users = repo.insert_many('users', [{"email": f"u{i}@x", "name": f"U{i}"} for i in range(4)])
+    repo.update('users', users[0]['id'], {"name": "renamed"})
+    repo.update_many('users', [(users[1]['id'], {"email": "moved@x"}), (999, {"name": "missing"})])
+    repo.delete('users', users[2]['id'])
+    repo.insert('profiles', {"userId": users[3]['id']})
+    crash(repo)
+
+    replayed = open_repo(tmp_path)
+    assert [u['id'] for u in replayed.all('users')] == [1, 2, 4]
+    assert replayed.find_one('users', 'id', 1)['name'] == "renamed"
+    assert replayed.find_one('users', 'email', 'moved@x')['id'] == 2
+    assert replayed.find_one('users', 'email', 'u1@x') is None
+    assert replayed.find_one('profiles', 'userId', 4)['id'] == 1
+    assert replayed.insert('users', {"email": "next@x"})['id'] == 5
+    replayed.close()
+
+
+def test_replay_drops_torn_last_line(tmp_path):
+    repo = open_repo(tmp_path)
+    repo.insert('users', {"email": "a@x"})
+    crash(repo)
+    with open(repo.store.log_path, 'ab') as f:
+        f.write(b'{"op": "insert", "collection": "us')
+
+    replayed = open_repo(tmp_path)
+    assert [u['email'] for u in replayed.all('users')] == ["a@x"]
+    replayed.close()
+
+
+def test_compaction_folds_log_into_snapshot(tmp_path):
+    repo = open_repo(tmp_path, compact_bytes=1)
+    for i in range(5):
+        repo.insert('users', {"email": f"u{i}@x"})
+    repo.delete('users', 5)
+    assert repo.store.flush()
+    assert repo.store.log.size() == 0
+    crash(repo)
+
+    reopened = open_repo(tmp_path)
+    assert [u['id'] for u in reopened.all('users')] == [1, 2, 3, 4]
+    # The counter is part of the snapshot, so a deleted id is not handed out again
+    assert reopened.insert('users', {"email": "new@x"})['id'] == 6
+    reopened.close()
+
+
+# ========== IDS ==========
+def test_client_ids_advance_the_counter(tmp_path):
+    repo = open_repo(tmp_path)
+    repo.insert('profiles', {"userId": 1})
+    repo.insert('profiles', {"userId": 2})
+    repo.insert('profiles', {"id": 3, "userId": 3})
+    assert repo.insert('profiles', {"userId": 4})['id'] == 4
+    crash(repo)
+
+    replayed = open_repo(tmp_path)
+    assert sorted(p['id'] for p in replayed.all('profiles')) == [1, 2, 3, 4]
+    assert replayed.insert('profiles', {"userId": 5})['id'] == 5
+    replayed.close()
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_duplicate_id_is_rejected(tmp_path, backend):
+    if backend == 'json':
+        repo = open_repo(tmp_path)
+    else:
+        repo = SqliteRepository(str(tmp_path / 'db.sqlite')).open()
+    repo.insert('profiles', {"id": 3, "userId": 1})
+    with pytest.raises(DuplicateIdError):
+        repo.insert('profiles', {"id": 3, "userId": 2})
+    assert [p['userId'] for p in repo.all('profiles')] == [1]
+    repo.close()
+
+
+# ========== READS ==========
+def test_reads_return_copies(tmp_path):
+    repo = open_repo(tmp_path)
+    user = repo.insert('users', {"email": "a@x", "name": "A"})
+    user['name'] = "changed by caller"
+    found = repo.find_one('users', 'email', 'a@x')
+    assert found['name'] == "A"
+    repo.update('users', user['id'], {"name": "B"})
+    assert found['name'] == "A"
+    assert repo.all('users')[0] is not repo.all('users')[0]
+    repo.close()
+
+
+# ========== PAGING ==========
+def test_page_follows_id_order_not_insertion_order(tmp_path):
+    repo = open_repo(tmp_path)
+    for record_id in (5, 1, 2):
+        repo.insert('profiles', {"id": record_id, "userId": record_id})
+    assert [p['id'] for p in repo.page('profiles', 10, after=1)] == [2, 5]
+    assert [p['id'] for p in repo.page('profiles', 2)] == [1, 2]
+    assert [p['id'] for p in repo.page('profiles', 2, after=2)] == [5]
+    repo.close()
+
+
+def test_page_order_survives_writes_and_replay(tmp_path):
+    repo = open_repo(tmp_path)
+    for record_id in (8, 3, 6, 1):
+        repo.insert('alerts', {"id": record_id, "type": "WARNING" if record_id % 2 else "DANGER"})
+    repo.delete('alerts', 6)
+    repo.insert('alerts', {"id": 4, "type": "DANGER"})
+    assert [a['id'] for a in repo.page('alerts', 10, after=2)] == [3, 4, 8]
+    assert [a['id'] for a in repo.page('alerts', 1, filters=[("type", "=", "DANGER")])] == [4]
+    crash(repo)
+
+    replayed = open_repo(tmp_path)
+    assert [a['id'] for a in replayed.page('alerts', 10)] == [1, 3, 4, 8]
+    assert [a['id'] for a in replayed.page('alerts', 10, after=8)] == []
+    replayed.close()
+
+
+def test_document_store_update_by_id(tmp_path):
+    store = DocumentStore(str(tmp_path / 'db.json'), flush_interval=3600).open({"users": []})
+    store.insert('users', {"id": 1, "email": "a@x"})
+    assert store.update('users', 1, {"email": "b@x"}) == {"id": 1, "email": "b@x"}
+    assert store.update('users', 2, {"email": "c@x"}) is None
+    assert store.find_one('users', 'email', 'a@x') is None
+    assert store.delete('users', 1) and not store.delete('users', 1)
+    store.close()
+
+
+# ========== INDEXES ==========
+def test_index_falls_back_to_next_record_sharing_a_value(tmp_path):
+    repo = open_repo(tmp_path)
+    first = repo.insert('profiles', {"userId": 7, "bio": "first"})
+    repo.insert('profiles', {"userId": 7, "bio": "second"})
+    repo.delete('profiles', first['id'])
+    assert repo.find_one('profiles', 'userId', 7)['bio'] == "second"
+    repo.update('profiles', first['id'] + 1, {"userId": 8})
+    assert repo.find_one('profiles', 'userId', 7) is None
+    assert repo.find_one('profiles', 'userId', 8)['bio'] == "second"
+    repo.close()
+
+
+def test_delete_with_ids_out_of_order(tmp_path):
+    repo = open_repo(tmp_path)
+    for record_id in (5, 1, 9, 2):
+        repo.insert('users', {"id": record_id, "email": f"u{record_id}@x"})
+    for record_id in (1, 9, 5):
+        assert repo.delete('users', record_id)
+    assert [u['id'] for u in repo.all('users')] == [2]
+    assert repo.find_one('users', 'email', 'u1@x') is None
+    repo.close()
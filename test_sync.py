@@ -0,0 +1,80 @@
+import os
+import tempfile
+
+import pytest
+
+from timeseries import ReadingsStore
+
+# database.py configures itself from the environment at import
+_workdir = tempfile.mkdtemp(prefix='radsafe-test-')
+for name, default in (('RADSAFE_DB_FILE', 'db.json'), ('RADSAFE_READINGS_DIR', 'readings'),
+                      ('RADSAFE_TOKEN_SECRET_FILE', 'token.key')):
+    os.environ.setdefault(name, os.path.join(_workdir, default))
+
+import database  # noqa: E402
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+START = 1700000000.0
+
+
+@pytest.fixture
+def worker(monkeypatch, tmp_path):
+    """database.py as one of several launcher.py workers"""
+    database.init_database()
+    database.readings_store.follow()
+    monkeypatch.setattr(database, '_worker_readings', [])
+    monkeypatch.setattr(database, '_alerts_lock_file', None)
+    monkeypatch.setattr(database, 'ALERTS_LOCK', str(tmp_path / 'alerts.lock'))
+    yield database.create_app().test_client()
+    if database._alerts_lock_file is not None:
+        database._alerts_lock_file.close()
+
+
+def post(client, device, values, start):
+    readings = [{"deviceId": device, "timestamp": (start + i) * 1000, "value": v} for i, v in enumerate(values)]
+    return client.post('/api/readings/batch', json=readings).get_json()['batches'][0]
+
+
+def device_alerts(device):
+    return [a for a in database.repo.all('alerts') if a['deviceId'] == device]
+
+
+def test_alerts_see_readings_from_every_worker(worker):
+    # Another worker process appends to the same readings directory
+    other = ReadingsStore(database.READINGS_DIR, chunk_seconds=database.READINGS_CHUNK_SECONDS)
+    other.append_many([{"deviceId": "sync-a", "timestamp": START + i, "value": 0.3} for i in range(6)])
+    other.close()
+    # Neither half reaches sustainSeconds on its own
+    assert post(worker, 'sync-a', [0.3] * 6, START + 6)['alerts'] == 0
+    assert device_alerts('sync-a') == []
+
+    database.sync_readings()
+    alerts = device_alerts('sync-a')
+    assert [a['type'] for a in alerts] == ['WARNING']
+    database.sync_readings()
+    assert len(device_alerts('sync-a')) == 1
+
+
+def test_thresholds_written_by_another_worker_apply(worker):
+    database.sync_readings()
+    database.repo.insert('settings', {"userId": 42, "deviceId": "sync-b", "warning": 0.05, "sustainSeconds": 0})
+    post(worker, 'sync-b', [0.1], START)
+    database.sync_readings()
+    assert [a['userId'] for a in device_alerts('sync-b')] == [42]
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs flock()")
+def test_only_the_lock_holder_evaluates(worker):
+    with open(database.ALERTS_LOCK, 'a') as held:
+        fcntl.flock(held.fileno(), fcntl.LOCK_EX)
+        post(worker, 'sync-c', [0.9] * 12, START)
+        database.sync_readings()
+        assert device_alerts('sync-c') == []
+    # The holder exited: the next sync takes over
+    post(worker, 'sync-c', [0.9] * 12, START + 12)
+    database.sync_readings()
+    assert len(device_alerts('sync-c')) == 1
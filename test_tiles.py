@@ -0,0 +1,82 @@
+import struct
+
+import pytest
+
+import tiles
+from spatial import GridIndex
+from tiles import TileCache, bin_tile, encode_bin, tile_bounds, tile_xy, valid_tile
+
+
+def reading(lat, lng, value, ts=100.0):
+    return {"deviceId": "d", "timestamp": ts, "value": value, "lat": lat, "lng": lng}
+
+
+class CountingIndex(GridIndex):
+    renders = 0
+
+    def points(self, *args, **kwargs):
+        self.renders += 1
+        return super().points(*args, **kwargs)
+
+
+def test_tile_math():
+    assert tile_xy(0, 0, 1) == (1.0, 1.0)
+    south, west, north, east = tile_bounds(1, 0, 0)
+    assert (west, east, south) == (-180.0, 0.0, 0.0)
+    assert north == pytest.approx(tiles.MAX_LAT)
+    assert valid_tile(3, 7, 7) and not valid_tile(3, 8, 0) and not valid_tile(19, 0, 0)
+
+
+@pytest.mark.parametrize('vectorized', [True, False])
+def test_bin_tile(monkeypatch, vectorized):
+    if not vectorized:
+        monkeypatch.setattr(tiles, 'numpy', None)
+    elif tiles.numpy is None:
+        pytest.skip("numpy is not installed")
+    # Tile 1/0/0 is the north-west quarter of the world
+    points = [(80.0, -179.0, 0.1, 0, "a"), (80.0, -179.0, 0.3, 0, "b"), (1.0, -1.0, 0.6, 0, "c")]
+    count, mean, peak = bin_tile(points, 1, 0, 0, bins=4)
+    assert list(count) == [2] + [0] * 14 + [1]
+    assert mean[0] == pytest.approx(0.2) and peak[0] == pytest.approx(0.3)
+    assert mean[15] == pytest.approx(0.6) and peak[15] == pytest.approx(0.6)
+    assert mean[5] == 0.0 and peak[5] == 0.0
+
+
+def test_encode_bin_layout():
+    count, mean, peak = bin_tile([(80.0, -179.0, 0.5, 0, "a")], 1, 0, 0, bins=2)
+    payload = encode_bin(count, mean, peak, bins=2)
+    assert payload[:8] == struct.pack('<4sHH', b'RADT', 2, 0)
+    assert struct.unpack('<4f4f4I', payload[8:]) == (0.5, 0, 0, 0, 0.5, 0, 0, 0, 1, 0, 0, 0)
+
+
+def test_cache_serves_until_readings_change_the_tile():
+    index = CountingIndex(cell_size=0.5)
+    index.add_many([reading(10.0, 10.0, 0.1)])
+    cache = TileCache(index)
+    png = cache.get(2, 2, 1)
+    assert png.startswith(b'\x89PNG') and cache.get(2, 2, 1) is png
+    assert index.renders == 1
+
+    # Readings elsewhere leave the tile cached
+    far = [reading(-40.0, -100.0, 0.9)]
+    index.add_many(far)
+    cache.invalidate(far)
+    cache.get(2, 2, 1)
+    assert index.renders == 1
+
+    near = [reading(10.5, 10.5, 0.9)]
+    index.add_many(near)
+    cache.invalidate(near)
+    assert cache.get(2, 2, 1) != png
+    assert index.renders == 2
+
+
+def test_prune_invalidates_only_tiles_that_lost_readings():
+    index = CountingIndex(cell_size=0.5)
+    index.add_many([reading(10.0, 10.0, 0.1, ts=10.0), reading(-40.0, -100.0, 0.9, ts=500.0)])
+    cache = TileCache(index)
+    pruned_tile, kept_tile = cache.get(2, 2, 1, fmt='bin'), cache.get(2, 0, 2, fmt='bin')
+    cache.invalidate(index.prune(before=100.0))
+    assert cache.get(2, 0, 2, fmt='bin') is kept_tile
+    assert cache.get(2, 2, 1, fmt='bin') != pruned_tile
+    assert index.renders == 3
@@ -0,0 +1,226 @@
+import math
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:  # pure-Python binning
+    numpy = None
+
+# Web Mercator heatmap tiles binned from the spatial index
+
+TILE_SIZE = 256                 # PNG tiles are TILE_SIZE x TILE_SIZE pixels
+BINS = 32                       # each tile is a BINS x BINS grid of cells
+MAX_ZOOM = 18
+MAX_LAT = 85.05112878
+FORMATS = {'png': 'image/png', 'bin': 'application/octet-stream'}
+
+# Same bands as RadiationStatus in flask_app (μSv/h): SAFE < 0.2 <= WARNING < 0.5 <= DANGER
+SAFE_LIMIT = 0.2
+WARNING_LIMIT = 0.5
+SAFE_RGB = (0x10, 0xb9, 0x81)
+WARNING_RGB = (0xf5, 0x9e, 0x0b)
+DANGER_RGB = (0xef, 0x44, 0x44)
+
+
+# ========== TILE MATH ==========
+def tile_xy(lat, lng, z):
+    """Fractional tile coordinates of a point at zoom z"""
+    n = 1 << z
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    x = (lng + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    return x, y
+
+
+def tile_bounds(z, x, y):
+    """(south, west, north, east) of a tile in degrees"""
+    n = 1 << z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)
+
+
+# ========== BINNING ==========
+def bin_tile(points, z, x, y, bins=BINS):
+    """Per-cell (count, mean, max) arrays for the points of one tile, row-major from the north-west corner"""
+    if numpy is not None and points:
+        return _bin_tile_numpy(points, z, x, y, bins)
+    count = array('I', bytes(4 * bins * bins))
+    total = array('d', bytes(8 * bins * bins))
+    peak = array('d', [-math.inf]) * (bins * bins)
+    for lat, lng, value, _, _ in points:
+        fx, fy = tile_xy(lat, lng, z)
+        col = min(bins - 1, max(0, int((fx - x) * bins)))
+        row = min(bins - 1, max(0, int((fy - y) * bins)))
+        i = row * bins + col
+        count[i] += 1
+        total[i] += value
+        if value > peak[i]:
+            peak[i] = value
+    mean = array('f', (total[i] / count[i] if count[i] else 0.0 for i in range(bins * bins)))
+    peak = array('f', (v if v != -math.inf else 0.0 for v in peak))
+    return count, mean, peak
+
+
+def _bin_tile_numpy(points, z, x, y, bins):
+    # Same projection and cell arithmetic as bin_tile, one vector operation per step
+    lat, lng, value = (numpy.array(column, dtype=numpy.float64) for column in list(zip(*points))[:3])
+    n = 1 << z
+    fx = (lng + 180.0) / 360.0 * n
+    fy = (1.0 - numpy.arcsinh(numpy.tan(numpy.radians(numpy.clip(lat, -MAX_LAT, MAX_LAT)))) / math.pi) / 2.0 * n
+    col = numpy.clip(((fx - x) * bins).astype(numpy.int64), 0, bins - 1)
+    row = numpy.clip(((fy - y) * bins).astype(numpy.int64), 0, bins - 1)
+    cell = row * bins + col
+    count = numpy.bincount(cell, minlength=bins * bins)
+    total = numpy.bincount(cell, weights=value, minlength=bins * bins)
+    peak = numpy.full(bins * bins, -numpy.inf)
+    numpy.maximum.at(peak, cell, value)
+    filled = count > 0
+    mean = numpy.divide(total, count, out=numpy.zeros(bins * bins), where=filled)
+    peak[~filled] = 0.0
+    return (array('I', count.astype(numpy.uint32).tobytes()), array('f', mean.astype(numpy.float32).tobytes()),
+            array('f', peak.astype(numpy.float32).tobytes()))
+
+
+def encode_bin(count, mean, peak, bins=BINS):
+    """Little-endian: b'RADT', uint16 bins, uint16 0, then float32 mean[], float32 max[], uint32 count[]"""
+    body = [array(t, a) for t, a in (('f', mean), ('f', peak), ('I', count))]
+    if sys.byteorder == 'big':
+        for a in body:
+            a.byteswap()
+    return struct.pack('<4sHH', b'RADT', bins, 0) + b''.join(a.tobytes() for a in body)
+
+
+def color(value):
+    if value < SAFE_LIMIT:
+        return SAFE_RGB
+    if value < WARNING_LIMIT:
+        return WARNING_RGB
+    return DANGER_RGB
+
+
+def encode_png(count, values, bins=BINS, size=TILE_SIZE):
+    """RGBA PNG coloured by radiation band; empty cells are transparent"""
+    scale = size // bins
+    rows = []
+    for r in range(bins):
+        pixels = bytearray()
+        for c in range(bins):
+            i = r * bins + c
+            if count[i]:
+                # Opacity grows with the number of readings behind the cell
+                alpha = min(255, 120 + 30 * int(math.log2(count[i])))
+                pixels += bytes((*color(values[i]), alpha)) * scale
+            else:
+                pixels += b'\0\0\0\0' * scale
+        rows.append((b'\0' + bytes(pixels)) * scale)
+    return png_bytes(size, size, b''.join(rows))
+
+
+def png_bytes(width, height, raw):
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 6)) + chunk(b'IEND', b'')
+
+
+# ========== CACHE ==========
+class TileCache:
+    """LRU of rendered tiles keyed by (z, x, y, format, stat) and the tile's data version
+
+    invalidate() bumps the version of every cached or in-progress tile that new
+    readings fall in, so a tile rendered while readings arrive is never kept as fresh.
+    """
+
+    def __init__(self, index, max_entries=2048):
+        self.index = index
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # (z, x, y, fmt, stat) -> (version, payload)
+        self._versions = {}             # (z, x, y) -> version
+        self._tiles = {}                # (z, x, y) -> cached entries + renders in progress
+        self._zooms = {}                # zoom -> cached entries + renders in progress
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, z, x, y, fmt='png', stat='mean'):
+        """Rendered tile bytes, from the cache when its data hasn't changed"""
+        key = (z, x, y, fmt, stat)
+        tile = (z, x, y)
+        with self._lock:
+            version = self._versions.get(tile, 0)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+            self._retain(tile)
+
+        try:
+            south, west, north, east = tile_bounds(z, x, y)
+            count, mean, peak = bin_tile(self.index.points(south, west, north, east), z, x, y)
+            if fmt == 'bin':
+                payload = encode_bin(count, mean, peak)
+            else:
+                payload = encode_png(count, peak if stat == 'max' else mean)
+        except BaseException:
+            with self._lock:
+                self._release(tile)
+            raise
+
+        with self._lock:
+            if self._versions.get(tile, 0) == version:
+                if key in self._entries:
+                    self._release(tile)
+                self._entries[key] = (version, payload)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    (ez, ex, ey, _, _), _ = self._entries.popitem(last=False)
+                    self._release((ez, ex, ey))
+            else:
+                self._release(tile)
+        return payload
+
+    def invalidate(self, readings):
+        """Mark the cached tiles that validated readings fall in as stale"""
+        with self._lock:
+            if not self._zooms:
+                return
+            zooms = list(self._zooms)
+            touched = set()
+            for reading in readings:
+                lat = reading.get("lat")
+                if lat is None:
+                    continue
+                for z in zooms:
+                    fx, fy = tile_xy(lat, reading["lng"], z)
+                    last = (1 << z) - 1
+                    touched.add((z, min(last, int(fx)), min(last, int(fy))))
+            for tile in touched:
+                if tile in self._tiles:
+                    self._versions[tile] = self._versions.get(tile, 0) + 1
+
+    def _retain(self, tile):
+        self._tiles[tile] = self._tiles.get(tile, 0) + 1
+        self._zooms[tile[0]] = self._zooms.get(tile[0], 0) + 1
+
+    def _release(self, tile):
+        self._tiles[tile] -= 1
+        if not self._tiles[tile]:
+            del self._tiles[tile]
+            self._versions.pop(tile, None)
+        self._zooms[tile[0]] -= 1
+        if not self._zooms[tile[0]]:
+            del self._zooms[tile[0]]
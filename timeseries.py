@@ -0,0 +1,326 @@
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+# One file per column per chunk; timestamps are epoch milliseconds
+COLUMNS = (("ts", "q"), ("value", "f"), ("lat", "f"), ("lng", "f"))
+NAN = float('nan')
+MIN_TS, MAX_TS = -2 ** 63, 2 ** 63 - 1
+
+
+class Chunk:
+    """One device's readings for one time partition, stored column-per-file and sorted by timestamp"""
+
+    def __init__(self, prefix, start):
+        self.prefix = prefix
+        self.start = start
+        self._maps = {}
+        self._stat = None
+
+    def path(self, column):
+        return f"{self.prefix}.{column}"
+
+    def exists(self):
+        return os.path.exists(self.path("ts"))
+
+    # ========== READS ==========
+    def _views(self):
+        """Memory-mapped column views, re-mapped when another writer has grown or replaced the files"""
+        try:
+            st = os.stat(self.path("ts"))
+        except FileNotFoundError:
+            return None
+        stat = (st.st_ino, st.st_size)
+        if stat != self._stat:
+            self.release()
+            for column, typecode in COLUMNS:
+                with open(self.path(column), 'rb') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if size == 0:
+                        self.release()
+                        return None
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                usable = size - size % array(typecode).itemsize
+                self._maps[column] = (mapped, memoryview(mapped)[:usable].cast(typecode))
+            self._stat = stat
+        return {column: view for column, (_, view) in self._maps.items()}
+
+    def last_ts(self):
+        views = self._views()
+        if not views or not len(views["ts"]):
+            return None
+        return views["ts"][len(views["ts"]) - 1]
+
+    def rows(self):
+        """Number of complete rows on disk"""
+        views = self._views()
+        return min(len(view) for view in views.values()) if views else 0
+
+    def rows_between(self, lo, hi):
+        """Columns of rows lo..hi (by position) as lists"""
+        views = self._views()
+        if not views:
+            return [], [], [], []
+        return [views[column][lo:hi].tolist() for column, _ in COLUMNS]
+
+    def slice(self, start_ms, end_ms, limit):
+        """Readings with start_ms <= ts < end_ms as lists, found by binary search"""
+        views = self._views()
+        if not views:
+            return [], [], [], []
+        # A writer may have appended to some columns but not all of them yet
+        count = min(len(view) for view in views.values())
+        ts = views["ts"][:count]
+        lo = bisect_left(ts, start_ms)
+        hi = min(bisect_left(ts, end_ms, lo), lo + limit)
+        result = [views[column][lo:hi].tolist() for column, _ in COLUMNS]
+        ts.release()
+        return result
+
+    def release(self):
+        for mapped, view in self._maps.values():
+            view.release()
+            mapped.close()
+        self._maps = {}
+        self._stat = None
+
+    # ========== WRITES ==========
+    def append(self, columns):
+        """Append already-sorted columns; the timestamp file is written last"""
+        self.repair()
+        for column, typecode in reversed(COLUMNS):
+            with open(self.path(column), 'ab') as f:
+                array(typecode, columns[column]).tofile(f)
+
+    def repair(self):
+        """Cut every column back to the rows all of them hold
+
+        A writer interrupted between column files leaves a longer tail in the
+        columns it got to; rows appended after that would be paired with it.
+        """
+        sizes = {}
+        for column, typecode in COLUMNS:
+            try:
+                sizes[column] = os.path.getsize(self.path(column))
+            except FileNotFoundError:
+                sizes[column] = 0
+        rows = min(sizes[column] // array(typecode).itemsize for column, typecode in COLUMNS)
+        for column, typecode in COLUMNS:
+            size = rows * array(typecode).itemsize
+            if sizes[column] != size:
+                self.release()
+                os.truncate(self.path(column), size)
+
+    def rewrite(self, columns):
+        """Replace the chunk with merged, re-sorted columns via temp files and renames"""
+        self.release()
+        for column, typecode in reversed(COLUMNS):
+            tmp_path = self.path(column) + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                array(typecode, columns[column]).tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path(column))
+
+
+class ReadingsStore:
+    """Per-device columnar readings partitioned into time chunks of memory-mapped files
+
+    A sample costs 20 bytes (int64 timestamp, float32 value/lat/lng) instead of a
+    ~500 byte dict, and range queries binary-search only the chunks they overlap.
+    Each mapped chunk holds one file descriptor per column, so only the
+    `max_open_chunks` most recently used chunks stay mapped.
+    """
+
+    def __init__(self, directory, chunk_seconds=86400, max_open_chunks=64):
+        self.directory = directory
+        self.chunk_ms = int(chunk_seconds * 1000)
+        self.max_open_chunks = max(1, max_open_chunks)
+        self.lock = threading.RLock()
+        self._chunks = OrderedDict()   # (device, chunk start) -> Chunk, least recently used first
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, ".lock")
+        self._seen = None     # (device, chunk start) -> rows already handed out, once follow() was called
+        self._pending = []    # other processes' rows found while appending, for the next changes()
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        # Serializes writers (and readers against rewrites) across worker processes
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _device_dir(self, device_id):
+        return os.path.join(self.directory, device_id.encode('utf-8').hex())
+
+    def _chunk(self, device_id, start):
+        key = (device_id, start)
+        chunk = self._chunks.pop(key, None)
+        if chunk is None:
+            chunk = Chunk(os.path.join(self._device_dir(device_id), str(start)), start)
+        self._chunks[key] = chunk
+        while len(self._chunks) > self.max_open_chunks:
+            _, evicted = self._chunks.popitem(last=False)
+            evicted.release()
+        return chunk
+
+    def devices(self):
+        with self.lock:
+            names = os.listdir(self.directory)
+        devices = []
+        for name in names:
+            try:
+                devices.append(bytes.fromhex(name).decode('utf-8'))
+            except ValueError:
+                continue
+        return sorted(devices)
+
+    def chunk_starts(self, device_id):
+        try:
+            names = os.listdir(self._device_dir(device_id))
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-3]) for name in names if name.endswith(".ts"))
+
+    # ========== WRITES ==========
+    def append_many(self, readings):
+        """Store validated readings (`timestamp` in epoch seconds); returns the number stored"""
+        groups = {}
+        for reading in readings:
+            ts = int(reading["timestamp"] * 1000)
+            key = (reading["deviceId"], ts - ts % self.chunk_ms)
+            groups.setdefault(key, []).append((ts, reading["value"], reading.get("lat", NAN), reading.get("lng", NAN)))
+
+        with self.lock, self._file_lock(exclusive=True):
+            for (device_id, start), rows in groups.items():
+                os.makedirs(self._device_dir(device_id), exist_ok=True)
+                rows.sort(key=lambda row: row[0])
+                chunk = self._chunk(device_id, start)
+                if self._seen is not None:
+                    seen = self._seen.get((device_id, start), 0)
+                    before = chunk.rows()
+                    if before > seen:
+                        self._pending.extend(self._readings(device_id, chunk.rows_between(seen, before)))
+                    self._seen[(device_id, start)] = before + len(rows)
+                last_ts = chunk.last_ts()
+                if last_ts is None or rows[0][0] >= last_ts:
+                    chunk.append(self._to_columns(rows))
+                else:
+                    # Late samples: merge with what is on disk so the chunk stays sorted
+                    existing = chunk.slice(MIN_TS, MAX_TS, MAX_TS)
+                    merged = list(zip(*existing)) + rows
+                    merged.sort(key=lambda row: row[0])
+                    chunk.rewrite(self._to_columns(merged))
+        return len(readings)
+
+    @staticmethod
+    def _readings(device_id, columns):
+        readings = []
+        for t, value, lat, lng in zip(*columns):
+            reading = {"deviceId": device_id, "timestamp": t / 1000.0, "value": value}
+            if lat == lat and lng == lng:
+                reading["lat"] = lat
+                reading["lng"] = lng
+            readings.append(reading)
+        return readings
+
+    @staticmethod
+    def _to_columns(rows):
+        ts, values, lats, lngs = zip(*rows)
+        return {"ts": ts, "value": values, "lat": lats, "lng": lngs}
+
+    # ========== READS ==========
+    def query(self, device_id, start, end, limit=10000, after=None):
+        """Readings for one device with start <= timestamp < end (epoch seconds), oldest first
+
+        `after` is a paging cursor (epoch milliseconds, n): the readings before that
+        millisecond and the first n at it were returned already. Several readings
+        can share a millisecond, so the timestamp alone cannot say where a page ended.
+        """
+        start_ms, end_ms = int(start * 1000), int(end * 1000)
+        skip = 0
+        if after is not None and after[0] >= start_ms:
+            start_ms, skip = after
+        results = []
+        with self.lock, self._file_lock(exclusive=False):
+            for chunk_start in self.chunk_starts(device_id):
+                if chunk_start + self.chunk_ms <= start_ms or chunk_start >= end_ms:
+                    continue
+                ts, values, lats, lngs = self._chunk(device_id, chunk_start).slice(
+                    start_ms, end_ms, limit - len(results) + skip)
+                for t, value, lat, lng in zip(ts, values, lats, lngs):
+                    if skip:
+                        if t == start_ms:
+                            skip -= 1
+                            continue
+                        skip = 0
+                    reading = {"timestamp": t / 1000.0, "value": value}
+                    if lat == lat and lng == lng:  # NaN marks a reading without a location
+                        reading["lat"] = lat
+                        reading["lng"] = lng
+                    results.append(reading)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def scan(self, device_id, start=None):
+        """Yield (timestamp, value, lat, lng) rows for a device, one list per chunk, oldest first
+
+        Chunks ending before `start` (epoch seconds) are skipped.
+        """
+        start_ms = MIN_TS if start is None else int(start * 1000)
+        for chunk_start in self.chunk_starts(device_id):
+            if chunk_start + self.chunk_ms <= start_ms:
+                continue
+            with self.lock, self._file_lock(exclusive=False):
+                ts, values, lats, lngs = self._chunk(device_id, chunk_start).slice(MIN_TS, MAX_TS, MAX_TS)
+            yield [(t / 1000.0, value, lat, lng) for t, value, lat, lng in zip(ts, values, lats, lngs)]
+
+    # ========== OTHER WRITERS ==========
+    def follow(self):
+        """Track rows other processes append from now on; everything already on disk counts as seen"""
+        with self.lock, self._file_lock(exclusive=False):
+            self._seen = {(device, start): self._chunk(device, start).rows()
+                          for device in self.devices() for start in self.chunk_starts(device)}
+            self._pending = []
+
+    def changes(self):
+        """Readings appended by other processes since the last call (or follow()), unordered
+
+        A late sample merged into the middle of a chunk shows up as that chunk's new
+        last row, so for such chunks the rows returned are approximate.
+        """
+        if self._seen is None:
+            return []
+        with self.lock, self._file_lock(exclusive=False):
+            found, self._pending = self._pending, []
+            for device in self.devices():
+                for start in self.chunk_starts(device):
+                    chunk = self._chunk(device, start)
+                    seen = self._seen.get((device, start), 0)
+                    rows = chunk.rows()
+                    if rows > seen:
+                        found.extend(self._readings(device, chunk.rows_between(seen, rows)))
+                        self._seen[(device, start)] = rows
+        return found
+
+    def close(self):
+        with self.lock:
+            for chunk in self._chunks.values():
+                chunk.release()
+            self._chunks.clear()
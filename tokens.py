@@ -0,0 +1,93 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from fastjson import dumps, loads
+
+# Stateless access tokens: base64url(JSON claims) + "." + base64url(HMAC-SHA256 of the claims).
+# Checking one needs the key and the clock, never the user store.
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def load_secret(path):
+    """Signing key kept in `path`, created on first use; every worker process reads the same one"""
+    try:
+        with open(path, 'rb') as f:
+            secret = f.read().strip()
+        if secret:
+            return secret
+    except FileNotFoundError:
+        pass
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(secrets.token_hex(32).encode('ascii'))
+    try:
+        # link() fails if another process got there first; its key wins
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+    with open(path, 'rb') as f:
+        return f.read().strip()
+
+
+class TokenSigner:
+    """Issues and checks signed, expiring tokens; recently verified tokens are kept in an LRU"""
+
+    def __init__(self, secret, ttl=3600, cache_entries=10000):
+        self.secret = secret if isinstance(secret, bytes) else secret.encode('utf-8')
+        self.ttl = ttl
+        self.cache_entries = cache_entries
+        self._verified = OrderedDict()   # token -> claims
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.secret, payload.encode('utf-8'), hashlib.sha256).digest())
+
+    def issue(self, user):
+        now = int(time.time())
+        claims = {"sub": user['id'], "role": user.get('role', 'user'), "iat": now, "exp": now + self.ttl}
+        payload = _b64encode(dumps(claims))
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token):
+        """The token's claims, or None if it is malformed, forged or expired"""
+        with self._lock:
+            claims = self._verified.get(token)
+            if claims is not None:
+                self._verified.move_to_end(token)
+        if claims is not None:
+            self.hits += 1
+            return claims if claims['exp'] > time.time() else None
+
+        self.misses += 1
+        payload, sep, signature = token.partition('.')
+        if not sep or not hmac.compare_digest(signature.encode('utf-8'), self._sign(payload).encode('utf-8')):
+            return None
+        try:
+            claims = loads(_b64decode(payload))
+        except ValueError:
+            return None
+        if not isinstance(claims, dict) or not isinstance(claims.get('exp'), int) or claims['exp'] <= time.time():
+            return None
+        with self._lock:
+            self._verified[token] = claims
+            while len(self._verified) > self.cache_entries:
+                self._verified.popitem(last=False)
+        return claims